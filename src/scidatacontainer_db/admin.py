@@ -2,8 +2,8 @@ from django.contrib import admin
 from guardian.admin import GuardedModelAdmin
 
 # Register your models here.
-from scidatacontainer_db.models import ContainerType, DataSet, File, Keyword,\
-                                       Software
+from scidatacontainer_db.models import ContainerType, DataSet, File,\
+                                       IngestJob, Keyword, Software
 
 
 class ContainerTypeAdmin(admin.ModelAdmin):
@@ -18,6 +18,10 @@ class FileAdmin(admin.ModelAdmin):
     pass
 
 
+class IngestJobAdmin(admin.ModelAdmin):
+    pass
+
+
 class KeywordAdmin(admin.ModelAdmin):
     pass
 
@@ -29,5 +33,6 @@ class SoftwareAdmin(admin.ModelAdmin):
 admin.site.register(ContainerType, ContainerTypeAdmin)
 admin.site.register(DataSet, DataSetAdmin)
 admin.site.register(File, FileAdmin)
+admin.site.register(IngestJob, IngestJobAdmin)
 admin.site.register(Keyword, KeywordAdmin)
 admin.site.register(Software, SoftwareAdmin)
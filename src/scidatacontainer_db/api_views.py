@@ -1,21 +1,35 @@
+from django.conf import settings
 from django.contrib.auth.models import User, Group
-from django.http import FileResponse
 from django.shortcuts import get_object_or_404
+from django.utils import timezone
+
+import json
+import os
+import tarfile
+import uuid
 
 from rest_framework import mixins
 from rest_framework.decorators import action
-from rest_framework.viewsets import ReadOnlyModelViewSet
+from rest_framework.reverse import reverse
+from rest_framework.viewsets import GenericViewSet, ReadOnlyModelViewSet
 
 from guardian.shortcuts import get_objects_for_user, remove_perm, assign_perm
 
 from django_filters.rest_framework import DjangoFilterBackend
 from django_filters.rest_framework import FilterSet
 
-from .models import ContainerType, DataSet, File, Keyword, Software
-from .parsers import parse_container_file
+from .downloads import container_response
+from .ingest import enqueue
+from .models import ChunkedUpload, ContainerType, DataSet, File, IngestJob,\
+                    Keyword, Software
+from .parsers import parse_container_file, parse_container_files
 from .utils import ensure_read_permission, ensure_owner, MetaDBError,\
                    APIResponse as Response
 from .test_utils import download_test_dataset, api_detail_test_data
+from .storage import insert_chunk, keep_running_digest, running_digest,\
+                     staging_dir, staging_root, write_chunk
+from .uploadhandlers import StagedFile, StagingUploadHandler,\
+                            staged_tar_members
 from . import serializers
 
 
@@ -45,6 +59,100 @@ class DataSetFilter(FilterSet):
                  }
 
 
+def _ingest_async(request) -> bool:
+    """
+    Return True if an upload should be queued for the ingest worker. This is
+    the case if SCIDATACONTAINER_ASYNC_INGEST is set or the query parameter
+    async is true.
+    """
+    value = request.query_params.get("async", None)
+    if value is None:
+        return getattr(settings, "SCIDATACONTAINER_ASYNC_INGEST", False)
+    return value.lower() in ["1", "true", "yes"]
+
+
+def _supplied_metadata(request) -> dict:
+    """
+    Return the content.json, meta.json and the list of member names a client
+    sent as the optional JSON fields "content", "meta" and "items" next to
+    the uploaded container.
+    """
+    supplied = {}
+    for key in ["content", "meta", "items"]:
+        value = request.data.get(key, None)
+        if value is None:
+            continue
+        if isinstance(value, str):
+            try:
+                value = json.loads(value)
+            except ValueError:
+                raise MetaDBError({"error_code": 400,
+                                   "msg": "The field " + key + " is no " +
+                                          "valid JSON."})
+        expected = list if key == "items" else dict
+        if not isinstance(value, expected):
+            raise MetaDBError({"error_code": 400,
+                               "msg": "The field " + key + " has the " +
+                                      "wrong type."})
+        supplied[key] = value
+    return supplied
+
+
+def _ingest(request, upload):
+    """
+    Parse an uploaded container or queue it for the ingest worker and return
+    the response of the upload request. If the client supplied content.json
+    and meta.json, they are registered without reading them from the
+    container. Queued uploads are always parsed completely, so supplied
+    metadata is rejected for them.
+    """
+    try:
+        supplied = _supplied_metadata(request)
+    except MetaDBError as e:
+        return Response(e.args[0]["msg"], status=e.args[0]["error_code"],
+                        reason=e.args[0]["msg"])
+    if _ingest_async(request):
+        if supplied:
+            msg = "Supplied metadata is not supported for queued uploads."
+            return Response(msg, status=400, reason=msg)
+        job = enqueue(upload, request.user)
+        url = reverse("scidatacontainer_db:api:ingestjob-detail",
+                      args=[str(job.id)], request=request)
+        return Response({"id": str(job.id), "url": url}, status=202,
+                        headers={"Location": url})
+    try:
+        parse_container_file(upload, request.user, **supplied)
+    except MetaDBError as e:
+        obj = e.args[0].get("object", False)
+        if obj:
+            s = serializers.DataSetSerializer(obj,
+                                              context={'request': request})
+            r = Response(s.data,
+                         status=e.args[0]["error_code"],
+                         reason=e.args[0]["msg"])
+
+            if e.args[0].get("delete_replaced", False):
+                if obj.replaces:
+                    obj.replaces.delete()
+
+            if e.args[0].get("delete", False):
+                obj.delete()
+
+            return r
+
+        return Response(e.args[0]["msg"],
+                        status=e.args[0]["error_code"],
+                        reason=e.args[0]["msg"])
+
+    return Response(status=201)
+
+
+# Maximum number of UUIDs and hashes per existence probe.
+PROBE_MAX_ITEMS = 50000
+# Number of values per lookup query of an existence probe.
+PROBE_CHUNK_SIZE = 500
+
+
 class DataSetViewSet(ReadOnlyModelViewSet, mixins.CreateModelMixin):
     serializer_class = serializers.DataSetSerializer
     filter_backends = [DjangoFilterBackend]
@@ -52,42 +160,140 @@ class DataSetViewSet(ReadOnlyModelViewSet, mixins.CreateModelMixin):
     filterset_fields = ["title", "id"]
     queryset = DataSet.objects.all()
 
-    def get_queryset(self):
+    def _readable_datasets(self):
         user = self.request.user
-        q = get_objects_for_user(user, "view_dataset", DataSet) |\
+        return get_objects_for_user(user, "view_dataset", DataSet) |\
             user.owner_of.all()
-        return q.filter(valid=True)
 
-    def create(self, request):
-        if len(request.FILES) > 0:
-            try:
-                parse_container_file(request.FILES["uploadfile"], request.user)
-            except MetaDBError as e:
-                obj = e.args[0].get("object", False)
-                if obj:
-                    s = self.serializer_class(obj,
-                                              context={'request': request})
-                    r = Response(s.data,
-                                 status=e.args[0]["error_code"],
-                                 reason=e.args[0]["msg"])
-
-                    if e.args[0].get("delete_replaced", False):
-                        if obj.replaces:
-                            obj.replaces.delete()
+    def get_queryset(self):
+        return self._readable_datasets().filter(valid=True)
 
-                    if e.args[0].get("delete", False):
-                        obj.delete()
+    def initialize_request(self, request, *args, **kwargs):
+        # stream uploads into the staging directory. This has to happen
+        # before the request body is parsed.
+        request.upload_handlers.insert(0, StagingUploadHandler(request))
+        return super().initialize_request(request, *args, **kwargs)
 
-                    return r
+    def create(self, request):
+        if len(request.FILES) > 0:
+            return _ingest(request, request.FILES["uploadfile"])
+        return Response("", status=400,
+                        reason="No data file found in your request!")
 
-                return Response(e.args[0]["msg"],
-                                status=e.args[0]["error_code"],
-                                reason=e.args[0]["msg"])
+    @action(methods=["post"], detail=False, url_path="batch",
+            url_name="batch")
+    def batch(self, request):
+        """
+        Upload several containers with one request. The containers are sent
+        as multiple "uploadfile" fields and/or as tar archives in "tarfile"
+        fields. The response contains one result per container with its
+        name, the status code and message a single upload would have
+        returned and the UUID of the affected dataset.
+        """
+        uploads = request.FILES.getlist("uploadfile")
+        for archive in request.FILES.getlist("tarfile"):
+            try:
+                uploads += staged_tar_members(archive)
+            except tarfile.TarError as e:
+                return Response("", status=400,
+                                reason="Invalid tar archive '" +
+                                archive.name + "': " + str(e))
+        if len(uploads) == 0:
+            return Response("", status=400,
+                            reason="No data file found in your request!")
 
+        try:
+            parsed = parse_container_files(uploads, request.user)
+        finally:
+            # staged tar members are not closed with the request
+            for upload in uploads:
+                upload.close()
+
+        results = []
+        for upload, result in zip(uploads, parsed):
+            if isinstance(result, MetaDBError):
+                info = result.args[0]
+                obj = info.get("object", None)
+                entry = {"name": upload.name,
+                         "status": info["error_code"],
+                         "msg": info["msg"],
+                         "id": str(obj.id) if obj else None}
+                if obj and info.get("delete_replaced", False):
+                    if obj.replaces:
+                        obj.replaces.delete()
+                if obj and info.get("delete", False):
+                    obj.delete()
+            else:
+                entry = {"name": upload.name,
+                         "status": 201,
+                         "msg": "",
+                         "id": str(result.id) if result else None}
+            results.append(entry)
+        return Response(results, status=200)
+
+    @action(methods=["post"], detail=False, url_path="exists",
+            url_name="exists")
+    def exists(self, request):
+        """
+        Check which of the given UUIDs ("uuids"), hashes ("hashes") and
+        SHA-256 digests of container files ("digests") belong to datasets
+        readable by the user. The response lists the
+        state of all matching datasets, so that clients only need to upload
+        new or changed containers.
+        """
+        if hasattr(request.data, "getlist"):
+            uuids = request.data.getlist("uuids")
+            hashes = request.data.getlist("hashes")
+            digests = request.data.getlist("digests")
+        else:
+            uuids = request.data.get("uuids", [])
+            hashes = request.data.get("hashes", [])
+            digests = request.data.get("digests", [])
+        if not isinstance(uuids, list) or not isinstance(hashes, list) or \
+                not isinstance(digests, list):
+            return Response("", status=400,
+                            reason="uuids, hashes and digests have to be " +
+                                   "lists.")
 
-            return Response(status=201)
-        return Response("", status=400,
-                        reason="No data file found in your request!")
+        max_items = getattr(settings, "SCIDATACONTAINER_PROBE_MAX_ITEMS",
+                            PROBE_MAX_ITEMS)
+        if len(uuids) + len(hashes) + len(digests) > max_items:
+            return Response("", status=400,
+                            reason="Not more than " + str(max_items) +
+                                   " UUIDs, hashes and digests are " +
+                                   "allowed.")
+        try:
+            uuids = [str(uuid.UUID(str(u))) for u in uuids]
+        except ValueError:
+            return Response("", status=400,
+                            reason="Invalid UUID in uuids.")
+        hashes = [str(h) for h in hashes]
+        digests = [str(d).lower() for d in digests]
+
+        datasets = {}
+        q = self._readable_datasets()
+        for field, values in [("id", uuids), ("hash", hashes),
+                              ("digest", digests)]:
+            for i in range(0, len(values), PROBE_CHUNK_SIZE):
+                chunk = values[i:i + PROBE_CHUNK_SIZE]
+                rows = q.filter(**{field + "__in": chunk})\
+                        .values("id", "hash", "digest", "complete",
+                                "static", "storage_time", "valid",
+                                "_replaced_by_field")
+                for row in rows:
+                    datasets[row["id"]] = row
+
+        result = [{"uuid": str(row["id"]),
+                   "hash": row["hash"],
+                   "digest": row["digest"],
+                   "complete": row["complete"],
+                   "static": row["static"],
+                   "storageTime": row["storage_time"],
+                   "valid": row["valid"],
+                   "replacedBy": str(row["_replaced_by_field"])
+                   if row["_replaced_by_field"] else None,
+                   } for row in datasets.values()]
+        return Response(result, status=200)
 
     def patch(self, request, pk=None):
         dataset = get_object_or_404(DataSet, id=pk)
@@ -242,9 +448,7 @@ class DataSetViewSet(ReadOnlyModelViewSet, mixins.CreateModelMixin):
             pk = obj.replaced_by.id
             return self.download(request, pk=pk, status_code=301)
 
-        r = FileResponse(open(obj.server_path, 'rb'))
-        r.status_code = status_code
-        return r
+        return container_response(request, obj, status_code)
 
     @action(methods=["get"], detail=True, url_path="download/noredirect",
             url_name="download-noredirect")
@@ -274,6 +478,13 @@ class FileViewSet(PermissionFilteredReadOnlyViewSet):
     dataset_fieldname = "content"
     idstr = "id"
 
+    def get_object(self):
+        obj = super().get_object()
+        if obj.content_pending:
+            # large JSON file registered without content -> extract on demand
+            obj.extract_content()
+        return obj
+
 
 class KeywordViewSet(PermissionFilteredReadOnlyViewSet):
     serializer_class = serializers.KeywordSerializer
@@ -287,3 +498,156 @@ class SoftwareViewSet(PermissionFilteredReadOnlyViewSet):
     model = Software
     dataset_fieldname = "used_software"
     idstr = "dbid"
+
+
+class IngestJobViewSet(ReadOnlyModelViewSet):
+    serializer_class = serializers.IngestJobSerializer
+
+    def get_queryset(self):
+        return IngestJob.objects.filter(owner=self.request.user)\
+                                .order_by("-created")
+
+
+# Default maximum size of a chunk of a resumable upload in bytes.
+MAX_CHUNK_SIZE = 64 * 1024 * 1024
+
+
+class ChunkedUploadViewSet(mixins.CreateModelMixin,
+                           mixins.RetrieveModelMixin,
+                           mixins.DestroyModelMixin,
+                           GenericViewSet):
+    """
+    Resumable upload of large containers. An upload is initiated by a POST,
+    the chunks are sent with PUT requests and the assembled container is
+    parsed by a POST to finalize/. The current offset is returned by a GET
+    to resume an interrupted upload.
+    """
+    serializer_class = serializers.ChunkedUploadSerializer
+
+    def get_queryset(self):
+        return ChunkedUpload.objects.filter(owner=self.request.user)
+
+    def perform_create(self, serializer):
+        upload_id = uuid.uuid4()
+        path = os.path.join(staging_dir(staging_root()),
+                            str(upload_id) + ".chunked")
+        open(path, "wb").close()
+        serializer.save(id=upload_id, owner=self.request.user,
+                        staged_path=path)
+
+    def perform_destroy(self, instance):
+        if os.path.exists(instance.staged_path):
+            os.remove(instance.staged_path)
+        instance.delete()
+
+    def update(self, request, pk=None):
+        """
+        Append a chunk. The query parameter offset has to match the number of
+        bytes received so far. If the header X-Chunk-SHA256 is given, the
+        chunk is only accepted if its SHA-256 digest matches.
+        """
+        upload = self.get_object()
+        try:
+            offset = int(request.query_params["offset"])
+        except (KeyError, ValueError):
+            return Response("", status=400,
+                            reason="The query parameter offset is required.")
+        try:
+            length = int(request.META["CONTENT_LENGTH"])
+        except (KeyError, ValueError):
+            # the size of a chunk has to be known before it is received
+            return Response("", status=411,
+                            reason="The header Content-Length is required.")
+        if length < 0:
+            return Response("", status=400,
+                            reason="Invalid header Content-Length.")
+
+        max_size = getattr(settings, "SCIDATACONTAINER_MAX_CHUNK_SIZE",
+                           MAX_CHUNK_SIZE)
+        if length > max_size:
+            return Response("", status=413,
+                            reason="Chunks must not be larger than " +
+                                   str(max_size) + " bytes.")
+        if upload.size is not None and offset + length > upload.size:
+            return Response("", status=400,
+                            reason="The chunk exceeds the announced size " +
+                                   "of " + str(upload.size) + " bytes.")
+
+        if offset != upload.offset:
+            return self._offset_conflict(upload)
+
+        # The chunk is received into its own file without holding a lock.
+        # Only the request which advances the offset copies it into the
+        # staged file, so concurrent requests can't overwrite accepted data.
+        part = upload.staged_path + "." + uuid.uuid4().hex + ".part"
+        open(part, "wb").close()
+        try:
+            written, digest = write_chunk(part, 0, request.stream, length)
+            expected = request.headers.get("X-Chunk-SHA256", digest)
+            if written != length or expected.lower() != digest:
+                return Response({"offset": upload.offset}, status=400,
+                                reason="The chunk is incomplete or its " +
+                                       "checksum does not match.")
+
+            q = ChunkedUpload.objects.filter(pk=upload.pk)
+            if not q.filter(offset=offset).update(offset=offset + written,
+                                                  updated=timezone.now()):
+                upload.refresh_from_db()
+                return self._offset_conflict(upload)
+            hasher = running_digest(upload.pk, offset)
+            try:
+                insert_chunk(part, upload.staged_path, offset, hasher)
+            except OSError:
+                q.filter(offset=offset + written).update(offset=offset)
+                raise
+        finally:
+            os.remove(part)
+
+        if hasher is not None:
+            if offset + written == upload.size:
+                # the digest is known without reading the container again
+                q.update(digest=hasher.hexdigest())
+            else:
+                keep_running_digest(upload.pk, offset + written, hasher)
+
+        upload.refresh_from_db()
+        s = self.get_serializer(upload)
+        return Response(s.data, status=200)
+
+    def _offset_conflict(self, upload):
+        return Response({"offset": upload.offset}, status=409,
+                        reason="Expected a chunk at offset " +
+                               str(upload.offset) + ".")
+
+    @action(methods=["post"], detail=True, url_path="finalize",
+            url_name="finalize")
+    def finalize(self, request, pk=None):
+        """
+        Parse the assembled container like a single upload to
+        /api/datasets/. The chunked upload is removed afterwards, unless
+        the container could not be stored due to a server error. In this
+        case the finalization can be repeated.
+        """
+        upload = self.get_object()
+        if upload.size is not None and upload.offset != upload.size:
+            return Response({"offset": upload.offset}, status=400,
+                            reason="The upload is incomplete. Received " +
+                                   str(upload.offset) + " of " +
+                                   str(upload.size) + " bytes.")
+
+        # discard data of chunks that failed after they were accepted
+        os.truncate(upload.staged_path, upload.offset)
+        digest = upload.digest
+        if digest is None:
+            hasher = running_digest(upload.pk, upload.offset)
+            if hasher is not None:
+                digest = hasher.hexdigest()
+        # without digest, it is computed when the container is stored
+        staged = StagedFile(upload.staged_path, upload.name, digest)
+        try:
+            r = _ingest(request, staged)
+        finally:
+            staged.close()
+        if r.status_code < 500:
+            self.perform_destroy(upload)
+        return r
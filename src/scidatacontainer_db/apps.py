@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class ScidatacontainerDBConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'scidatacontainer_db'
+
+    def ready(self):
+        from .parsers import warm_schema_cache
+        warm_schema_cache()
@@ -0,0 +1,272 @@
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test.utils import override_settings
+from django.urls import reverse
+
+import io
+import json
+import os
+import random
+import tempfile
+import time
+import uuid
+import zipfile
+
+from rest_framework.test import APIClient
+
+from scidatacontainer.tests import get_test_container
+
+from .models import ContainerType, DataSet, DataSetBase, File, Keyword,\
+                    Software
+from .parsers import parse_container_file
+
+
+# Default scenarios of the ingest benchmark. Each scenario describes the
+# synthetic containers by their number of additional members, the size of
+# each member in bytes and the fraction of members which are JSON files.
+SCENARIOS = {
+    "small": {"members": 10, "member_size": 1024, "json_ratio": 0.5,
+              "count": 50},
+    "many_members": {"members": 1000, "member_size": 256,
+                     "json_ratio": 0.5, "count": 5},
+    "json_heavy": {"members": 200, "member_size": 4096, "json_ratio": 1.0,
+                   "count": 10},
+    "large_members": {"members": 4, "member_size": 4 * 1024 * 1024,
+                      "json_ratio": 0.0, "count": 5},
+}
+
+MODES = ["parse", "upload"]
+
+# Metrics where a higher value of the current run is a regression.
+LOWER_IS_BETTER = ["queries_per_upload", "peak_rss_mb"]
+# Metrics where a lower value of the current run is a regression.
+HIGHER_IS_BETTER = ["containers_per_s", "mb_per_s"]
+
+
+def make_container(members: int, member_size: int, json_ratio: float,
+                   seed: int = 0) -> bytes:
+    """
+    Generate a synthetic .ZIP based container with a new UUID.
+
+    :param members: Number of members besides content.json and meta.json.
+    :param member_size: Approximate size of each member in bytes.
+    :param json_ratio: Fraction of the members which are JSON files.
+    :param seed: Seed of the random member content. The UUID is always
+    random, so containers left behind by an aborted run don't collide.
+
+    :return: The encoded container.
+    """
+    rng = random.Random(seed)
+    container = get_test_container()
+    container["content.json"]["uuid"] = str(uuid.uuid4())
+    container["content.json"]["replaces"] = None
+    container["content.json"]["complete"] = False
+
+    b = io.BytesIO(container.encode())
+    n_json = round(members * json_ratio)
+    with zipfile.ZipFile(b, "a", compression=zipfile.ZIP_DEFLATED) as zfile:
+        for i in range(members):
+            if i < n_json:
+                values = [rng.random() for _ in range(max(1,
+                                                          member_size // 20))]
+                zfile.writestr("data/member_" + str(i) + ".json",
+                               json.dumps({"values": values}))
+            else:
+                data = rng.getrandbits(8 * member_size)\
+                          .to_bytes(member_size, "little")
+                zfile.writestr("data/member_" + str(i) + ".bin", data)
+    return b.getvalue()
+
+
+def _upload(data: bytes, name: str):
+    return SimpleUploadedFile(name, data, "application/zip")
+
+
+def _parse(owner, containers):
+    for i, data in enumerate(containers):
+        parse_container_file(_upload(data, str(i) + ".zdc"), owner)
+
+
+def _post(owner, containers):
+    client = APIClient()
+    client.force_authenticate(owner)
+    url = reverse("scidatacontainer_db:api:dataset-list")
+    for i, data in enumerate(containers):
+        response = client.post(url, data={"uploadfile":
+                                          _upload(data, str(i) + ".zdc")})
+        if response.status_code != 201:
+            raise RuntimeError("Upload failed with status " +
+                               str(response.status_code) + ".")
+
+
+class _QueryCounter:
+    """
+    Database execute wrapper counting the queries. Unlike the query log of
+    the connection, it is not reset at the start of each request.
+    """
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def _reset_peak_rss() -> bool:
+    """
+    Reset the peak resident set size of the process to its current size.
+    This is only supported by Linux.
+
+    :return: True if the peak was reset.
+    """
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        return False
+    return True
+
+
+def _peak_rss_mb():
+    """
+    Return the peak resident set size of the process in MB or None if it is
+    unknown.
+    """
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024 / 1e6
+    except OSError:
+        pass
+    return None
+
+
+def _cleanup(owner):
+    """
+    Delete the datasets of the benchmark user with their stored containers,
+    the files, keywords, software and container types that are not used by
+    any other dataset and the user itself. Replaced datasets are released
+    and placeholders of replaced datasets that are unknown to the server are
+    deleted.
+    """
+    datasets = DataSet.objects.filter(owner=owner)
+    paths = list(datasets.exclude(server_path=None)
+                         .values_list("server_path", flat=True))
+    related = [(File, "included_in"), (Keyword, "dataset"),
+               (Software, "used_by"), (ContainerType, "instances")]
+    pks = {model: list(model.objects.filter(**{name + "__in": datasets})
+                                    .values_list("pk", flat=True)
+                                    .distinct())
+           for model, name in related}
+    replaced = DataSetBase.objects.filter(_replaced_by_field__in=datasets)
+    placeholders = list(replaced.filter(dataset=None)
+                                .values_list("pk", flat=True))
+    replaced.update(_replaced_by_field=None)
+    datasets.delete()
+    DataSetBase.objects.filter(pk__in=placeholders, dataset=None,
+                               _replaces_field=None).delete()
+    for model, name in related:
+        model.objects.filter(pk__in=pks[model], **{name: None}).delete()
+    owner.delete()
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def run_benchmark(members: int, member_size: int, json_ratio: float,
+                  count: int, mode: str = "parse") -> dict:
+    """
+    Ingest a number of synthetic containers and measure the throughput.
+
+    The ingest is timed and the database queries are counted. On Linux, the
+    peak resident set size of the process is reset before the ingest, so
+    that it reflects the scenario. It includes the generated containers.
+
+    Containers are staged and stored in a temporary directory, which is the
+    only storage root, and the created rows are deleted afterwards, so the
+    benchmark can be run against any database. The containers are not
+    ingested inside a transaction, like uploads.
+
+    :param members: Number of members per container.
+    :param member_size: Approximate size of each member in bytes.
+    :param json_ratio: Fraction of the members which are JSON files.
+    :param count: Number of containers.
+    :param mode: "parse" to call
+    :func:`scidatacontainer_db.parsers.parse_container_file` directly or
+    "upload" to post the containers to the upload endpoint.
+
+    :return: Dictionary with the metrics containers_per_s, mb_per_s,
+    queries_per_upload and peak_rss_mb. peak_rss_mb is None if it can't be
+    measured.
+    """
+    if mode not in MODES:
+        raise ValueError("Unknown benchmark mode '" + mode + "'.")
+    ingest = _parse if mode == "parse" else _post
+    containers = [make_container(members, member_size, json_ratio, seed=i)
+                  for i in range(count)]
+    size = sum(len(data) for data in containers)
+
+    with tempfile.TemporaryDirectory() as tmpdir, \
+            override_settings(MEDIA_ROOT=tmpdir,
+                              SCIDATACONTAINER_STORAGE_ROOTS=[tmpdir],
+                              SCIDATACONTAINER_STORAGE_PINNING={},
+                              SCIDATACONTAINER_STAGING_DIR=None,
+                              SCIDATACONTAINER_ASYNC_INGEST=False,
+                              ALLOWED_HOSTS=["testserver"]):
+        owner = User.objects.create_user("benchmark-" + uuid.uuid4().hex)
+        try:
+            queries = _QueryCounter()
+            rss = _reset_peak_rss()
+            with connection.execute_wrapper(queries):
+                start = time.perf_counter()
+                ingest(owner, containers)
+                elapsed = time.perf_counter() - start
+            peak_rss = _peak_rss_mb() if rss else None
+        finally:
+            _cleanup(owner)
+
+    return {"containers_per_s": count / elapsed,
+            "mb_per_s": size / 1e6 / elapsed,
+            "queries_per_upload": queries.count / count,
+            "peak_rss_mb": peak_rss,
+            }
+
+
+def compare(results: dict, baseline: dict, tolerance: float = 0.2) -> list:
+    """
+    Compare benchmark results with a baseline.
+
+    :param results: Results as {scenario: {mode: metrics}}.
+    :param baseline: Baseline in the same format.
+    :param tolerance: Relative deviation that is not yet a regression.
+
+    :return: List of messages describing the regressions.
+    """
+    regressions = []
+    for scenario, modes in results.items():
+        for mode, metrics in modes.items():
+            reference = baseline.get(scenario, {}).get(mode, None)
+            if reference is None:
+                continue
+            for key, value in metrics.items():
+                ref = reference.get(key, None)
+                if value is None or ref is None:
+                    continue
+                if key in HIGHER_IS_BETTER and \
+                        value < ref * (1 - tolerance):
+                    regressed = True
+                elif key in LOWER_IS_BETTER and \
+                        value > ref * (1 + tolerance):
+                    regressed = True
+                else:
+                    regressed = False
+                if regressed:
+                    regressions.append(scenario + "/" + mode + ": " + key +
+                                       " " + "{:.2f}".format(value) +
+                                       " (baseline " +
+                                       "{:.2f}".format(ref) + ")")
+    return regressions
@@ -0,0 +1,157 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+from collections import OrderedDict
+import hashlib
+import threading
+
+
+class LookupCache:
+    """
+    Bounded LRU cache for model instances of lookup tables, keyed by a tuple
+    of their identifying field values.
+
+    The number of entries per process is set by
+    SCIDATACONTAINER_LOOKUP_CACHE_SIZE (default: 1024, 0 disables the cache).
+    If SCIDATACONTAINER_LOOKUP_CACHE_BACKEND names a cache of Django's cache
+    framework, the entries are stored there instead, so that all workers of a
+    deployment share them.
+
+    Entries are only added after the surrounding transaction was committed,
+    so the cache never holds rows that might be rolled back.
+    """
+    def __init__(self, name: str):
+        self.name = name
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def maxsize(self) -> int:
+        return getattr(settings, "SCIDATACONTAINER_LOOKUP_CACHE_SIZE", 1024)
+
+    def _backend(self):
+        """
+        Return the shared Django cache or None for a process-local cache.
+        """
+        alias = getattr(settings, "SCIDATACONTAINER_LOOKUP_CACHE_BACKEND",
+                        None)
+        if alias:
+            return caches[alias]
+        return None
+
+    def _shared_key(self, key: tuple) -> str:
+        digest = hashlib.sha1(repr(key).encode("utf-8")).hexdigest()
+        return "scidatacontainer_db:" + self.name + ":" + digest
+
+    def get_many(self, keys) -> dict:
+        """
+        Return a dictionary of the cached instances for the given keys.
+        Missing keys are not contained.
+        """
+        if self.maxsize == 0:
+            return {}
+
+        backend = self._backend()
+        if backend is not None:
+            shared_keys = {self._shared_key(k): k for k in keys}
+            found = {shared_keys[k]: v
+                     for k, v in backend.get_many(shared_keys).items()}
+        else:
+            found = {}
+            with self._lock:
+                for k in keys:
+                    if k in self._data:
+                        self._data.move_to_end(k)
+                        found[k] = self._data[k]
+
+        with self._lock:
+            self.hits += len(found)
+            self.misses += len(set(keys)) - len(found)
+        return found
+
+    def get(self, key: tuple):
+        """
+        Return the cached instance for a key or None.
+        """
+        return self.get_many([key]).get(key, None)
+
+    def put_many(self, items: dict):
+        """
+        Add instances keyed by their key tuples once the current transaction
+        is committed.
+        """
+        if self.maxsize == 0 or not items:
+            return
+        transaction.on_commit(lambda: self._store(items))
+
+    def put(self, key: tuple, obj):
+        self.put_many({key: obj})
+
+    def _store(self, items: dict):
+        backend = self._backend()
+        if backend is not None:
+            backend.set_many({self._shared_key(k): v
+                              for k, v in items.items()})
+            return
+
+        with self._lock:
+            for k, v in items.items():
+                self._data[k] = v
+                self._data.move_to_end(k)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def invalidate(self, key: tuple):
+        """
+        Remove a key from the cache.
+        """
+        backend = self._backend()
+        if backend is not None:
+            backend.delete(self._shared_key(key))
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        """
+        Remove all entries of the process-local cache and reset the counters.
+        """
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> dict:
+        """
+        Return the hit and miss counters and the current number of entries.
+        """
+        return {"hits": self.hits,
+                "misses": self.misses,
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                }
+
+
+container_types = LookupCache("containertype")
+keywords = LookupCache("keyword")
+softwares = LookupCache("software")
+
+LOOKUP_CACHES = [container_types, keywords, softwares]
+
+
+def stats() -> dict:
+    """
+    Return the statistics of all lookup caches of this process keyed by their
+    name.
+    """
+    return {c.name: c.stats() for c in LOOKUP_CACHES}
+
+
+def clear():
+    """
+    Clear all process-local lookup caches.
+    """
+    for c in LOOKUP_CACHES:
+        c.clear()
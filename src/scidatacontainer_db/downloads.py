@@ -0,0 +1,269 @@
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.http import parse_etags
+
+import hashlib
+import mimetypes
+import os
+import urllib.parse
+import uuid
+
+from .storage import root_of
+
+
+# Requests with more ranges are answered with the complete container.
+MAX_RANGES = 64
+# Block size for reading ranges of a container.
+BLOCK_SIZE = 64 * 1024
+
+OFFLOAD_MODES = ("x-accel-redirect", "x-sendfile")
+
+
+def offload_mode():
+    """
+    Return the configured download offload mode.
+
+    - None: Containers are streamed by Django (default).
+    - "x-accel-redirect": nginx streams the container from the internal
+      location SCIDATACONTAINER_DOWNLOAD_OFFLOAD_PREFIX, which has to be
+      an alias of MEDIA_ROOT. With several storage roots, the setting is a
+      dictionary that maps each root to its location.
+    - "x-sendfile": Apache (mod_xsendfile) or lighttpd streams the
+      container from server_path.
+
+    :raises django.core.exceptions.ImproperlyConfigured: If
+    SCIDATACONTAINER_DOWNLOAD_OFFLOAD is not one of the modes above.
+    """
+    mode = getattr(settings, "SCIDATACONTAINER_DOWNLOAD_OFFLOAD", None)
+    if mode is not None and mode not in OFFLOAD_MODES:
+        raise ImproperlyConfigured("SCIDATACONTAINER_DOWNLOAD_OFFLOAD has " +
+                                   "to be None or one of '" +
+                                   "', '".join(OFFLOAD_MODES) + "'.")
+    return mode
+
+
+def offload_header(mode: str, server_path: str) -> tuple:
+    """
+    Return the name and value of the header that hands a container over to
+    the front-end web server.
+
+    :param mode: Offload mode, see :func:`offload_mode`.
+    :param server_path: Location of the container.
+    """
+    if mode == "x-sendfile":
+        return "X-Sendfile", server_path
+    prefix = getattr(settings, "SCIDATACONTAINER_DOWNLOAD_OFFLOAD_PREFIX",
+                     "/protected/")
+    root = root_of(server_path) or os.path.abspath(settings.MEDIA_ROOT)
+    if isinstance(prefix, dict):
+        prefixes = {os.path.abspath(r): p for r, p in prefix.items()}
+        if root not in prefixes:
+            raise ImproperlyConfigured("SCIDATACONTAINER_DOWNLOAD_OFFLOAD_" +
+                                       "PREFIX has no location for '" +
+                                       root + "'.")
+        prefix = prefixes[root]
+    path = os.path.relpath(server_path, root)
+    path = urllib.parse.quote(path.replace(os.sep, "/"))
+    return "X-Accel-Redirect", prefix.rstrip("/") + "/" + path
+
+
+def container_etag(obj) -> str:
+    """
+    Return the entity tag of a stored container. It is the SHA-256 digest of
+    the file. For containers stored without a digest, a weak entity tag is
+    derived from the UUID, storage time, size and hash. It is weak because a
+    re-upload with an equal storage time may change the file without
+    changing these values.
+
+    :param obj: :class:`scidatacontainer_db.models.DataSet` instance.
+    """
+    if obj.digest:
+        return '"' + obj.digest + '"'
+    key = ":".join([str(obj.id), obj.storage_time.isoformat(),
+                    str(obj.size), obj.hash or ""])
+    return 'W/"' + hashlib.sha256(key.encode("utf-8")).hexdigest() + '"'
+
+
+def _etag_matches(header: str, etag: str, weak: bool) -> bool:
+    etags = parse_etags(header)
+    if "*" in etags:
+        return True
+    if weak:
+        etags = [e[2:] if e.startswith("W/") else e for e in etags]
+        etag = etag[2:] if etag.startswith("W/") else etag
+    elif etag.startswith("W/"):
+        # weak entity tags never match in the strong comparison
+        return False
+    return etag in etags
+
+
+def _content_disposition(filename: str) -> str:
+    """
+    Return the value of the Content-Disposition header of a download. The
+    file names of stored containers only contain ASCII characters.
+    """
+    filename = filename.replace("\\", "\\\\").replace('"', '\\"')
+    return 'inline; filename="' + filename + '"'
+
+
+def parse_range(header: str, size: int):
+    """
+    Parse the value of a Range header.
+
+    :param header: Value of the Range header.
+    :param size: Size of the container in bytes.
+
+    :return: List of (first byte, last byte) tuples, an empty list if no
+    range is satisfiable or None if the header is invalid and has to be
+    ignored.
+    """
+    unit, _, specs = header.partition("=")
+    if unit.strip().lower() != "bytes":
+        return None
+    specs = [spec.strip() for spec in specs.split(",")]
+    if not specs or len(specs) > MAX_RANGES:
+        return None
+
+    ranges = []
+    for spec in specs:
+        first, sep, last = spec.partition("-")
+        if not sep:
+            return None
+        try:
+            if not first:
+                # suffix range with the last bytes of the container
+                length = int(last)
+                if length > 0 and size > 0:
+                    ranges.append((max(0, size - length), size - 1))
+                continue
+            first = int(first)
+            last = int(last) if last else None
+        except ValueError:
+            return None
+        if first < 0 or (last is not None and last < first):
+            return None
+        if last is None:
+            last = size - 1
+        if first < size:
+            ranges.append((first, min(last, size - 1)))
+    return ranges
+
+
+def _iter_ranges(path: str, ranges: list, headers: list = None,
+                 trailer: bytes = b""):
+    with open(path, "rb") as f:
+        for i, (first, last) in enumerate(ranges):
+            if headers:
+                yield headers[i]
+            f.seek(first)
+            remaining = last - first + 1
+            while remaining > 0:
+                block = f.read(min(BLOCK_SIZE, remaining))
+                if not block:
+                    break
+                remaining -= len(block)
+                yield block
+            if headers:
+                yield b"\r\n"
+        if trailer:
+            yield trailer
+
+
+def container_response(request, obj, status_code: int = 200):
+    """
+    Provide the stored container of a dataset. The response carries an ETag
+    and supports conditional requests (If-None-Match) and byte ranges
+    (Range, If-Range). No Last-Modified header is sent, because the storage
+    time is supplied by the client and may stay the same when a container is
+    replaced. Multiple ranges are sent as multipart/byteranges. HEAD requests
+    are answered from the database without opening the file. If a download
+    offload mode is configured, the container is streamed by the front-end
+    web server instead.
+
+    :param request: The download request.
+    :param obj: :class:`scidatacontainer_db.models.DataSet` instance.
+    :param status_code: Status code of a complete response. Conditional and
+    range requests are only evaluated for 200.
+    """
+    etag = container_etag(obj)
+    size = obj.size
+    filename = os.path.basename(obj.server_path)
+    content_type = mimetypes.guess_type(filename)[0] or \
+        "application/octet-stream"
+    headers = {"Accept-Ranges": "bytes",
+               "ETag": etag,
+               "Content-Disposition": _content_disposition(filename),
+               }
+
+    if status_code == 200:
+        if_none_match = request.headers.get("If-None-Match", None)
+        if if_none_match is not None and \
+                _etag_matches(if_none_match, etag, weak=True):
+            headers.pop("Content-Disposition")
+            return HttpResponse(status=304, headers=headers)
+
+    mode = offload_mode()
+    if mode is not None:
+        # the front-end server handles byte ranges and HEAD requests
+        name, value = offload_header(mode, obj.server_path)
+        headers[name] = value
+        return HttpResponse(status=status_code, content_type=content_type,
+                            headers=headers)
+
+    ranges = None
+    if status_code == 200:
+        range_header = request.headers.get("Range", None)
+        if_range = request.headers.get("If-Range", None)
+        # only the strong entity tag is accepted, dates are not reliable
+        if range_header is not None and if_range is not None and \
+                not _etag_matches(if_range, etag, weak=False):
+            range_header = None
+        if range_header is not None:
+            ranges = parse_range(range_header, size)
+
+    if ranges == []:
+        headers["Content-Range"] = "bytes */" + str(size)
+        return HttpResponse(status=416, headers=headers)
+
+    if not ranges:
+        if request.method == "HEAD":
+            r = HttpResponse(status=status_code, content_type=content_type,
+                             headers=headers)
+            r["Content-Length"] = str(size)
+            return r
+        r = FileResponse(open(obj.server_path, "rb"),
+                         content_type=content_type, headers=headers)
+        r.status_code = status_code
+        return r
+
+    if len(ranges) == 1:
+        first, last = ranges[0]
+        headers["Content-Range"] = "bytes " + str(first) + "-" + \
+            str(last) + "/" + str(size)
+        length = last - first + 1
+        part_headers = None
+        trailer = b""
+    else:
+        boundary = uuid.uuid4().hex
+        part_headers = [("--" + boundary + "\r\n" +
+                         "Content-Type: " + content_type + "\r\n" +
+                         "Content-Range: bytes " + str(first) + "-" +
+                         str(last) + "/" + str(size) + "\r\n\r\n").encode()
+                        for first, last in ranges]
+        trailer = ("--" + boundary + "--\r\n").encode()
+        length = sum(len(h) + last - first + 1 + 2
+                     for h, (first, last) in zip(part_headers, ranges)) + \
+            len(trailer)
+        content_type = "multipart/byteranges; boundary=" + boundary
+
+    if request.method == "HEAD":
+        r = HttpResponse(status=206, content_type=content_type,
+                         headers=headers)
+    else:
+        r = StreamingHttpResponse(_iter_ranges(obj.server_path, ranges,
+                                               part_headers, trailer),
+                                  status=206, content_type=content_type,
+                                  headers=headers)
+    r["Content-Length"] = str(length)
+    return r
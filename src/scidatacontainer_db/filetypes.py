@@ -0,0 +1,95 @@
+ZIP = "zip"
+HDF5 = "hdf5"
+
+ZIP_LOCAL_HEADER = b"PK\x03\x04"
+ZIP_END_OF_CENTRAL_DIRECTORY = b"PK\x05\x06"
+# The end of central directory record is 22 bytes long plus a comment of up
+# to 65535 bytes.
+ZIP_EOCD_SEARCH_SIZE = 22 + 65535
+
+HDF5_SIGNATURE = b"\x89HDF\r\n\x1a\n"
+
+MAGIC_MIME_TYPES = {"application/zip": ZIP,
+                    "application/x-hdf5": HDF5,
+                    "application/x-hdf": HDF5,
+                    }
+
+
+def _has_signature(f, offset: int, signature: bytes) -> bool:
+    f.seek(offset)
+    return f.read(len(signature)) == signature
+
+
+def _has_zip_eocd(f, size: int) -> bool:
+    """
+    Search the end of central directory record at the end of the file. It
+    identifies ZIP archives with a prefix, e.g. self-extracting ones. The
+    record only counts if its comment length matches the end of the file.
+    """
+    start = max(0, size - ZIP_EOCD_SEARCH_SIZE)
+    f.seek(start)
+    tail = f.read(ZIP_EOCD_SEARCH_SIZE)
+    pos = tail.rfind(ZIP_END_OF_CENTRAL_DIRECTORY)
+    while pos >= 0:
+        comment_length = int.from_bytes(tail[pos + 20:pos + 22], "little")
+        if pos + 22 + comment_length == len(tail):
+            return True
+        pos = tail.rfind(ZIP_END_OF_CENTRAL_DIRECTORY, 0, pos)
+    return False
+
+
+def _has_hdf5_superblock(f, size: int) -> bool:
+    """
+    Check for the HDF5 superblock signature behind a user block. It is
+    located at offset 512, 1024, 2048 or any further power of two times 512.
+    """
+    offset = 512
+    while offset + len(HDF5_SIGNATURE) <= size:
+        if _has_signature(f, offset, HDF5_SIGNATURE):
+            return True
+        offset *= 2
+    return False
+
+
+def _magic_file_type(data: bytes):
+    """
+    Ask python-magic for the type of a file that matches no signature. It is
+    only imported here, because loading libmagic and its database is slow.
+
+    :return: ZIP, HDF5 or None if python-magic is not installed or reports
+    another type.
+    """
+    try:
+        import magic
+    except ImportError:
+        return None
+    return MAGIC_MIME_TYPES.get(magic.from_buffer(data, mime=True), None)
+
+
+def detect_file_type(upload):
+    """
+    Detect whether an uploaded file is a ZIP or an HDF5 container by their
+    file signatures. Only a few small reads at fixed positions are needed. If
+    python-magic is installed, it is asked for files that match neither
+    signature.
+
+    :param upload: Uploaded file.
+
+    :return: ZIP, HDF5 or None for other file types.
+    """
+    f = upload.open("rb")
+    size = upload.size
+    try:
+        if _has_signature(f, 0, HDF5_SIGNATURE):
+            return HDF5
+        if _has_signature(f, 0, ZIP_LOCAL_HEADER) or \
+                _has_signature(f, 0, ZIP_END_OF_CENTRAL_DIRECTORY):
+            return ZIP
+        if _has_hdf5_superblock(f, size):
+            return HDF5
+        if _has_zip_eocd(f, size):
+            return ZIP
+        f.seek(0)
+        return _magic_file_type(f.read(2048))
+    finally:
+        f.seek(0)
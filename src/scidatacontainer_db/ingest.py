@@ -0,0 +1,180 @@
+from django.conf import settings
+from django.db import connections
+from django.utils import timezone
+
+import datetime
+import glob
+import os
+import socket
+import time
+import uuid
+
+from .models import ChunkedUpload, DataSet, IngestJob
+from .parsers import parse_container_file
+from .storage import promote, staging_dir, staging_root
+from .uploadhandlers import StagedFile
+from .utils import MetaDBError
+
+
+# Chunked uploads without a new chunk for this many seconds are purged.
+CHUNKED_UPLOAD_MAX_AGE = 7 * 24 * 3600
+
+
+def enqueue(upload, owner) -> IngestJob:
+    """
+    Keep an uploaded container in the staging directory and queue it for the
+    ingest worker.
+
+    :param upload: Uploaded container file.
+    :param owner: User sending the request.
+
+    :return: The queued :class:`scidatacontainer_db.models.IngestJob`.
+    """
+    job_id = uuid.uuid4()
+    path = os.path.join(staging_dir(staging_root(upload)),
+                        str(job_id) + ".job")
+    digest = promote(upload, path)
+    return IngestJob.objects.create(id=job_id, owner=owner,
+                                    name=upload.name or "",
+                                    staged_path=path,
+                                    digest=digest)
+
+
+def claim_job(worker: str):
+    """
+    Take the oldest queued job and mark it as running. The state is changed
+    by a conditional update, so concurrent workers never claim the same job.
+
+    :param worker: Name of the claiming worker.
+
+    :return: The claimed job or None if the queue is empty.
+    """
+    while True:
+        job = IngestJob.objects.filter(state=IngestJob.QUEUED)\
+                               .order_by("created").first()
+        if job is None:
+            return None
+        claimed = IngestJob.objects.filter(pk=job.pk,
+                                           state=IngestJob.QUEUED)\
+                                   .update(state=IngestJob.RUNNING,
+                                           started=timezone.now(),
+                                           worker=worker)
+        if claimed:
+            job.refresh_from_db()
+            return job
+
+
+def requeue_stale_jobs(timeout: float) -> int:
+    """
+    Queue running jobs again whose worker did not finish them within timeout
+    seconds, e.g. because the worker process was killed.
+
+    :return: Number of requeued jobs.
+    """
+    limit = timezone.now() - datetime.timedelta(seconds=timeout)
+    return IngestJob.objects.filter(state=IngestJob.RUNNING,
+                                    started__lt=limit)\
+                            .update(state=IngestJob.QUEUED, worker="")
+
+
+def purge_stale_uploads(max_age: float = None) -> int:
+    """
+    Delete chunked uploads that did not receive a chunk within max_age
+    seconds, together with their staged files.
+
+    :param max_age: Age in seconds, SCIDATACONTAINER_CHUNKED_UPLOAD_MAX_AGE
+    by default.
+
+    :return: Number of deleted uploads.
+    """
+    if max_age is None:
+        max_age = getattr(settings, "SCIDATACONTAINER_CHUNKED_UPLOAD_MAX_AGE",
+                          CHUNKED_UPLOAD_MAX_AGE)
+    limit = timezone.now() - datetime.timedelta(seconds=max_age)
+    purged = 0
+    for upload in ChunkedUpload.objects.filter(updated__lt=limit):
+        # an upload which received a chunk in the meantime is kept
+        deleted, _ = ChunkedUpload.objects.filter(pk=upload.pk,
+                                                  updated__lt=limit).delete()
+        if not deleted:
+            continue
+        purged += 1
+        # chunks of interrupted requests are left as part files
+        paths = glob.glob(glob.escape(upload.staged_path) + ".*.part")
+        for path in [upload.staged_path] + paths:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+    return purged
+
+
+def run_job(job: IngestJob):
+    """
+    Parse the staged container of a claimed job and store the outcome in the
+    job. The staged file is moved to its final location on success and
+    removed otherwise.
+    """
+    try:
+        upload = StagedFile(job.staged_path, job.name, job.digest)
+    except OSError as e:
+        error = {"error_code": 500,
+                 "msg": "Failed to open the staged upload: " + str(e)}
+    else:
+        try:
+            obj = parse_container_file(upload, job.owner)
+            error = None
+        except MetaDBError as e:
+            error = dict(e.args[0])
+        finally:
+            upload.close()
+
+    if error is None:
+        job.state = IngestJob.DONE
+        job.status_code = 201
+        job.dataset = obj
+    else:
+        obj = error.pop("object", None)
+        delete_replaced = error.pop("delete_replaced", False)
+        delete = error.pop("delete", False)
+        if obj and delete_replaced and obj.replaces:
+            obj.replaces.delete()
+        if obj and delete:
+            obj.delete()
+            obj = None
+        job.status_code = error["error_code"]
+        if job.status_code < 300:
+            # e.g. an unchanged dataset
+            job.state = IngestJob.DONE
+        else:
+            job.state = IngestJob.FAILED
+        job.error = error
+        if obj:
+            # the object might be a DataSetBase or a rolled back DataSet
+            obj = DataSet.objects.filter(pk=obj.pk).first()
+        job.dataset = obj
+
+    if os.path.exists(job.staged_path):
+        os.remove(job.staged_path)
+    job.finished = timezone.now()
+    job.save()
+
+
+def work(poll_interval: float = 1.0, once: bool = False):
+    """
+    Process queued jobs until the process is stopped.
+
+    :param poll_interval: Seconds to wait if the queue is empty.
+    :param once: Return as soon as the queue is empty.
+    """
+    worker = socket.gethostname() + ":" + str(os.getpid())
+    while True:
+        job = claim_job(worker)
+        if job is not None:
+            run_job(job)
+            continue
+        if once:
+            return
+        # don't keep idle connections open
+        connections.close_all()
+        time.sleep(poll_interval)
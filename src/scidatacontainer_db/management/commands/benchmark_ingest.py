@@ -0,0 +1,72 @@
+from django.core.management.base import BaseCommand, CommandError
+
+import json
+
+from scidatacontainer_db.benchmark import compare, MODES, run_benchmark,\
+                                          SCENARIOS
+
+
+class Command(BaseCommand):
+    help = "Measure the ingest throughput with synthetic containers."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--scenario", action="append",
+                            choices=sorted(SCENARIOS),
+                            help="Scenario to run. May be given multiple " +
+                                 "times. Default: all scenarios.")
+        parser.add_argument("--mode", action="append", choices=MODES,
+                            help="Ingest path to measure. May be given " +
+                                 "multiple times. Default: all modes.")
+        parser.add_argument("--count", type=int, default=None,
+                            help="Number of containers per scenario.")
+        parser.add_argument("--members", type=int, default=None,
+                            help="Number of members per container.")
+        parser.add_argument("--member-size", type=int, default=None,
+                            help="Size of each member in bytes.")
+        parser.add_argument("--json-ratio", type=float, default=None,
+                            help="Fraction of JSON members.")
+        parser.add_argument("--output", default=None,
+                            help="Store the results as JSON baseline.")
+        parser.add_argument("--compare", default=None,
+                            help="Compare the results with a JSON baseline " +
+                                 "and fail on regressions.")
+        parser.add_argument("--tolerance", type=float, default=0.2,
+                            help="Relative deviation from the baseline " +
+                                 "that is not yet a regression.")
+
+    def handle(self, *args, **options):
+        overrides = {key: options[key]
+                     for key in ["count", "members", "member_size",
+                                 "json_ratio"]
+                     if options[key] is not None}
+
+        results = {}
+        for name in options["scenario"] or SCENARIOS:
+            scenario = dict(SCENARIOS[name], **overrides)
+            results[name] = {}
+            for mode in options["mode"] or MODES:
+                metrics = run_benchmark(mode=mode, **scenario)
+                results[name][mode] = metrics
+                memory = "n/a" if metrics["peak_rss_mb"] is None else \
+                    "{:.1f}".format(metrics["peak_rss_mb"])
+                self.stdout.write(
+                        name + "/" + mode + ": " +
+                        "{:.1f} containers/s, ".format(
+                            metrics["containers_per_s"]) +
+                        "{:.1f} MB/s, ".format(metrics["mb_per_s"]) +
+                        "{:.1f} queries/upload, ".format(
+                            metrics["queries_per_upload"]) +
+                        "peak RSS " + memory + " MB")
+
+        if options["output"] is not None:
+            with open(options["output"], "w") as f:
+                json.dump(results, f, indent=2)
+
+        if options["compare"] is not None:
+            with open(options["compare"]) as f:
+                baseline = json.load(f)
+            regressions = compare(results, baseline, options["tolerance"])
+            if regressions:
+                raise CommandError("Regressions against the baseline:\n" +
+                                   "\n".join(regressions))
+            self.stdout.write("No regressions against the baseline.")
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from scidatacontainer_db.models import File
+
+
+class Command(BaseCommand):
+    help = "Extract the content of JSON files that were registered " +\
+           "without their content because they exceeded " +\
+           "SCIDATACONTAINER_JSON_CONTENT_MAX_SIZE."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--limit", type=int, default=None,
+                            help="Maximum number of files to process.")
+
+    def handle(self, *args, **options):
+        q = File.objects.filter(content_pending=True).order_by("name")
+        if options["limit"] is not None:
+            q = q[:options["limit"]]
+
+        extracted = 0
+        failed = 0
+        for file_obj in list(q):
+            if file_obj.extract_content() is None:
+                failed += 1
+                self.stderr.write("Failed to extract '" + file_obj.name +
+                                  "' (id=" + str(file_obj.id) + ").")
+            else:
+                extracted += 1
+
+        self.stdout.write("Extracted " + str(extracted) + " file(s), " +
+                          str(failed) + " failed.")
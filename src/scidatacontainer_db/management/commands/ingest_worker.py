@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+import multiprocessing
+
+from scidatacontainer_db.ingest import requeue_stale_jobs, work
+
+
+class Command(BaseCommand):
+    help = "Parse containers uploaded in asynchronous ingest mode."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--processes", type=int, default=1,
+                            help="Number of worker processes.")
+        parser.add_argument("--poll-interval", type=float, default=1.0,
+                            help="Seconds to wait if the queue is empty.")
+        parser.add_argument("--once", action="store_true",
+                            help="Exit as soon as the queue is empty.")
+        parser.add_argument("--requeue-after", type=float, default=None,
+                            help="Queue running jobs again that were " +
+                                 "started more than this many seconds ago, " +
+                                 "e.g. by a killed worker.")
+
+    def handle(self, *args, **options):
+        if options["requeue_after"] is not None:
+            n = requeue_stale_jobs(options["requeue_after"])
+            self.stdout.write("Requeued " + str(n) + " stale job(s).")
+
+        kwargs = {"poll_interval": options["poll_interval"],
+                  "once": options["once"]}
+        if options["processes"] <= 1:
+            work(**kwargs)
+            return
+
+        # connections must not be shared with the forked processes
+        connections.close_all()
+        ctx = multiprocessing.get_context("fork")
+        processes = [ctx.Process(target=work, kwargs=kwargs)
+                     for _ in range(options["processes"])]
+        for p in processes:
+            p.start()
+        for p in processes:
+            p.join()
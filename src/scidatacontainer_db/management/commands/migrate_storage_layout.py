@@ -0,0 +1,61 @@
+from django.core.management.base import BaseCommand
+
+import os
+
+from scidatacontainer_db.models import DataSet
+from scidatacontainer_db.storage import relocate, root_of,\
+                                        server_path_for
+
+
+class Command(BaseCommand):
+    help = "Move stored containers into the layout configured by " +\
+           "SCIDATACONTAINER_STORAGE_SHARD_DEPTH. Containers stay " +\
+           "available for downloads while they are moved."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000,
+                            help="Number of datasets updated per " +
+                                 "transaction.")
+        parser.add_argument("--dry-run", action="store_true",
+                            help="Only count the containers to move.")
+
+    def handle(self, *args, **options):
+        moved = 0
+        failed = 0
+        last = None
+        while True:
+            q = DataSet.objects.exclude(server_path=None).order_by("pk")
+            if last is not None:
+                q = q.filter(pk__gt=last)
+            rows = list(q.values_list("pk", "server_path")
+                         [:options["batch_size"]])
+            if not rows:
+                break
+            last = rows[-1][0]
+
+            moves = []
+            for pk, path in rows:
+                # containers outside the storage roots are moved by
+                # rebalance_storage
+                root = root_of(path)
+                if root is None:
+                    continue
+                target = server_path_for(pk, os.path.splitext(path)[1], root)
+                if path != target:
+                    moves.append((pk, path, target))
+            if options["dry_run"]:
+                moved += len(moves)
+                continue
+
+            n, errors = relocate(moves)
+            moved += n
+            failed += len(errors)
+            for pk, msg in errors:
+                self.stderr.write("Failed to move the container of " +
+                                  str(pk) + ": " + msg)
+
+        if options["dry_run"]:
+            self.stdout.write(str(moved) + " container(s) to move.")
+        else:
+            self.stdout.write("Moved " + str(moved) + " container(s), " +
+                              str(failed) + " failed.")
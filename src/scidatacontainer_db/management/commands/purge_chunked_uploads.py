@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from scidatacontainer_db.ingest import purge_stale_uploads
+
+
+class Command(BaseCommand):
+    help = "Delete abandoned chunked uploads and their staged files."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--max-age", type=float, default=None,
+                            help="Delete uploads that did not receive a " +
+                                 "chunk for this many seconds (default: " +
+                                 "SCIDATACONTAINER_CHUNKED_UPLOAD_MAX_AGE).")
+
+    def handle(self, *args, **options):
+        n = purge_stale_uploads(options["max_age"])
+        self.stdout.write("Deleted " + str(n) + " abandoned upload(s).")
@@ -0,0 +1,97 @@
+from django.core.management.base import BaseCommand
+
+import os
+
+from scidatacontainer_db.models import DataSet
+from scidatacontainer_db.storage import disk_usage, pinned_root,\
+                                        placement_root, relocate, root_of,\
+                                        server_path_for, storage_roots
+
+
+class Command(BaseCommand):
+    help = "Move stored containers between the storage roots. Containers " +\
+           "of pinned types are moved to their root and containers " +\
+           "outside of SCIDATACONTAINER_STORAGE_ROOTS are placed by the " +\
+           "placement policy. Containers stay available for downloads " +\
+           "while they are moved."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--balance", type=float, default=None,
+                            help="Also move containers away from roots " +
+                                 "whose used fraction exceeds the one of " +
+                                 "the least used root by more than this " +
+                                 "value, e.g. 0.05.")
+        parser.add_argument("--batch-size", type=int, default=1000,
+                            help="Number of datasets updated per " +
+                                 "transaction.")
+        parser.add_argument("--limit", type=int, default=None,
+                            help="Maximum number of containers to move.")
+        parser.add_argument("--dry-run", action="store_true",
+                            help="Only count the containers to move.")
+
+    def _usage(self):
+        used = {}
+        total = {}
+        for root in storage_roots():
+            usage = disk_usage(root)
+            used[root] = usage.used
+            total[root] = usage.total
+        return used, total
+
+    def _target_root(self, container_type, path, size, used, total,
+                     balance):
+        root = placement_root(container_type, path)
+        if balance is None or pinned_root(container_type) is not None or \
+                root != root_of(path):
+            return root
+
+        least = min(total, key=lambda r: used[r] / total[r])
+        if used[root] / total[root] - used[least] / total[least] > balance:
+            used[root] -= size
+            used[least] += size
+            return least
+        return root
+
+    def handle(self, *args, **options):
+        moved = 0
+        failed = 0
+        planned = 0
+        last = None
+        limit = options["limit"]
+        while limit is None or planned < limit:
+            q = DataSet.objects.exclude(server_path=None).order_by("pk")
+            if last is not None:
+                q = q.filter(pk__gt=last)
+            rows = list(q.values_list("pk", "server_path", "size",
+                                      "container_type__name")
+                         [:options["batch_size"]])
+            if not rows:
+                break
+            last = rows[-1][0]
+
+            used, total = self._usage()
+            moves = []
+            for pk, path, size, container_type in rows:
+                if limit is not None and planned >= limit:
+                    break
+                root = self._target_root(container_type, path, size,
+                                         used, total, options["balance"])
+                target = server_path_for(pk, os.path.splitext(path)[1], root)
+                if path != target:
+                    moves.append((pk, path, target))
+                    planned += 1
+            if options["dry_run"]:
+                continue
+
+            n, errors = relocate(moves)
+            moved += n
+            failed += len(errors)
+            for pk, msg in errors:
+                self.stderr.write("Failed to move the container of " +
+                                  str(pk) + ": " + msg)
+
+        if options["dry_run"]:
+            self.stdout.write(str(planned) + " container(s) to move.")
+        else:
+            self.stdout.write("Moved " + str(moved) + " container(s), " +
+                              str(failed) + " failed.")
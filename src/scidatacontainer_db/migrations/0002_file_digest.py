@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-18 18:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scidatacontainer_db', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='file',
+            name='digest',
+            field=models.CharField(blank=True, default='', help_text='SHA-256 digest of the JSON content. Empty for files without content.', max_length=128),
+        ),
+    ]
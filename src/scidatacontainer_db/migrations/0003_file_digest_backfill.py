@@ -0,0 +1,60 @@
+from django.db import migrations
+
+import hashlib
+import json
+
+
+def _digest(content):
+    # Copy of File.compute_digest at the time of writing this migration.
+    if content is None:
+        return ""
+    s = json.dumps(content, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(s.encode("utf-8")).hexdigest()
+
+
+def backfill_digest(apps, schema_editor):
+    """
+    Compute the digest of all existing files and merge files that share the
+    same name, size and digest, so that the unique constraint can be added.
+    """
+    File = apps.get_model("scidatacontainer_db", "File")
+    DataSet = apps.get_model("scidatacontainer_db", "DataSet")
+    Through = DataSet.content.through
+
+    pks = list(File.objects.order_by("pk").values_list("pk", flat=True))
+    keep = {}
+    for i in range(0, len(pks), 500):
+        batch = []
+        for obj in File.objects.filter(pk__in=pks[i:i + 500]).order_by("pk"):
+            obj.digest = _digest(obj.content)
+            key = (obj.name, obj.size, obj.digest)
+            if key not in keep:
+                keep[key] = obj.pk
+                batch.append(obj)
+                continue
+
+            # duplicate -> move its relations to the file that is kept
+            target = keep[key]
+            linked = set(Through.objects.filter(file_id=target)
+                         .values_list("dataset_id", flat=True))
+            for rel in Through.objects.filter(file_id=obj.pk):
+                if rel.dataset_id in linked:
+                    rel.delete()
+                else:
+                    rel.file_id = target
+                    rel.save()
+                    linked.add(rel.dataset_id)
+            obj.delete()
+
+        File.objects.bulk_update(batch, ["digest"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scidatacontainer_db', '0002_file_digest'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_digest, migrations.RunPython.noop),
+    ]
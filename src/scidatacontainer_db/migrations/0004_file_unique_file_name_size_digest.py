@@ -0,0 +1,17 @@
+# Generated by Django 4.2.30 on 2026-10-18 18:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scidatacontainer_db', '0003_file_digest_backfill'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='file',
+            constraint=models.UniqueConstraint(fields=('name', 'size', 'digest'), name='unique_file_name_size_digest'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.30 on 2026-10-18 18:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scidatacontainer_db', '0004_file_unique_file_name_size_digest'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='file',
+            name='content_pending',
+            field=models.BooleanField(default=False, help_text='Flag for JSON files whose content has not been extracted yet'),
+        ),
+        migrations.AlterField(
+            model_name='file',
+            name='digest',
+            field=models.CharField(blank=True, default='', help_text="SHA-256 digest of the JSON content. Empty for files without content, 'crc32:<CRC-32>' or 'container:<UUID>' for JSON files whose content is pending.", max_length=128),
+        ),
+    ]
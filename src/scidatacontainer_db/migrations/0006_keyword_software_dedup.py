@@ -0,0 +1,56 @@
+from django.db import migrations
+
+
+def _merge_duplicates(model, through, fk_name, fields):
+    """
+    Merge instances of model that share the same values of fields. The
+    relations in the through table are moved to the instance that is kept.
+    """
+    pk_name = model._meta.pk.name
+    keep = {}
+    duplicates = []
+    for values in model.objects.order_by(pk_name)\
+                               .values_list(pk_name, *fields):
+        key = values[1:]
+        if key in keep:
+            duplicates.append((values[0], keep[key]))
+        else:
+            keep[key] = values[0]
+
+    for pk, target in duplicates:
+        linked = set(through.objects.filter(**{fk_name: target})
+                     .values_list("dataset_id", flat=True))
+        for rel in through.objects.filter(**{fk_name: pk}):
+            if rel.dataset_id in linked:
+                rel.delete()
+            else:
+                setattr(rel, fk_name, target)
+                rel.save()
+                linked.add(rel.dataset_id)
+        model.objects.filter(pk=pk).delete()
+
+
+def merge_duplicates(apps, schema_editor):
+    """
+    Merge duplicated keywords and software packages, so that the unique
+    constraints can be added.
+    """
+    DataSet = apps.get_model("scidatacontainer_db", "DataSet")
+    Keyword = apps.get_model("scidatacontainer_db", "Keyword")
+    Software = apps.get_model("scidatacontainer_db", "Software")
+
+    _merge_duplicates(Keyword, DataSet.keywords.through, "keyword_id",
+                      ["name"])
+    _merge_duplicates(Software, DataSet.used_software.through, "software_id",
+                      ["name", "version", "id", "id_type"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scidatacontainer_db', '0005_file_content_pending'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicates, migrations.RunPython.noop),
+    ]
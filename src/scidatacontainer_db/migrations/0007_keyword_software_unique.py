@@ -0,0 +1,21 @@
+# Generated by Django 4.2.30 on 2026-10-18 18:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scidatacontainer_db', '0006_keyword_software_dedup'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='keyword',
+            constraint=models.UniqueConstraint(fields=('name',), name='unique_keyword_name'),
+        ),
+        migrations.AddConstraint(
+            model_name='software',
+            constraint=models.UniqueConstraint(fields=('name', 'version', 'id', 'id_type'), name='unique_software'),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 4.2.30 on 2026-10-18 18:24
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('scidatacontainer_db', '0007_keyword_software_unique'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IngestJob',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, help_text='UUID primary key', primary_key=True, serialize=False)),
+                ('name', models.CharField(blank=True, default='', help_text='Name of the uploaded file', max_length=256)),
+                ('staged_path', models.CharField(help_text='File path of the staged upload', max_length=512)),
+                ('state', models.CharField(choices=[('queued', 'Queued'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], default='queued', help_text='Processing state of the job', max_length=16)),
+                ('worker', models.CharField(blank=True, default='', help_text='Worker that processes the job', max_length=256)),
+                ('created', models.DateTimeField(auto_now_add=True, help_text='Datetime of the upload')),
+                ('started', models.DateTimeField(blank=True, help_text='Datetime the parsing started', null=True)),
+                ('finished', models.DateTimeField(blank=True, help_text='Datetime the parsing finished', null=True)),
+                ('status_code', models.IntegerField(blank=True, help_text='HTTP status code a synchronous upload would have returned', null=True)),
+                ('error', models.JSONField(blank=True, help_text='Payload of the MetaDBError raised while parsing', null=True)),
+                ('dataset', models.ForeignKey(blank=True, help_text='Created or affected dataset', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='ingest_jobs', to='scidatacontainer_db.dataset')),
+                ('owner', models.ForeignKey(help_text='User who uploaded the container', on_delete=django.db.models.deletion.CASCADE, related_name='ingest_jobs', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['state', 'created'], name='scidatacont_state_259f1c_idx')],
+            },
+        ),
+    ]
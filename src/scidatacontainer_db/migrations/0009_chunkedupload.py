@@ -0,0 +1,30 @@
+# Generated by Django 4.2.30 on 2026-10-18 18:25
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('scidatacontainer_db', '0008_ingestjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChunkedUpload',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, help_text='UUID primary key', primary_key=True, serialize=False)),
+                ('name', models.CharField(blank=True, default='', help_text='Name of the uploaded file', max_length=256)),
+                ('size', models.BigIntegerField(blank=True, help_text='Announced size of the container in bytes', null=True)),
+                ('offset', models.BigIntegerField(default=0, help_text='Number of bytes received')),
+                ('staged_path', models.CharField(help_text='File path of the staged upload', max_length=512)),
+                ('created', models.DateTimeField(auto_now_add=True, help_text='Datetime the upload was initiated')),
+                ('updated', models.DateTimeField(auto_now=True, help_text='Datetime the last chunk was received')),
+                ('owner', models.ForeignKey(help_text='User who uploads the container', on_delete=django.db.models.deletion.CASCADE, related_name='chunked_uploads', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-18 18:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scidatacontainer_db', '0009_chunkedupload'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='dataset',
+            name='hash',
+            field=models.CharField(blank=True, db_index=True, help_text='Hash of the container', max_length=256, null=True),
+        ),
+    ]
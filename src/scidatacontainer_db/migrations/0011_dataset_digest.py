@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-18 18:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scidatacontainer_db', '0010_dataset_hash_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dataset',
+            name='digest',
+            field=models.CharField(blank=True, db_index=True, help_text='SHA-256 digest of the stored container file', max_length=64, null=True),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.30 on 2026-10-18 19:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scidatacontainer_db', '0011_dataset_digest'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chunkedupload',
+            name='digest',
+            field=models.CharField(blank=True, help_text='SHA-256 digest of the assembled container', max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name='ingestjob',
+            name='digest',
+            field=models.CharField(blank=True, help_text='SHA-256 digest of the staged upload', max_length=64, null=True),
+        ),
+    ]
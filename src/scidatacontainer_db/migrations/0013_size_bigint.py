@@ -0,0 +1,23 @@
+# Generated by Django 4.2.30 on 2026-10-18 19:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scidatacontainer_db', '0012_upload_digests'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='dataset',
+            name='size',
+            field=models.BigIntegerField(help_text='Size of the dataset in bytes'),
+        ),
+        migrations.AlterField(
+            model_name='file',
+            name='size',
+            field=models.BigIntegerField(help_text='File size in bytes'),
+        ),
+    ]
@@ -1,18 +1,98 @@
-from django.db import models
+from django.db import connection, models, transaction
+from django.db.models.signals import post_delete, post_migrate, pre_save
+from django.dispatch import receiver
 from django.contrib.auth.models import User, Group
 
+import hashlib
+import json
 import uuid
+import zipfile
+
+import h5py
 
 from guardian.models import UserObjectPermissionBase, GroupObjectPermissionBase
 from guardian.shortcuts import get_users_with_perms, get_groups_with_perms
 
+from . import cache
 from .utils import MetaDBError
 
 
+def _lookup(model, objs, fields):
+    """
+    Find the saved instances matching a list of unsaved instances by the
+    values of fields. The lookup is a single query, split into chunks only if
+    the database limits the number of query parameters.
+
+    :return: Dictionary of saved instances keyed by the tuple of field values.
+    """
+    max_params = connection.features.max_query_params
+    if max_params:
+        chunk_size = max(1, max_params // len(fields))
+    else:
+        chunk_size = max(1, len(objs))
+
+    existing = {}
+    for i in range(0, len(objs), chunk_size):
+        chunk = objs[i:i + chunk_size]
+        q = model.objects.filter(**{f + "__in": {getattr(o, f) for o in chunk}
+                                    for f in fields})
+        for obj in q:
+            existing[tuple(getattr(obj, f) for f in fields)] = obj
+    return existing
+
+
+def _bulk_get_or_create(model, objs, fields, lookup_cache=None):
+    """
+    Replace a list of unsaved instances by saved ones. The fields have to be
+    covered by a unique constraint of the model.
+
+    Existing instances are looked up with one query and all missing ones are
+    inserted with one bulk_create. Rows inserted concurrently by another
+    upload are ignored on insert, therefore the new instances are fetched
+    again afterwards.
+
+    :param model: Model class.
+    :param objs: List of unsaved instances.
+    :param fields: List of field names identifying an instance.
+    :param lookup_cache: Optional cache that is asked before the database,
+    see :class:`scidatacontainer_db.cache.LookupCache`.
+
+    :return: List of saved instances in the order of objs.
+    """
+    def key(obj):
+        return tuple(getattr(obj, f) for f in fields)
+
+    existing = {}
+    if lookup_cache is not None:
+        existing = lookup_cache.get_many([key(o) for o in objs])
+    missing = [o for o in objs if key(o) not in existing]
+
+    if missing:
+        found = _lookup(model, missing, fields)
+        new = list({key(o): o for o in missing
+                    if key(o) not in found}.values())
+        if new:
+            model.objects.bulk_create(new, ignore_conflicts=True)
+            found.update(_lookup(model, new, fields))
+        if lookup_cache is not None:
+            lookup_cache.put_many(found)
+        existing.update(found)
+
+    return [existing[key(o)] for o in objs]
+
+
 class Keyword(models.Model):
     """
     Model to represent a Keyword of a DataSet.
     """
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["name"],
+                                    name="unique_keyword_name"),
+        ]
+
+    LOOKUP_FIELDS = ["name"]
+
     id = models.UUIDField(primary_key=True,
                           default=uuid.uuid4,
                           editable=False,
@@ -23,11 +103,30 @@ class Keyword(models.Model):
     def __str__(self):
         return self.name
 
+    @classmethod
+    def bulk_get_or_create(cls, names):
+        """
+        Convert a list of keyword strings into a list of
+        :model:`scidatacontainer_db.Keyword` instances. All keywords are
+        resolved with one lookup query and one bulk insert.
+        """
+        return _bulk_get_or_create(cls, [cls(name=n) for n in names],
+                                   cls.LOOKUP_FIELDS, cache.keywords)
+
 
 class Software(models.Model):
     """
     Model to represent a Software package used in a dataset.
     """
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["name", "version", "id",
+                                            "id_type"],
+                                    name="unique_software"),
+        ]
+
+    LOOKUP_FIELDS = ["name", "version", "id", "id_type"]
+
     dbid = models.UUIDField(primary_key=True,
                             default=uuid.uuid4,
                             editable=False,
@@ -42,10 +141,11 @@ class Software(models.Model):
                                help_text="Type of the given identifier")
 
     @classmethod
-    def to_Software(cls, pt):
+    def _kwargs_from_dict(cls, pt):
         """
-        Convert a dictionary as found in a ZDC container into a
-        :model:`scidatacontainer_db.Software` instance.
+        Validate a dictionary as found in a ZDC container and convert it into
+        the keyword arguments of a :model:`scidatacontainer_db.Software`
+        instance.
         """
         assert isinstance(pt, dict)
         assert "name" in pt, "usedSoftware requires name attribute."
@@ -60,28 +160,172 @@ class Software(models.Model):
             id = ""
             id_type = ""
 
-        obj, _ = cls.objects.get_or_create(name=pt["name"],
-                                           version=pt["version"],
-                                           id=id, id_type=id_type)
+        return {"name": pt["name"], "version": pt["version"],
+                "id": id, "id_type": id_type}
+
+    @classmethod
+    def to_Software(cls, pt):
+        """
+        Convert a dictionary as found in a ZDC container into a
+        :model:`scidatacontainer_db.Software` instance.
+        """
+        obj, _ = cls.objects.get_or_create(**cls._kwargs_from_dict(pt))
         return obj
 
+    @classmethod
+    def bulk_get_or_create(cls, pts):
+        """
+        Convert a list of dictionaries as found in a ZDC container into a
+        list of :model:`scidatacontainer_db.Software` instances. All entries
+        are resolved with one lookup query and one bulk insert.
+        """
+        return _bulk_get_or_create(cls,
+                                   [cls(**cls._kwargs_from_dict(pt))
+                                    for pt in pts],
+                                   cls.LOOKUP_FIELDS, cache.softwares)
+
 
 class File(models.Model):
     """
     Model to represent a File from the content of a dataset.
     If the file is a JSON file, the content will be saved, too.
+
+    Files are deduplicated by name, size and a digest of their content. The
+    digest is indexed together with name and size, so that the lookup of an
+    existing file never compares the JSON content itself.
+
+    JSON files exceeding the configured size limit are registered without
+    their content. For these files content_pending is set, the CRC-32 of the
+    .ZIP member or the UUID of the HDF5 container serves as preliminary
+    digest and the content is extracted later by :meth:`extract_content`.
     """
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["name", "size", "digest"],
+                                    name="unique_file_name_size_digest"),
+        ]
+
     id = models.UUIDField(primary_key=True,
                           default=uuid.uuid4,
                           editable=False,
                           help_text="UUID primary key")
     name = models.CharField(max_length=256,
                             help_text="File name inside the ZDC dataset")
-    size = models.IntegerField(help_text="File size in bytes")
+    size = models.BigIntegerField(help_text="File size in bytes")
     content = models.JSONField(null=True,
                                blank=True,
                                help_text="Dictionary containing the content " +
                                          "of a JSON file")
+    digest = models.CharField(max_length=128,
+                              blank=True,
+                              default="",
+                              help_text="SHA-256 digest of the JSON " +
+                                        "content. Empty for files without " +
+                                        "content, 'crc32:<CRC-32>' or " +
+                                        "'container:<UUID>' for JSON " +
+                                        "files whose content is pending.")
+    content_pending = models.BooleanField(default=False,
+                                          help_text="Flag for JSON files " +
+                                                    "whose content has not " +
+                                                    "been extracted yet")
+
+    @staticmethod
+    def compute_digest(content) -> str:
+        """
+        Return the SHA-256 hex digest of the canonical JSON representation of
+        the content or an empty string if there is no content.
+        """
+        if content is None:
+            return ""
+        s = json.dumps(content, sort_keys=True, separators=(",", ":"))
+        return hashlib.sha256(s.encode("utf-8")).hexdigest()
+
+    def save(self, *args, **kwargs):
+        if not self.digest:
+            self.digest = File.compute_digest(self.content)
+        super().save(*args, **kwargs)
+
+    @classmethod
+    def bulk_get_or_create(cls, records):
+        """
+        Convert a list of dictionaries with the keys "name", "size" and
+        "content" into a list of :model:`scidatacontainer_db.File` instances.
+        A precomputed "digest" may be passed along, otherwise it is computed
+        once per record. The optional key "content_pending" marks files whose
+        content is extracted later.
+
+        Existing files are looked up by the (name, size, digest) index with a
+        single query (split into chunks only if the database limits the number
+        of query parameters). All missing files are inserted with one
+        bulk_create. Rows inserted concurrently by another upload are ignored
+        on insert and fetched afterwards.
+        """
+        files = []
+        for r in records:
+            digest = r.get("digest", None)
+            if digest is None:
+                digest = cls.compute_digest(r["content"])
+            files.append(cls(name=r["name"], size=r["size"],
+                             content=r["content"], digest=digest,
+                             content_pending=r.get("content_pending", False)))
+
+        return _bulk_get_or_create(cls, files, ["name", "size", "digest"])
+
+    def _merge_duplicates(self, digest: str):
+        """
+        Link the datasets including another file with the same name, size and
+        digest to this file and delete the other file.
+        """
+        through = DataSet.content.through
+        for other in File.objects.filter(name=self.name, size=self.size,
+                                         digest=digest)\
+                                 .exclude(pk=self.pk):
+            linked = through.objects.filter(file_id=self.pk)\
+                                    .values_list("dataset_id", flat=True)
+            through.objects.filter(file_id=other.pk)\
+                           .exclude(dataset_id__in=linked)\
+                           .update(file_id=self.pk)
+            other.delete()
+
+    def extract_content(self):
+        """
+        Extract the content of a file registered with content_pending from
+        the stored container of any dataset that includes it and save it.
+        The preliminary digest is replaced by the SHA-256 digest of the
+        content. If a file with the same name, size and content already
+        exists, it is merged into this one.
+
+        :return: The content or None if no stored container could be read.
+        """
+        if not self.content_pending:
+            return self.content
+
+        paths = self.included_in.exclude(server_path=None)\
+                                .values_list("server_path", flat=True)
+        for path in paths:
+            try:
+                if h5py.is_hdf5(path):
+                    with h5py.File(path, "r") as h5file:
+                        content = json.loads(h5file[self.name][()])
+                else:
+                    with zipfile.ZipFile(path, 'r') as zfile:
+                        with zfile.open(self.name) as json_file:
+                            content = json.load(json_file)
+            except (OSError, KeyError, TypeError, ValueError,
+                    zipfile.BadZipFile):
+                continue
+
+            digest = File.compute_digest(content)
+            with transaction.atomic():
+                self._merge_duplicates(digest)
+                File.objects.filter(pk=self.pk).update(content=content,
+                                                       digest=digest,
+                                                       content_pending=False)
+            self.content = content
+            self.digest = digest
+            self.content_pending = False
+            return content
+        return None
 
 
 class ContainerType(models.Model):
@@ -103,6 +347,8 @@ class ContainerType(models.Model):
                                blank=True,
                                help_text="Version of the container type")
 
+    LOOKUP_FIELDS = ["name", "id", "version"]
+
     def __str__(self):
         if self.version:
             return self.name + ", v" + self.version
@@ -115,8 +361,7 @@ class ContainerType(models.Model):
         :model:`scidatacontainer_db.ContainerType` instance.
         """
         if isinstance(pt, str):
-            obj, _ = cls.objects.get_or_create(name=pt, id=None, version=None)
-            return obj
+            key = (pt, None, None)
         else:
             assert isinstance(pt, dict), "ContainerType needs to be a " +\
                                          "string (name) or a dictionary."
@@ -126,12 +371,14 @@ class ContainerType(models.Model):
                 assert "version" in pt, "ContainerType requires version" +\
                                         "attribute if id is given"
 
-            id = pt.get("id", None)
-            version = pt.get("version", None)
-            obj, _ = cls.objects.get_or_create(name=pt["name"],
-                                               id=id,
-                                               version=version)
-            return obj
+            key = (pt["name"], pt.get("id", None), pt.get("version", None))
+
+        obj = cache.container_types.get(key)
+        if obj is None:
+            obj, _ = cls.objects.get_or_create(**dict(zip(cls.LOOKUP_FIELDS,
+                                                          key)))
+            cache.container_types.put(key, obj)
+        return obj
 
 
 class DataSetBase(models.Model):
@@ -237,7 +484,7 @@ class DataSet(DataSetBase):
                                             help_text="Comment to describe " +
                                                       "why this dataset is " +
                                                       "invalid")
-    size = models.IntegerField(help_text="Size of the dataset in bytes")
+    size = models.BigIntegerField(help_text="Size of the dataset in bytes")
     server_path = models.CharField(max_length=512,
                                    null=True,
                                    blank=True,
@@ -259,7 +506,14 @@ class DataSet(DataSetBase):
     hash = models.CharField(max_length=256,
                             null=True,
                             blank=True,
+                            db_index=True,
                             help_text="Hash of the container")
+    digest = models.CharField(max_length=64,
+                              null=True,
+                              blank=True,
+                              db_index=True,
+                              help_text="SHA-256 digest of the stored " +
+                                        "container file")
     used_software = models.ManyToManyField(Software,
                                            related_name="used_by",
                                            blank=True,
@@ -324,14 +578,29 @@ class DataSet(DataSetBase):
                       if "change_dataset" in p]
         return Group.objects.filter(name__in=groupnames)
 
-    def update_attributes(self, d, user):
+    def _set_content(self, files):
         """
-        Update a :model:`scidatacontainer_db.DataSet` instance with the
-        information in the dictionary d. It first ensures that the user is the
-        owner of the DataSet.
+        Replace the files included in this dataset. The relations are written
+        with a single bulk insert into the through table instead of .set().
+        """
+        through = DataSet.content.through
+        through.objects.filter(dataset_id=self.pk).delete()
+        file_ids = dict.fromkeys(f.pk for f in files)
+        through.objects.bulk_create([through(dataset_id=self.pk, file_id=i)
+                                     for i in file_ids])
+
+    def check_update(self, d, user):
+        """
+        Ensure that the user may update the
+        :model:`scidatacontainer_db.DataSet` instance with the information
+        in the dictionary d. Only the keys "static", "hash" and
+        "storage_time" of d are evaluated, so the check can run before the
+        related objects are created.
+
+        :raises scidatacontainer_db.MetaDBError: If the update is not allowed.
         """
-        if (not user.has_perm("change_dataset", self)) and\
-                (self.owner != user):
+        if self.owner_id != user.id and\
+                not user.has_perm("change_dataset", self):
             raise MetaDBError(
                 {"error_code": 403,
                  "msg": "You don't have permission to update this dataset."})
@@ -366,15 +635,24 @@ class DataSet(DataSetBase):
                                           " newer than the file you tried " +
                                           "to upload."})
 
+    def update_attributes(self, d, user, check=True):
+        """
+        Update a :model:`scidatacontainer_db.DataSet` instance with the
+        information in the dictionary d. It first ensures that the user is the
+        owner of the DataSet.
+
+        :param check: Run self.check_update(). It can be skipped if it
+        already passed for the same values.
+        """
+        if check:
+            self.check_update(d, user)
+
         self.valid = True
         _keys = []
         for key, value in d.items():
             if key == "replaces":
                 continue
-            else:
-                fieldtype = DataSet._meta.get_field(key).get_internal_type()
-
-            if fieldtype == "ManyToManyField":
+            elif key in DATASET_M2M_FIELDS:
                 # has to be set after save()
                 _keys.append(key)
             else:
@@ -388,12 +666,21 @@ class DataSet(DataSetBase):
         for key in _keys:
             value = d[key]
             if value and value != []:
-                exec("self." + key + ".set(value)")
+                if key == "content":
+                    self._set_content(value)
+                else:
+                    getattr(self, key).set(value)
 
         self.save()
         return self
 
 
+# Names of the many-to-many fields of a DataSet. They can only be assigned
+# after the instance was saved.
+DATASET_M2M_FIELDS = frozenset(f.name for f in
+                                DataSet._meta.local_many_to_many)
+
+
 def _dataset_class_selector(self, obj):
     """
     Takes a :model:`scidatacontainer_db.DataSetBase` object and returns the
@@ -409,6 +696,160 @@ def _dataset_class_selector(self, obj):
 DataSetBase._dataset_class_selector = _dataset_class_selector
 
 
+class IngestJob(models.Model):
+    """
+    Model to represent a staged container upload that is parsed
+    asynchronously by the ingest worker.
+    """
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    STATES = [(QUEUED, "Queued"),
+              (RUNNING, "Running"),
+              (DONE, "Done"),
+              (FAILED, "Failed"),
+              ]
+
+    class Meta:
+        indexes = [models.Index(fields=["state", "created"])]
+
+    id = models.UUIDField(primary_key=True,
+                          default=uuid.uuid4,
+                          editable=False,
+                          help_text="UUID primary key")
+    owner = models.ForeignKey(User, on_delete=models.CASCADE,
+                              related_name="ingest_jobs",
+                              help_text="User who uploaded the container")
+    name = models.CharField(max_length=256,
+                            blank=True,
+                            default="",
+                            help_text="Name of the uploaded file")
+    staged_path = models.CharField(max_length=512,
+                                   help_text="File path of the staged " +
+                                             "upload")
+    digest = models.CharField(max_length=64,
+                              null=True,
+                              blank=True,
+                              help_text="SHA-256 digest of the staged " +
+                                        "upload")
+    state = models.CharField(max_length=16,
+                             choices=STATES,
+                             default=QUEUED,
+                             help_text="Processing state of the job")
+    worker = models.CharField(max_length=256,
+                              blank=True,
+                              default="",
+                              help_text="Worker that processes the job")
+    created = models.DateTimeField(auto_now_add=True,
+                                   help_text="Datetime of the upload")
+    started = models.DateTimeField(null=True,
+                                   blank=True,
+                                   help_text="Datetime the parsing started")
+    finished = models.DateTimeField(null=True,
+                                    blank=True,
+                                    help_text="Datetime the parsing finished")
+    status_code = models.IntegerField(null=True,
+                                      blank=True,
+                                      help_text="HTTP status code a " +
+                                                "synchronous upload would " +
+                                                "have returned")
+    error = models.JSONField(null=True,
+                             blank=True,
+                             help_text="Payload of the MetaDBError raised " +
+                                       "while parsing")
+    dataset = models.ForeignKey(DataSet, on_delete=models.SET_NULL,
+                                null=True,
+                                blank=True,
+                                related_name="ingest_jobs",
+                                help_text="Created or affected dataset")
+
+    def __str__(self):
+        return str(self.id) + " (" + self.state + ")"
+
+
+class ChunkedUpload(models.Model):
+    """
+    Model to represent a resumable upload of a container that is sent in
+    several chunks and assembled in the staging directory.
+    """
+    id = models.UUIDField(primary_key=True,
+                          default=uuid.uuid4,
+                          editable=False,
+                          help_text="UUID primary key")
+    owner = models.ForeignKey(User, on_delete=models.CASCADE,
+                              related_name="chunked_uploads",
+                              help_text="User who uploads the container")
+    name = models.CharField(max_length=256,
+                            blank=True,
+                            default="",
+                            help_text="Name of the uploaded file")
+    size = models.BigIntegerField(null=True,
+                                  blank=True,
+                                  help_text="Announced size of the " +
+                                            "container in bytes")
+    offset = models.BigIntegerField(default=0,
+                                    help_text="Number of bytes received")
+    staged_path = models.CharField(max_length=512,
+                                   help_text="File path of the staged " +
+                                             "upload")
+    digest = models.CharField(max_length=64,
+                              null=True,
+                              blank=True,
+                              help_text="SHA-256 digest of the assembled " +
+                                        "container")
+    created = models.DateTimeField(auto_now_add=True,
+                                   help_text="Datetime the upload was " +
+                                             "initiated")
+    updated = models.DateTimeField(auto_now=True,
+                                   help_text="Datetime the last chunk was " +
+                                             "received")
+
+    def __str__(self):
+        return str(self.id) + " (" + str(self.offset) + " bytes)"
+
+
+LOOKUP_CACHE_MODELS = {Keyword: cache.keywords,
+                       Software: cache.softwares,
+                       ContainerType: cache.container_types,
+                       }
+
+
+def _lookup_key(instance) -> tuple:
+    return tuple(getattr(instance, f) for f in instance.LOOKUP_FIELDS)
+
+
+@receiver(pre_save, sender=Keyword)
+@receiver(pre_save, sender=Software)
+@receiver(pre_save, sender=ContainerType)
+def _invalidate_lookup_cache_on_save(sender, instance, **kwargs):
+    """
+    Drop the cache entry of a lookup table row before it is changed. The
+    stored values are fetched, since the key itself might be changed.
+    """
+    if instance._state.adding:
+        return
+    old = sender.objects.filter(pk=instance.pk).first()
+    if old is not None:
+        LOOKUP_CACHE_MODELS[sender].invalidate(_lookup_key(old))
+
+
+@receiver(post_delete, sender=Keyword)
+@receiver(post_delete, sender=Software)
+@receiver(post_delete, sender=ContainerType)
+def _invalidate_lookup_cache_on_delete(sender, instance, **kwargs):
+    LOOKUP_CACHE_MODELS[sender].invalidate(_lookup_key(instance))
+
+
+@receiver(post_migrate)
+def _clear_lookup_caches(sender, **kwargs):
+    """
+    Tables are flushed without deleting single rows, e.g. by the flush
+    command, which emits post_migrate afterwards.
+    """
+    cache.clear()
+
+
 """
 Classes to make permission checks faster:
 https://django-guardian.readthedocs.io/en/stable/userguide/performance.html
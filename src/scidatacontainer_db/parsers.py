@@ -1,29 +1,38 @@
 from django.conf import settings
 from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError
-from django.db import transaction
+from django.db import connection, connections, transaction
 from django.db.utils import IntegrityError
 
 from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
 import datetime
 import json
 import os.path
 import re
+import struct
+import threading
 from typing import List
 from uuid import uuid4
 import zipfile
 
-import magic
+import h5py
+import numpy
 from packaging import version
 import iso8601
 
+from . import filetypes
+from .filetypes import detect_file_type
+from .storage import placement_root, promote, server_path_for,\
+                     staged_root
 from .utils import MetaDBError
 from .models import ContainerType, DataSet, DataSetBase, File, Keyword,\
                     Software
 from .serializers import DataSetSerializer
 
-from scidatacontainer.jsonschema import validate, meta, content
+from scidatacontainer.jsonschema import content, meta, validate
 from jsonschema.exceptions import ValidationError as jsonschemaValidationError
+from jsonschema.validators import Draft202012Validator, validator_for
 
 
 def _datetime_parser(datetime_str: str) -> datetime.datetime:
@@ -46,7 +55,7 @@ def _used_software_parser(used_software_list: List[dict]) -> List[Software]:
 
     :return: List of Software objects.
     """
-    return [Software.to_Software(entry) for entry in used_software_list]
+    return Software.bulk_get_or_create(used_software_list)
 
 
 def _replaces_parser(replaces: str) -> DataSet:
@@ -82,7 +91,7 @@ def _keyword_parser(keywords: List[str]) -> List[Keyword]:
 
     :return: List of Keyword obects.
     """
-    return [Keyword.objects.get_or_create(name=entry)[0] for entry in keywords]
+    return Keyword.bulk_get_or_create(keywords)
 
 
 def parsers_from_jsonschema(schema):
@@ -126,6 +135,87 @@ def parsers_from_jsonschema(schema):
 
 MIN_SUPPORTED_VERSION = min([version.parse(k) for k in content.keys()])
 
+# Process-wide cache of the schema work required per model version. It maps
+# the model version string of a container to a dictionary with the resolved
+# "schema", the compiled "validators", the "parsers" and the field "plan" for
+# meta and content.
+_SCHEMA_CACHE = {}
+
+
+def field_plan(parsers: dict) -> list:
+    """
+    Convert a parser dictionary into a list of tuples
+    (key, attribute, parser). The attribute is the snake_case name of the
+    DataSet attribute for the camelCase key.
+
+    :param parsers: Dictionary of parsers as returned by
+    parsers_from_jsonschema.
+
+    :return: List of tuples.
+    """
+    plan = []
+    for key, parser in parsers.items():
+        attr = re.sub(r'(?<!^)(?=[A-Z])', '_', key).lower()
+        plan.append((key, attr, parser))
+    return plan
+
+
+def _compile_validator(schema: dict):
+    """
+    Create a jsonschema validator with format checker for a schema.
+    """
+    cls = validator_for(schema)
+    return cls(schema, format_checker=Draft202012Validator.FORMAT_CHECKER)
+
+
+def get_model_version_schemas(model_version: str) -> dict:
+    """
+    Return the cached schemas, compiled validators and parsers for a model
+    version. They are computed on first use and shared by all following
+    uploads of the same model version.
+
+    :param model_version: Model version string as found in content.json.
+
+    :return: Dictionary with the keys "schema", "validators", "parsers" and
+    "plan". Each value is a dictionary with the keys "meta" and "content".
+    """
+    entry = _SCHEMA_CACHE.get(model_version, None)
+    if entry is not None:
+        return entry
+
+    v = version.parse(model_version)
+    c_key = (max([k for k in content.keys() if version.parse(k) <= v]))
+    m_key = (max([k for k in meta.keys() if version.parse(k) <= v]))
+    schema = {"meta": meta[m_key], "content": content[c_key]}
+    parsers = {k: parsers_from_jsonschema(v) for k, v in schema.items()}
+
+    entry = {"schema": schema,
+             "validators": {k: _compile_validator(v)
+                            for k, v in schema.items()},
+             "parsers": parsers,
+             "plan": {k: field_plan(v) for k, v in parsers.items()},
+             }
+    _SCHEMA_CACHE[model_version] = entry
+    return entry
+
+
+def warm_schema_cache():
+    """
+    Fill the schema cache for all model versions shipped with the
+    scidatacontainer package, so that uploads don't do any schema work.
+    """
+    for model_version in content.keys():
+        if version.parse(model_version) < MIN_SUPPORTED_VERSION:
+            continue  # pragma: no cover
+        try:
+            get_model_version_schemas(model_version)
+        except MetaDBError:  # pragma: no cover
+            # unsupported schema, the error is raised again during upload
+            pass
+
+# Default size limit in bytes for JSON files whose content is stored inline.
+JSON_CONTENT_MAX_SIZE = 16 * 1024 * 1024
+
 class BaseParser(ABC):
     """
     Base class for file format specific parsers. Parsers should inherit
@@ -164,12 +254,7 @@ class BaseParser(ABC):
         :return: schema dictionary.
         """
         self._ensure_version_is_supported()
-
-        v = version.parse(self.model_version)
-        c_key = (max([k for k in content.keys() if version.parse(k) <= v]))
-        m_key = (max([k for k in meta.keys() if version.parse(k) <= v]))
-
-        return {"meta": meta[m_key], "content": content[c_key]}
+        return get_model_version_schemas(self.model_version)["schema"]
 
     @property
     def parsers(self) -> dict:
@@ -178,7 +263,25 @@ class BaseParser(ABC):
 
         :return: parser dictionary.
         """
-        return {k: parsers_from_jsonschema(v) for k, v in self.schema.items()}
+        self._ensure_version_is_supported()
+        return get_model_version_schemas(self.model_version)["parsers"]
+
+    def _open_container(self):
+        """
+        Open the container file before any of the reading hooks is called.
+
+        File types that can share a single open handle between the hooks
+        overwrite this method. The default implementation does nothing.
+        """
+        pass
+
+    def _close_container(self):
+        """
+        Close the handle opened by self._open_container().
+
+        The default implementation does nothing.
+        """
+        pass
 
     @abstractmethod
     def _read_content_json(self):  # pragma: no cover
@@ -219,7 +322,7 @@ class BaseParser(ABC):
             self._read_content_json()
         self.model_version = self.content["modelVersion"]
 
-    def _parse_validate(self, filename: str, in_dict: dict) -> dict:
+    def _validate(self, filename: str, in_dict: dict):
         """
         Validate the content of a dictionary using the constraints for a
         specified file.
@@ -229,35 +332,42 @@ class BaseParser(ABC):
 
         :param in_dict: Dictionary read from file.
 
-        :raise scidatacontainer_db.MetaDBError: If a required item is not found
-        or an error occured during parsing.
-
-        :returns: Dictionary of validated and parsed values.
+        :raise scidatacontainer_db.MetaDBError: If the model version is not
+        supported or the dictionary is invalid.
         """
-
         if not self.model_version:
             self._read_model_version()
 
-        schema = self.schema[filename]
+        self._ensure_version_is_supported()
+        schemas = get_model_version_schemas(self.model_version)
 
+        if schemas["validators"][filename].is_valid(in_dict):
+            return
+        # only invalid dictionaries are validated again to get the user
+        # friendly error message of scidatacontainer
         try:
-            validate(instance=in_dict,
-                     check_format=True,
-                     translate=True,
-                     schema_name=filename,
-                     schema=schema,
-                     )
-
+            validate(in_dict, schemas["schema"][filename], filename)
         except jsonschemaValidationError as e:
             raise MetaDBError({"error_code": 400,
                                "msg": e.message})
 
-        parsers = self.parsers[filename]
+    def _parse_fields(self, filename: str, in_dict: dict,
+                      keys=None) -> dict:
+        """
+        Convert the values of a validated dictionary into model field values.
+        Parsers of related fields create the related objects in the DB.
+
+        :param filename: Name of the file. Either "meta" or "content".
+        :param in_dict: Dictionary read from file.
+        :param keys: Optional collection of the keys to parse. All keys are
+        parsed by default.
 
+        :returns: Dictionary of parsed values.
+        """
+        schemas = get_model_version_schemas(self.model_version)
         d = {}
-        for key, parser in parsers.items():
-            if key in in_dict:
-                name = re.sub(r'(?<!^)(?=[A-Z])', '_', key).lower()
+        for key, name, parser in schemas["plan"][filename]:
+            if key in in_dict and (keys is None or key in keys):
                 try:
                     # try parsing
                     d[name] = parser(in_dict[key])
@@ -272,6 +382,41 @@ class BaseParser(ABC):
                                        })
         return d
 
+    def _parse_validate(self, filename: str, in_dict: dict) -> dict:
+        """
+        Validate the content of a dictionary using the constraints for a
+        specified file and convert its values.
+
+        :param filename: Name of the file to validate. Either "meta" or
+        "content".
+
+        :param in_dict: Dictionary read from file.
+
+        :raise scidatacontainer_db.MetaDBError: If a required item is not found
+        or an error occured during parsing.
+
+        :returns: Dictionary of validated and parsed values.
+        """
+        self._validate(filename, in_dict)
+        return self._parse_fields(filename, in_dict)
+
+    def _check_update(self, user: User):
+        """
+        Ensure that the validated container may be stored before any member
+        is read or anything is written to the DB. The existing or new
+        DataSet is checked by
+        :meth:`scidatacontainer_db.models.DataSet.check_update`.
+
+        :raises scidatacontainer_db.MetaDBError: If the upload would be
+        rejected.
+        """
+        d = self._parse_fields("content", self.content,
+                               keys=["static", "hash", "storageTime"])
+        obj = DataSet.objects.filter(id=self.content["uuid"]).first()
+        if obj is None:
+            obj = DataSet(id=self.content["uuid"], owner=user)
+        obj.check_update(d, user)
+
     def _parse_test_data(self, uuid: str, metadata: dict, user: User):
         """
         Check the last characters of a test UUID and raise a corresponding
@@ -305,6 +450,48 @@ class BaseParser(ABC):
                                "delete": True,
                                "delete_replaced": True})
 
+    def _check_unchanged(self, user: User):
+        """
+        Detect the re-upload of a container that is already stored. This is
+        the case if a valid DataSet with the same UUID, storage time, hash,
+        size and digest exists. Uploads whose digest is unknown, e.g. because
+        they were not streamed into the staging directory, are always
+        parsed. It costs a single query and is done before any other file of
+        the container is read.
+
+        :raises scidatacontainer_db.MetaDBError: With status code 200 and the
+        stored DataSet if the container is unchanged, or 403 if the user is
+        not allowed to update it.
+        """
+        uuid = self.content.get("uuid", None)
+        size = getattr(self.filename, "size", None)
+        digest = getattr(self.filename, "sha256", None)
+        if not isinstance(uuid, str) or size is None or digest is None or \
+                uuid.startswith("00000000-0000-0000-0000-00000000"):
+            return
+        try:
+            storage_time = _datetime_parser(self.content["storageTime"])
+            obj = DataSet.objects.filter(id=uuid,
+                                         valid=True,
+                                         storage_time=storage_time,
+                                         hash=self.content.get("hash", None),
+                                         size=size,
+                                         digest=digest).first()
+        except (KeyError, TypeError, ValueError, ValidationError):
+            # malformed content.json, reported during validation
+            return
+        if obj is None:
+            return
+
+        if obj.owner_id != user.id and \
+                not user.has_perm("change_dataset", obj):
+            raise MetaDBError(
+                {"error_code": 403,
+                 "msg": "You don't have permission to update this dataset."})
+        raise MetaDBError({"error_code": 200,
+                           "msg": "Dataset is unchanged.",
+                           "object": obj})
+
     def parse(self, filename: str, user: User) -> DataSet:
         """
         Read the meta data from the file, validate it and store it in the DB.
@@ -314,16 +501,30 @@ class BaseParser(ABC):
         set ownership.
         """
         self.filename = filename
-        self._read_content_json()
-        self._read_meta_json()
-        self._read_filelist()
+        self.previous = None
+        self._open_container()
+        try:
+            # cheap checks first, members are only enumerated and written to
+            # the DB for uploads that will be accepted.
+            self._read_content_json()
+            self._check_unchanged(user)
+            self._read_meta_json()
+            self._validate("content", self.content)
+            self._validate("meta", self.meta)
+            is_test = self.content["uuid"].startswith(
+                    "00000000-0000-0000-0000-00000000")
+            if not is_test:
+                self._check_update(user)
+            self._read_filelist()
+        finally:
+            self._close_container()
         d = {"size": filename.size, "content": self.files}
-        d.update(self._parse_validate("content", self.content))
-        d.update(self._parse_validate("meta", self.meta))
+        d.update(self._parse_fields("content", self.content))
+        d.update(self._parse_fields("meta", self.meta))
 
         uuid = d["uuid"]
 
-        if uuid.startswith("00000000-0000-0000-0000-00000000"):
+        if is_test:
             # These UUIDs are reserved for testing.
             return self._parse_test_data(uuid, d, user)
 
@@ -332,7 +533,8 @@ class BaseParser(ABC):
             if len(DataSet.objects.filter(id=uuid)) != 0:
                 obj = DataSet.objects.get(id=uuid)
                 # existing dataset -> try to update
-                return obj.update_attributes(d, user)
+                self.previous = _snapshot_dataset(obj)
+                return obj.update_attributes(d, user, check=False)
             else:
                 obj = DataSetBase.objects.get(id=uuid)
                 # previously dataset only known by ID
@@ -342,116 +544,492 @@ class BaseParser(ABC):
         obj = DataSet(id=uuid)
         obj.owner = user
         obj.complete = False
-        return obj.update_attributes(d, user)
+        return obj.update_attributes(d, user, check=False)
 
 
 class ZipContainerParser(BaseParser):
     """
     Parser implementing the file type specific routines for .ZIP based
     containers.
+
+    The archive is opened once per parse. Its central directory is read a
+    single time and the ZipFile handle is shared by all reading hooks.
     """
+    def _open_container(self):
+        """
+        Open the .ZIP based container and store the handle to self.zfile.
+        """
+        self.zfile = zipfile.ZipFile(self.filename, 'r')
+
+    def _close_container(self):
+        """
+        Close the shared ZipFile handle.
+        """
+        self.zfile.close()
+
     def _read_content_json(self):
         """
         Read the content.json file inside a .ZIP based container.
         """
-        with zipfile.ZipFile(self.filename, 'r') as zfile:
-            with zfile.open("content.json") as content_json:
-                self.content = json.load(content_json)
+        with self.zfile.open("content.json") as content_json:
+            self.content = json.load(content_json)
 
     def _read_meta_json(self):
         """
         Read the meta.json file inside a .ZIP based container.
         """
-        with zipfile.ZipFile(self.filename, 'r') as zfile:
-            with zfile.open("meta.json") as meta_json:
-                self.meta = json.load(meta_json)
+        with self.zfile.open("meta.json") as meta_json:
+            self.meta = json.load(meta_json)
 
     def _read_filelist(self):
         """
         Create a list of File objects inside a .ZIP container and store it to
         self.files.
+
+        JSON files larger than SCIDATACONTAINER_JSON_CONTENT_MAX_SIZE are
+        registered without reading them. Their CRC-32 from the central
+        directory serves as digest and the content is extracted later.
         """
-        self.files = []
-        with zipfile.ZipFile(self.filename, 'r') as zfile:
-            for _filename in zfile.namelist():
-                size = zfile.getinfo(_filename).file_size
-                name = _filename
-                if _filename.endswith(".json"):
-                    with zfile.open(_filename) as json_file:
-                        data = json.load(json_file)
-                        file_obj, _ = File.objects.get_or_create(name=name,
-                                                                 size=size,
-                                                                 content=data,
-                                                                 )
-                else:
-                    file_obj, _ = File.objects.get_or_create(
-                                    name=_filename,
-                                    size=size,
-                                    )
-                file_obj.save()
+        max_size = getattr(settings, "SCIDATACONTAINER_JSON_CONTENT_MAX_SIZE",
+                           JSON_CONTENT_MAX_SIZE)
+        records = [self._member_record(info, max_size)
+                   for info in self.zfile.infolist()]
+        self.files = File.bulk_get_or_create(records)
+
+    def _member_record(self, info, max_size) -> dict:
+        """
+        Return the File record of a container member. JSON members up to
+        max_size bytes are read, larger ones are marked as pending.
+
+        :param info: ZipInfo of the member.
+        :param max_size: SCIDATACONTAINER_JSON_CONTENT_MAX_SIZE.
+        """
+        record = {"name": info.filename,
+                  "size": info.file_size,
+                  "content": None}
+        if info.filename.endswith(".json"):
+            if max_size is not None and info.file_size > max_size:
+                record["digest"] = "crc32:{:08x}".format(info.CRC)
+                record["content_pending"] = True
+            else:
+                with self.zfile.open(info) as json_file:
+                    record["content"] = json.load(json_file)
+        return record
+
+
+class SuppliedMetadataZipParser(ZipContainerParser):
+    """
+    Parser for .ZIP based containers whose content.json and meta.json are
+    sent by the client next to the container. The supplied dictionaries are
+    validated and registered before any member is read and the member list
+    is taken from the central directory. content.json and meta.json are
+    read to ensure they match the supplied dictionaries. Other JSON members
+    are treated like in :class:`ZipContainerParser`, i.e. only those larger
+    than SCIDATACONTAINER_JSON_CONTENT_MAX_SIZE are registered without their
+    content, which is extracted later.
+
+    The container itself is still staged completely before it is parsed.
+    """
+    def __init__(self, content: dict, meta: dict, items=None):
+        """
+        :param content: Supplied content.json.
+        :param meta: Supplied meta.json.
+        :param items: Optional list of the member names the client expects
+        in the container.
+        """
+        super().__init__()
+        self.supplied_content = content
+        self.supplied_meta = meta
+        self.items = items
 
-                self.files.append(file_obj)
+    def _read_content_json(self):
+        self.content = self.supplied_content
+
+    def _read_meta_json(self):
+        self.meta = self.supplied_meta
+
+    def _read_filelist(self):
+        """
+        Create the list of File objects from the central directory and
+        verify it against the supplied metadata.
+        """
+        infos = self.zfile.infolist()
+        names = [info.filename for info in infos]
+        if self.items is not None and sorted(self.items) != sorted(names):
+            raise MetaDBError({"error_code": 400,
+                               "msg": "The members of the container don't " +
+                                      "match the supplied items."})
+
+        max_size = getattr(settings, "SCIDATACONTAINER_JSON_CONTENT_MAX_SIZE",
+                           JSON_CONTENT_MAX_SIZE)
+        supplied = {"content.json": self.content, "meta.json": self.meta}
+        records = []
+        for info in infos:
+            if info.filename not in supplied:
+                records.append(self._member_record(info, max_size))
+                continue
+            with self.zfile.open(info) as json_file:
+                if json.load(json_file) != supplied[info.filename]:
+                    raise MetaDBError({"error_code": 400,
+                                       "msg": "The supplied " +
+                                              info.filename + " doesn't " +
+                                              "match the container."})
+            records.append({"name": info.filename,
+                            "size": info.file_size,
+                            "content": supplied.pop(info.filename)})
+
+        if supplied:
+            raise MetaDBError({"error_code": 400,
+                               "msg": "The container has no " +
+                                      " and no ".join(sorted(supplied)) +
+                                      "."})
+        self.files = File.bulk_get_or_create(records)
+
+
+def _hdf5_to_python(value):
+    """
+    Convert a value read from an HDF5 attribute or dataset into the
+    corresponding python object.
+    """
+    if isinstance(value, bytes):
+        return value.decode("utf-8")
+    if isinstance(value, (list, tuple)):
+        return [_hdf5_to_python(v) for v in value]
+    if isinstance(value, numpy.ndarray):
+        return _hdf5_to_python(value.tolist())
+    if isinstance(value, numpy.generic):
+        return value.item()
+    if isinstance(value, h5py.Empty):
+        return None
+    return value
+
+
+def _json_type(value) -> str:
+    """
+    Return the JSON schema type name of a python object.
+    """
+    if value is None:
+        return "null"
+    if isinstance(value, bool):
+        return "boolean"
+    if isinstance(value, int):
+        return "integer"
+    if isinstance(value, float):
+        return "number"
+    if isinstance(value, str):
+        return "string"
+    if isinstance(value, list):
+        return "array"
+    return "object"
 
 
 class Hdf5ContainerParser(BaseParser):
+    """
+    Parser implementing the file type specific routines for HDF5 based
+    containers.
+
+    content.json and meta.json are either stored as attributes of the objects
+    "content" and "meta" or as JSON strings in the scalar datasets
+    "content.json" and "meta.json". Attribute values that are not of a
+    native HDF5 type (e.g. objects, lists of objects or null) are stored as
+    JSON strings and decoded according to the JSON schema.
+
+    The member list is built from the object tree, only shapes and data types
+    are evaluated. Dataset payloads are never read, except for small JSON
+    string datasets, so the memory consumption does not depend on the size of
+    the container.
+    """
+    def _open_container(self):
+        """
+        Open the HDF5 based container and store the handle to self.h5file.
+        """
+        if hasattr(self.filename, "temporary_file_path"):
+            self.h5file = h5py.File(self.filename.temporary_file_path(), "r")
+        else:
+            self.filename.seek(0)
+            self.h5file = h5py.File(self.filename.file, "r")
+        self.from_attributes = set()
+
+    def _close_container(self):
+        """
+        Close the shared HDF5 file handle.
+        """
+        self.h5file.close()
+
+    def _read_json_object(self, name: str) -> dict:
+        """
+        Read the dictionary stored in the attributes of the object name or
+        in the JSON string dataset name.json. The names of objects read from
+        attributes are added to self.from_attributes.
+        """
+        if name in self.h5file:
+            self.from_attributes.add(name)
+            return {key: _hdf5_to_python(value)
+                    for key, value in self.h5file[name].attrs.items()}
+        if name + ".json" in self.h5file:
+            dset = self.h5file[name + ".json"]
+            return json.loads(_hdf5_to_python(dset[()]))
+        raise MetaDBError({"error_code": 400,
+                           "msg": "The HDF5 container has neither an " +
+                                  "object '" + name + "' nor a dataset '" +
+                                  name + ".json'."})
+
+    def _decode_attributes(self, in_dict: dict, filename: str):
+        """
+        Decode the JSON string values in a dictionary read from attributes
+        whose schema requires another type than string.
+        """
+        if filename not in self.from_attributes:
+            return
+        properties = self.schema[filename].get("properties", {})
+        for key, value in in_dict.items():
+            if not isinstance(value, str):
+                continue
+            types = properties.get(key, {}).get("type", [])
+            if isinstance(types, str):
+                types = [types]
+            if types == ["string"]:
+                continue
+            try:
+                decoded = json.loads(value)
+            except ValueError:
+                continue
+            t = _json_type(decoded)
+            if t == "string":
+                continue
+            if not types or t in types or \
+                    (t == "integer" and "number" in types):
+                in_dict[key] = decoded
 
     def _read_content_json(self):
-        raise MetaDBError({"error_code": 501,
-                           "msg": "The server does not support to parse hdf5" +
-                                  " files yet."
-                           }
-                          )
+        """
+        Read content.json from an HDF5 based container.
+        """
+        self.content = self._read_json_object("content")
+        self._read_model_version()
+        self._decode_attributes(self.content, "content")
 
-    def _read_meta_json(self):  # pragma: no cover
-        raise MetaDBError({"error_code": 501,
-                           "msg": "The server does not support to parse hdf5" +
-                                  " files yet."
-                           }
-                          )
+    def _read_meta_json(self):
+        """
+        Read meta.json from an HDF5 based container.
+        """
+        self.meta = self._read_json_object("meta")
+        self._decode_attributes(self.meta, "meta")
+
+    def _vlen_string_size(self, dset) -> int:
+        """
+        Return the length in bytes of a scalar variable length string
+        dataset without reading the string. The raw data of a contiguous
+        dataset is a reference into the global heap which starts with the
+        length as 4 byte little endian integer.
+
+        :return: The length or None if it can't be determined.
+        """
+        offset = dset.id.get_offset()
+        if offset is None:
+            return None
+        if hasattr(self.filename, "temporary_file_path"):
+            with open(self.filename.temporary_file_path(), "rb") as f:
+                f.seek(offset)
+                header = f.read(4)
+        else:
+            self.filename.file.seek(offset)
+            header = self.filename.file.read(4)
+        if len(header) < 4:
+            return None
+        return struct.unpack("<I", header)[0]
+
+    def _read_filelist(self):
+        """
+        Create a list of File objects from the datasets of an HDF5 container
+        and store it to self.files. The size of a dataset is computed from
+        its shape and data type.
+
+        content.json and meta.json are registered with their parsed content.
+        Other scalar string datasets whose name ends with .json are read and
+        their content is stored if it is not larger than
+        SCIDATACONTAINER_JSON_CONTENT_MAX_SIZE. The size is determined before
+        the string is read. Larger datasets are registered without reading
+        them and their content is extracted later.
+        """
+        max_size = getattr(settings, "SCIDATACONTAINER_JSON_CONTENT_MAX_SIZE",
+                           JSON_CONTENT_MAX_SIZE)
+        reserved = {"content", "meta", "content.json", "meta.json"}
+
+        records = []
+        for name, content in [("content.json", self.content),
+                              ("meta.json", self.meta)]:
+            records.append({"name": name,
+                            "size": len(json.dumps(content).encode("utf-8")),
+                            "content": content})
+
+        def visit(name, obj):
+            if name in reserved or not isinstance(obj, h5py.Dataset):
+                return
+            if obj.shape is None:
+                size = 0
+            else:
+                size = obj.dtype.itemsize * int(numpy.prod(obj.shape))
+            record = {"name": name, "size": size, "content": None}
+            if name.endswith(".json") and obj.shape == () and \
+                    obj.dtype.kind in "OS":
+                if obj.dtype.kind == "O":
+                    # variable length strings have no meaningful itemsize
+                    size = self._vlen_string_size(obj)
+                if size is None or \
+                        (max_size is not None and size > max_size):
+                    # the content is extracted later, the UUID of the
+                    # container keeps apart files with equal name and size
+                    record["size"] = size or 0
+                    record["digest"] = "container:" + self.content["uuid"]
+                    record["content_pending"] = True
+                else:
+                    value = obj[()]
+                    record["size"] = len(value)
+                    try:
+                        record["content"] = json.loads(
+                                _hdf5_to_python(value))
+                    except ValueError:
+                        pass
+            records.append(record)
+
+        self.h5file.visititems(visit)
+        self.files = File.bulk_get_or_create(records)
+
+
+def _snapshot_dataset(obj: DataSet) -> tuple:
+    """
+    Return the stored state of a DataSet, i.e. the values of its fields, its
+    many-to-many relations and the replaced DataSet, so that it can be
+    restored by :func:`_restore_dataset`.
+    """
+    fields = {f.attname: getattr(obj, f.attname)
+              for f in DataSet._meta.concrete_fields if not f.primary_key}
+    relations = {f.name: list(getattr(obj, f.name)
+                              .values_list("pk", flat=True))
+                 for f in DataSet._meta.many_to_many}
+    replaces = obj.replaces
+    return fields, relations, replaces.pk if replaces else None
+
+
+def _restore_dataset(obj: DataSet, snapshot: tuple):
+    """
+    Restore the state of an updated DataSet whose container could not be
+    stored.
+
+    :param snapshot: State returned by :func:`_snapshot_dataset` before the
+    update.
+    """
+    fields, relations, replaces = snapshot
+    with transaction.atomic():
+        DataSet.objects.filter(pk=obj.pk).update(**fields)
+        for name, pks in relations.items():
+            getattr(obj, name).set(pks)
+        DataSetBase.objects.filter(_replaced_by_field=obj.pk)\
+                           .exclude(pk=replaces)\
+                           .update(_replaced_by_field=None)
+        if replaces is not None:
+            DataSetBase.objects.filter(pk=replaces)\
+                               .update(_replaced_by_field=obj.pk)
+
+
+def _discard_dataset(obj: DataSet):
+    """
+    Delete a newly created DataSet whose container could not be stored. A
+    replacement relationship set by this DataSet is released first.
+    """
+    replaced = obj.replaces
+    if replaced:
+        replaced.replaced_by = None
+        replaced.save()
+    obj.delete()
 
-    def _read_filelist(self):  # pragma: no cover
-        raise MetaDBError({"error_code": 501,
-                           "msg": "The server does not support to parse hdf5" +
-                                  " files yet."
-                           }
-                          )
 
-def parse_container_file(filename, owner):
+def parse_container_file(filename, owner, content: dict = None,
+                         meta: dict = None, items: list = None):
     """
     Find the file type, read the meta data from the file,
     validate it and store it in the DB.
 
+    Only the meta data is written inside the database transaction. The
+    container file is moved to its final location after the transaction was
+    committed, so that no locks are held while writing large files. Uploads
+    streamed into the staging directory are already on disk at this point and
+    are only renamed. If the container can't be stored, a new DataSet is
+    deleted and an updated one is restored to its previous state. This
+    function should not be called inside an outer transaction.
+
     :param filename: Filename of the ZDC dataset.
     :param user: User sending the request to validate permissions and to
     set ownership.
+    :param content: content.json supplied by the client. It has to be given
+    together with meta and is only supported for ZIP containers, which are
+    parsed by :class:`SuppliedMetadataZipParser` then.
+    :param meta: meta.json supplied by the client.
+    :param items: Optional list of member names supplied by the client.
     """
     try:
-        with transaction.atomic():
-            filetype = magic.from_buffer(filename.open("rb").read(2048),
-                                         mime=True)
-            if filetype == "application/zip":
-                parser = ZipContainerParser()
-                obj = parser.parse(filename, owner)
-                #  obj == None for test uploads
-                if not obj:
-                    return
-                server_path = settings.MEDIA_ROOT + "/" + str(obj.id) + ".zdc"
-            elif filetype == "application/x-hdf5":
-                parser = Hdf5ContainerParser()
-                obj = parser.parse(filename, owner)
-                server_path = settings.MEDIA_ROOT + "/" + str(obj.id) + ".hdf5"
+        supplied = content is not None or meta is not None or \
+            items is not None
+        if supplied and (content is None or meta is None):
+            raise MetaDBError({"error_code": 400,
+                               "msg": "Supplied metadata requires both " +
+                                      "content and meta."})
+        filetype = detect_file_type(filename)
+        if filetype == filetypes.ZIP:
+            if supplied:
+                parser = SuppliedMetadataZipParser(content, meta, items)
             else:
-                raise MetaDBError({"error_code": 415,
-                                   "msg": "File format has to be hdf5 or zip!"
-                                   }
-                                  )
-            server_path = os.path.abspath(server_path)
-            with open(server_path, 'wb+') as destination:
-                for chunk in (filename).chunks():
-                    destination.write(chunk)
+                parser = ZipContainerParser()
+            extension = ".zdc"
+        elif filetype == filetypes.HDF5:
+            if supplied:
+                raise MetaDBError({"error_code": 400,
+                                   "msg": "Supplied metadata is only " +
+                                          "supported for ZIP containers."})
+            parser = Hdf5ContainerParser()
+            extension = ".hdf5"
+        else:
+            raise MetaDBError({"error_code": 415,
+                               "msg": "File format has to be hdf5 or zip!"
+                               }
+                              )
+
+        with transaction.atomic():
+            obj = parser.parse(filename, owner)
+            #  obj == None for test uploads
+            if not obj:
+                return
+            old_path = obj.server_path
+            root = placement_root(obj.container_type.name, old_path,
+                                  staged_root(filename))
+            server_path = server_path_for(obj.id, extension, root)
             obj.server_path = server_path
+            # the digest of the previous container is no longer valid, only
+            # the weak fallback ETag applies until the update was promoted
+            obj.digest = None
             obj.save()
-            return obj
+
+        try:
+            obj.digest = promote(filename, server_path)
+        except OSError as e:
+            if parser.previous is None:
+                _discard_dataset(obj)
+            else:
+                # the previous container is still stored at old_path
+                _restore_dataset(obj, parser.previous)
+            raise MetaDBError({"error_code": 500,
+                               "msg": "Failed to store the container: " +
+                                      str(e)})
+        DataSet.objects.filter(pk=obj.pk).update(digest=obj.digest)
+        if old_path is not None and old_path != server_path:
+            # the update was stored in the current layout or with another
+            # file type
+            try:
+                os.remove(old_path)
+            except OSError:
+                pass
+        return obj
 
     except MetaDBError:
         raise
@@ -468,3 +1046,56 @@ def parse_container_file(filename, owner):
                            "msg": "Unknown error! Please report to your " +
                            "administrator providing these information:" +
                            "\n\n" + str(e)})
+
+
+def parse_container_files(filenames: list, owner) -> list:
+    """
+    Parse several containers with parse_container_file() using a bounded
+    number of worker threads set by SCIDATACONTAINER_BATCH_WORKERS (default:
+    4). With one worker or less, the containers are parsed one after the
+    other in the calling thread. This is always the case with SQLite, which
+    allows only a single writer and fails concurrent transactions with
+    "database is locked".
+
+    Every container is parsed in its own transaction, so a failing container
+    doesn't affect the others.
+
+    :param filenames: List of uploaded container files.
+    :param owner: User sending the request to validate permissions and to
+    set ownership.
+
+    :return: List with either the parsed DataSet (None for test uploads) or
+    the raised MetaDBError for every container in the order of filenames.
+    """
+    def parse(filename):
+        try:
+            return parse_container_file(filename, owner)
+        except MetaDBError as e:
+            return e
+
+    workers = getattr(settings, "SCIDATACONTAINER_BATCH_WORKERS", 4)
+    workers = min(workers, len(filenames))
+    if workers <= 1 or connection.vendor == "sqlite":
+        return [parse(f) for f in filenames]
+
+    results = [None] * len(filenames)
+    jobs = iter(enumerate(filenames))
+    lock = threading.Lock()
+
+    def work():
+        try:
+            while True:
+                with lock:
+                    job = next(jobs, None)
+                if job is None:
+                    return
+                i, filename = job
+                results[i] = parse(filename)
+        finally:
+            # every thread opened its own database connections
+            connections.close_all()
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for future in [executor.submit(work) for _ in range(workers)]:
+            future.result()
+    return results
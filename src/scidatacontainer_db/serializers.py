@@ -1,7 +1,7 @@
 from rest_framework import serializers
 
-from .models import ContainerType, DataSet, DataSetBase, File, Keyword,\
-                    Software
+from .models import ChunkedUpload, ContainerType, DataSet, DataSetBase,\
+                    File, IngestJob, Keyword, Software
 
 
 class LinkedContainerTypeSerializer(serializers.HyperlinkedModelSerializer):
@@ -79,7 +79,8 @@ class DataSetSerializer(serializers.ModelSerializer):
         model = DataSet
         fields = ["uuid", "upload_time", "replaces", "complete",
                   "valid", "size", "created", "storageTime", "static",
-                  "containerType", "hash", "usedSoftware", "model_version",
+                  "containerType", "hash", "digest", "usedSoftware",
+                  "model_version",
                   "author", "email", "comment", "title", "keywords",
                   "description", "organization", "doi", "license", "timestamp",
                   "content"]
@@ -106,3 +107,25 @@ class SoftwareSerializer(serializers.ModelSerializer):
     class Meta:
         model = Software
         fields = "__all__"
+
+
+class IngestJobSerializer(serializers.ModelSerializer):
+    url = serializers.HyperlinkedIdentityField(
+            view_name="scidatacontainer_db:api:ingestjob-detail")
+    dataset = LinkedDataSetSerializer(read_only=True)
+
+    class Meta:
+        model = IngestJob
+        fields = ["url", "id", "name", "state", "created", "started",
+                  "finished", "status_code", "error", "dataset"]
+
+
+class ChunkedUploadSerializer(serializers.ModelSerializer):
+    url = serializers.HyperlinkedIdentityField(
+            view_name="scidatacontainer_db:api:chunkedupload-detail")
+
+    class Meta:
+        model = ChunkedUpload
+        fields = ["url", "id", "name", "size", "offset", "created",
+                  "updated"]
+        read_only_fields = ["offset"]
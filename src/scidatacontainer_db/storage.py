@@ -0,0 +1,528 @@
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+
+import collections
+import errno
+import hashlib
+import itertools
+import os
+import shutil
+import tempfile
+import threading
+import uuid
+
+from .models import DataSet
+
+
+FSYNC_POLICIES = ("none", "file", "full")
+# Maximum number of directory levels of the sharded layout.
+MAX_SHARD_DEPTH = 16
+PLACEMENT_POLICIES = ("round-robin", "capacity")
+
+_round_robin = itertools.count()
+_round_robin_lock = threading.Lock()
+
+# Running SHA-256 digests of resumable uploads whose chunks were received by
+# this process. They map the upload ID to the number of hashed bytes and the
+# hash object. The oldest entries are dropped beyond MAX_RUNNING_DIGESTS.
+MAX_RUNNING_DIGESTS = 1024
+_running_digests = collections.OrderedDict()
+_running_digests_lock = threading.Lock()
+
+
+def staging_dir(root: str = None) -> str:
+    """
+    Return the directory where uploads are staged before they are moved to
+    their final location. It is created if it does not exist yet.
+
+    Every storage root has its own staging directory <root>/.staging, so
+    that staged containers are renamed within their file system. A single
+    directory can be configured by SCIDATACONTAINER_STAGING_DIR instead. It
+    has to be on the same file system as the storage roots, otherwise staged
+    files are copied instead of renamed.
+
+    :param root: Storage root, see :func:`staging_root`. Defaults to the
+    first storage root.
+
+    :return: Absolute path of the staging directory.
+    """
+    path = getattr(settings, "SCIDATACONTAINER_STAGING_DIR", None)
+    if not path:
+        path = os.path.join(root or storage_roots()[0], ".staging")
+    path = os.path.abspath(path)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def staged_root(upload):
+    """
+    Return the storage root whose staging directory holds an upload or None
+    if the upload is kept in memory or staged elsewhere.
+
+    :param upload: Uploaded file.
+    """
+    if not hasattr(upload, "temporary_file_path") or \
+            getattr(settings, "SCIDATACONTAINER_STAGING_DIR", None):
+        return None
+    path = os.path.abspath(upload.temporary_file_path())
+    root = root_of(path)
+    if root is None or os.path.dirname(path) != os.path.join(root,
+                                                             ".staging"):
+        return None
+    return root
+
+
+def staging_root(upload=None):
+    """
+    Return the storage root a new file is staged in. Files derived from a
+    staged upload stay in its root, others are placed by the placement
+    policy, so that staging writes are spread over all roots.
+
+    :param upload: Upload the file is derived from, if any.
+
+    :return: Absolute path of the root or None if
+    SCIDATACONTAINER_STAGING_DIR is configured.
+    """
+    if getattr(settings, "SCIDATACONTAINER_STAGING_DIR", None):
+        return None
+    root = staged_root(upload) if upload is not None else None
+    return root or _next_root()
+
+
+def shard_depth() -> int:
+    """
+    Return the number of directory levels containers are sharded into.
+
+    :raises django.core.exceptions.ImproperlyConfigured: If
+    SCIDATACONTAINER_STORAGE_SHARD_DEPTH is no integer between 0 and 16.
+    """
+    depth = getattr(settings, "SCIDATACONTAINER_STORAGE_SHARD_DEPTH", 0)
+    if not isinstance(depth, int) or not 0 <= depth <= MAX_SHARD_DEPTH:
+        raise ImproperlyConfigured("SCIDATACONTAINER_STORAGE_SHARD_DEPTH " +
+                                   "has to be an integer between 0 and " +
+                                   str(MAX_SHARD_DEPTH) + ".")
+    return depth
+
+
+def storage_roots() -> list:
+    """
+    Return the absolute paths of the directories containers are stored in.
+    They are configured by SCIDATACONTAINER_STORAGE_ROOTS and default to
+    MEDIA_ROOT.
+    """
+    roots = getattr(settings, "SCIDATACONTAINER_STORAGE_ROOTS", None)
+    if not roots:
+        roots = [settings.MEDIA_ROOT]
+    return [os.path.abspath(root) for root in roots]
+
+
+def root_of(path: str):
+    """
+    Return the storage root a container is stored in or None if it is not
+    inside any of the configured roots.
+    """
+    if path is None:
+        return None
+    path = os.path.abspath(path)
+    for root in sorted(storage_roots(), key=len, reverse=True):
+        if path.startswith(os.path.join(root, "")):
+            return root
+    return None
+
+
+def placement_policy() -> str:
+    """
+    Return the configured placement policy for new containers.
+
+    - "round-robin": Use the storage roots in turn (default).
+    - "capacity": Use the storage root with the most free space.
+
+    :raises django.core.exceptions.ImproperlyConfigured: If
+    SCIDATACONTAINER_STORAGE_PLACEMENT is not one of the policies above.
+    """
+    policy = getattr(settings, "SCIDATACONTAINER_STORAGE_PLACEMENT",
+                     "round-robin")
+    if policy not in PLACEMENT_POLICIES:
+        raise ImproperlyConfigured("SCIDATACONTAINER_STORAGE_PLACEMENT has " +
+                                   "to be one of '" +
+                                   "', '".join(PLACEMENT_POLICIES) + "'.")
+    return policy
+
+
+def pinned_root(container_type: str):
+    """
+    Return the storage root containers of a type are pinned to by
+    SCIDATACONTAINER_STORAGE_PINNING or None if the type is not pinned.
+
+    :raises django.core.exceptions.ImproperlyConfigured: If the root a
+    type is pinned to is not one of the storage roots.
+    """
+    pinning = getattr(settings, "SCIDATACONTAINER_STORAGE_PINNING", {})
+    root = pinning.get(container_type, None)
+    if root is None:
+        return None
+    root = os.path.abspath(root)
+    if root not in storage_roots():
+        raise ImproperlyConfigured("Containers of the type '" +
+                                   container_type + "' are pinned to '" +
+                                   root + "', which is not listed in " +
+                                   "SCIDATACONTAINER_STORAGE_ROOTS.")
+    return root
+
+
+def disk_usage(root: str):
+    """
+    Return the disk usage of a storage root as returned by
+    shutil.disk_usage. The root is created if it does not exist yet.
+    """
+    os.makedirs(root, exist_ok=True)
+    return shutil.disk_usage(root)
+
+
+def _next_root() -> str:
+    roots = storage_roots()
+    if len(roots) == 1:
+        return roots[0]
+    if placement_policy() == "capacity":
+        return max(roots, key=lambda root: disk_usage(root).free)
+    with _round_robin_lock:
+        return roots[next(_round_robin) % len(roots)]
+
+
+def placement_root(container_type: str, current_path: str = None,
+                   staged: str = None) -> str:
+    """
+    Return the storage root for a container. Pinned container types are
+    stored in their root. Other containers stay in the root they are
+    already stored in. New ones are stored in the root they were staged in,
+    so that they are renamed instead of copied, or are placed by the
+    placement policy.
+
+    :param container_type: Name of the container type.
+    :param current_path: Current location of the container, if it is
+    already stored.
+    :param staged: Root the upload is staged in, see :func:`staged_root`.
+    """
+    root = pinned_root(container_type)
+    if root is not None:
+        return root
+    root = root_of(current_path)
+    if root is not None:
+        return root
+    if staged is not None:
+        return staged
+    return _next_root()
+
+
+def server_path_for(dataset_id, extension: str, root: str = None) -> str:
+    """
+    Return the location of a container in the configured layout. With the
+    default SCIDATACONTAINER_STORAGE_SHARD_DEPTH of 0 all containers are
+    stored flat in their storage root. Otherwise every directory level is
+    named after the next two hex digits of the UUID, e.g. ab/cd/<uuid>.zdc
+    for a depth of 2.
+
+    :param dataset_id: UUID of the dataset.
+    :param extension: File extension including the dot.
+    :param root: Storage root, see :func:`placement_root`. Defaults to
+    MEDIA_ROOT.
+
+    :return: Absolute path of the container.
+    """
+    if root is None:
+        root = settings.MEDIA_ROOT
+    name = str(dataset_id)
+    digits = name.replace("-", "")
+    shards = [digits[2 * i:2 * i + 2] for i in range(shard_depth())]
+    return os.path.abspath(os.path.join(root, *shards, name + extension))
+
+
+def fsync_policy() -> str:
+    """
+    Return the configured fsync policy.
+
+    - "none": Leave flushing to the operating system (default).
+    - "file": fsync the container file before it is renamed.
+    - "full": Additionally fsync the target directory after the rename.
+
+    :raises django.core.exceptions.ImproperlyConfigured: If
+    SCIDATACONTAINER_FSYNC is not one of the policies above.
+    """
+    policy = getattr(settings, "SCIDATACONTAINER_FSYNC", "none")
+    if policy not in FSYNC_POLICIES:
+        raise ImproperlyConfigured("SCIDATACONTAINER_FSYNC has to be one " +
+                                   "of '" + "', '".join(FSYNC_POLICIES) +
+                                   "'.")
+    return policy
+
+
+def _fsync_dir(path: str):
+    """
+    fsync a directory to persist a rename. Platforms that don't support
+    opening directories are silently ignored.
+    """
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:  # pragma: no cover
+        return
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def file_digest(path: str) -> str:
+    """
+    Return the SHA-256 hex digest of a file.
+    """
+    hasher = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(64 * 1024), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def _copy_to(upload, server_path: str, policy: str) -> str:
+    """
+    Copy an upload chunk by chunk to a temporary file next to server_path and
+    rename it afterwards. Readers never see a partially written container.
+
+    :return: SHA-256 hex digest of the copied data.
+    """
+    hasher = hashlib.sha256()
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(server_path),
+                                    prefix=".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as destination:
+            for chunk in upload.chunks():
+                destination.write(chunk)
+                hasher.update(chunk)
+            if policy != "none":
+                destination.flush()
+                os.fsync(destination.fileno())
+        os.replace(tmp_path, server_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return hasher.hexdigest()
+
+
+def promote(upload, server_path: str) -> str:
+    """
+    Move an uploaded container to its final location server_path.
+
+    Uploads backed by a file on disk (e.g. staged by
+    :class:`scidatacontainer_db.uploadhandlers.StagingUploadHandler`) are
+    moved with an atomic rename. If that is not possible because the file is
+    on another file system, or the upload is kept in memory, it is copied.
+
+    The SHA-256 digest is taken from the attribute sha256 of the upload,
+    which the staging upload handler computes while streaming, or computed
+    while copying. Only renamed uploads without a known digest are read
+    once more.
+
+    :param upload: Uploaded file.
+    :param server_path: Absolute target path.
+
+    :return: SHA-256 hex digest of the stored container.
+    """
+    policy = fsync_policy()
+    directory = os.path.dirname(server_path)
+    os.makedirs(directory, exist_ok=True)
+
+    digest = getattr(upload, "sha256", None)
+    renamed = False
+    if hasattr(upload, "temporary_file_path"):
+        upload.file.flush()
+        if policy != "none":
+            os.fsync(upload.file.fileno())
+        try:
+            os.replace(upload.temporary_file_path(), server_path)
+            renamed = True
+        except OSError as e:
+            if e.errno != errno.EXDEV:
+                raise
+
+    if not renamed:
+        digest = _copy_to(upload, server_path, policy)
+    elif digest is None:
+        digest = file_digest(server_path)
+
+    if settings.FILE_UPLOAD_PERMISSIONS is not None:
+        os.chmod(server_path, settings.FILE_UPLOAD_PERMISSIONS)
+
+    if policy == "full":
+        _fsync_dir(directory)
+    return digest
+
+
+def write_chunk(path: str, offset: int, stream, length: int) -> tuple:
+    """
+    Write a chunk of a resumable upload to path at offset. The file is
+    truncated after the chunk, so that data of a previously failed attempt
+    is discarded.
+
+    :param path: Path of the staged file, which has to exist.
+    :param offset: Position of the chunk inside the file.
+    :param stream: File-like object the chunk is read from.
+    :param length: Length of the chunk in bytes.
+
+    :return: Tuple of the number of bytes written and the SHA-256 hex digest
+    of the chunk.
+    """
+    hasher = hashlib.sha256()
+    written = 0
+    with open(path, "r+b") as f:
+        f.seek(offset)
+        while written < length:
+            data = stream.read(min(64 * 1024, length - written))
+            if not data:
+                break
+            f.write(data)
+            hasher.update(data)
+            written += len(data)
+        f.truncate()
+        if fsync_policy() != "none":
+            f.flush()
+            os.fsync(f.fileno())
+    return written, hasher.hexdigest()
+
+
+def insert_chunk(part: str, path: str, offset: int, hasher=None):
+    """
+    Copy a verified chunk from its part file into the staged file of a
+    resumable upload. Unlike :func:`write_chunk`, the staged file is not
+    truncated, so that a following chunk is never cut off.
+
+    :param part: Path of the file holding the chunk.
+    :param path: Path of the staged file, which has to exist.
+    :param offset: Position of the chunk inside the staged file.
+    :param hasher: Optional hash object that is updated with the chunk.
+    """
+    with open(part, "rb") as src, open(path, "r+b") as f:
+        f.seek(offset)
+        while True:
+            data = src.read(64 * 1024)
+            if not data:
+                break
+            f.write(data)
+            if hasher is not None:
+                hasher.update(data)
+        if fsync_policy() != "none":
+            f.flush()
+            os.fsync(f.fileno())
+
+
+def running_digest(upload_id, offset: int):
+    """
+    Take the running SHA-256 hash object of the first offset bytes of a
+    resumable upload. The chunks of an upload may be received by different
+    processes, so the hash object is only available if this process received
+    all of them.
+
+    :param upload_id: ID of the upload.
+    :param offset: Number of bytes received so far.
+
+    :return: The hash object or None.
+    """
+    with _running_digests_lock:
+        state = _running_digests.pop(upload_id, None)
+    if offset == 0:
+        return hashlib.sha256()
+    if state is not None and state[0] == offset:
+        return state[1]
+    return None
+
+
+def keep_running_digest(upload_id, offset: int, hasher):
+    """
+    Keep the running SHA-256 hash object of the first offset bytes of a
+    resumable upload for :func:`running_digest`.
+    """
+    with _running_digests_lock:
+        _running_digests[upload_id] = (offset, hasher)
+        _running_digests.move_to_end(upload_id)
+        while len(_running_digests) > MAX_RUNNING_DIGESTS:
+            _running_digests.popitem(last=False)
+
+
+def _place(current: str, target: str):
+    """
+    Make the file current available at target as well. A hard link is used
+    if possible, otherwise the file is copied and renamed into place.
+    """
+    directory = os.path.dirname(target)
+    os.makedirs(directory, exist_ok=True)
+    tmp_path = os.path.join(directory, "." + uuid.uuid4().hex + ".tmp")
+    try:
+        try:
+            os.link(current, tmp_path)
+        except OSError:
+            shutil.copyfile(current, tmp_path)
+            if fsync_policy() != "none":
+                with open(tmp_path, "rb") as f:
+                    os.fsync(f.fileno())
+        os.replace(tmp_path, target)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    if fsync_policy() == "full":
+        _fsync_dir(directory)
+
+
+def _signature(path: str) -> tuple:
+    st = os.stat(path)
+    return st.st_ino, st.st_size, st.st_mtime_ns
+
+
+def relocate(moves: list) -> tuple:
+    """
+    Move stored containers to new locations while they can still be
+    downloaded. The containers are linked (or copied) to their targets
+    first, then server_path of all datasets is updated in a single
+    transaction and finally the old files are removed. Datasets whose
+    server_path changed in the meantime are left alone.
+
+    :param moves: List of (dataset id, current path, target path) tuples.
+
+    :return: Tuple of the number of moved containers and a list of
+    (dataset id, error message) tuples of failed moves.
+    """
+    placed = []
+    failed = []
+    for pk, current, target in moves:
+        try:
+            signature = _signature(current)
+            _place(current, target)
+        except OSError as e:
+            failed.append((pk, str(e)))
+            continue
+        placed.append((pk, current, target, signature))
+
+    with transaction.atomic():
+        updated = [DataSet.objects.filter(pk=pk, server_path=current)
+                                  .update(server_path=target) == 1
+                   for pk, current, target, signature in placed]
+
+    moved = 0
+    for ok, (pk, current, target, signature) in zip(updated, placed):
+        try:
+            if not ok:
+                # changed by an upload in the meantime, keep its location
+                path = DataSet.objects.filter(pk=pk)\
+                                      .values_list("server_path", flat=True)\
+                                      .first()
+                if path != target:
+                    os.remove(target)
+                continue
+            if _signature(current) != signature:
+                # updated by an upload after it was placed
+                _place(current, target)
+            os.remove(current)
+            moved += 1
+        except OSError as e:
+            failed.append((pk, str(e)))
+    return moved, failed
@@ -10,6 +10,7 @@ import io
 import hashlib
 import mimetypes
 import os
+import tempfile
 import uuid
 
 import rest_framework.test
@@ -94,6 +95,24 @@ def get_example_wo_complete_zdc():
     return container
 
 
+class TempMediaRootMixin:
+    """
+    Store containers in a temporary MEDIA_ROOT, which is removed after each
+    test. Override :meth:`media_settings` to change further storage settings.
+    """
+
+    def media_settings(self) -> dict:
+        return {"MEDIA_ROOT": self.tmpdir.name}
+
+    def setUp(self):
+        super().setUp()
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        media = django.test.override_settings(**self.media_settings())
+        media.enable()
+        self.addCleanup(media.disable)
+
+
 class TestCase(django.test.TestCase):
     @classmethod
     def setUpClass(cls):
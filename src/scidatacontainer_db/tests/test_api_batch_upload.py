@@ -0,0 +1,66 @@
+from django.test import override_settings
+from django.urls import reverse
+
+from scidatacontainer_db.models import DataSet
+
+import io
+import tarfile
+import uuid
+
+from . import APITestCase, get_example_zdc, get_example_faulty_zdc
+
+
+def _container_bytes(container, new_uuid=True):
+    if new_uuid:
+        container["content.json"]["uuid"] = str(uuid.uuid4())
+        container["content.json"]["replaces"] = None
+    return container.encode()
+
+
+@override_settings(SCIDATACONTAINER_BATCH_WORKERS=1)
+class ApiBatchUploadTest(APITestCase):
+    view_name = "scidatacontainer_db:api:dataset-batch"
+
+    def test_view_url_exists_at_desired_location(self):
+        response = self._post("/api/datasets/batch/")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.reason_phrase,
+                         "No data file found in your request!")
+
+    def test_multiple_files(self):
+        files = [io.BytesIO(_container_bytes(get_example_zdc())),
+                 io.BytesIO(_container_bytes(get_example_faulty_zdc())),
+                 io.BytesIO(_container_bytes(get_example_zdc()))]
+        response = self._post(reverse(self.view_name),
+                              data={"uploadfile": files})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([r["status"] for r in response.data],
+                         [201, 400, 201])
+        self.assertEqual(len(DataSet.objects.all()), 2)
+        for r in [response.data[0], response.data[2]]:
+            self.assertTrue(DataSet.objects.filter(id=r["id"]).exists())
+        self.assertIsNone(response.data[1]["id"])
+
+    def test_tarfile(self):
+        b = io.BytesIO()
+        with tarfile.open(fileobj=b, mode="w:gz") as tar:
+            for i in range(3):
+                data = _container_bytes(get_example_zdc())
+                info = tarfile.TarInfo(str(i) + ".zdc")
+                info.size = len(data)
+                tar.addfile(info, io.BytesIO(data))
+        b.seek(0)
+        response = self._post(reverse(self.view_name),
+                              data={"tarfile": b})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([r["name"] for r in response.data],
+                         ["0.zdc", "1.zdc", "2.zdc"])
+        self.assertEqual([r["status"] for r in response.data],
+                         [201, 201, 201])
+        self.assertEqual(len(DataSet.objects.all()), 3)
+
+    def test_invalid_tarfile(self):
+        response = self._post(reverse(self.view_name),
+                              data={"tarfile": io.BytesIO(b"no tar")})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(len(DataSet.objects.all()), 0)
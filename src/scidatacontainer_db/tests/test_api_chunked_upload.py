@@ -0,0 +1,210 @@
+from django.core.management import call_command
+from django.test import override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from scidatacontainer_db.ingest import purge_stale_uploads
+from scidatacontainer_db.models import ChunkedUpload, DataSet, IngestJob
+from scidatacontainer_db.storage import _running_digests, staging_dir,\
+                                        write_chunk
+
+import datetime
+import hashlib
+import io
+import os
+from unittest import mock
+
+from . import APITestCase, TempMediaRootMixin, get_example_zdc, testuuid
+
+
+class ApiChunkedUploadTest(TempMediaRootMixin, APITestCase):
+    view_name = "scidatacontainer_db:api:chunkedupload-list"
+
+    def setUp(self):
+        super().setUp()
+        self.data = get_example_zdc().encode()
+
+    def _initiate(self, size=None):
+        data = {"name": "example.zdc"}
+        if size is not None:
+            data["size"] = size
+        response = self._post(reverse(self.view_name), data=data)
+        self.assertEqual(response.status_code, 201)
+        return response.data["url"]
+
+    def _put(self, url, offset, chunk, checksum=True):
+        self.client.force_authenticate(self.user)
+        headers = {}
+        if checksum:
+            headers["HTTP_X_CHUNK_SHA256"] = hashlib.sha256(chunk).hexdigest()
+        return self.client.put(url + "?offset=" + str(offset), data=chunk,
+                               content_type="application/octet-stream",
+                               **headers)
+
+    def test_chunked_upload(self):
+        url = self._initiate(len(self.data))
+        for offset in range(0, len(self.data), 1000):
+            response = self._put(url, offset,
+                                 self.data[offset:offset + 1000])
+            self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["offset"], len(self.data))
+        digest = hashlib.sha256(self.data).hexdigest()
+        self.assertEqual(ChunkedUpload.objects.get().digest, digest)
+
+        with mock.patch("scidatacontainer_db.storage.file_digest") as m:
+            response = self._post(url + "finalize/")
+        m.assert_not_called()
+        self.assertEqual(response.status_code, 201)
+        obj = DataSet.objects.get(id=testuuid)
+        self.assertEqual(obj.digest, digest)
+        with open(obj.server_path, "rb") as f:
+            self.assertEqual(f.read(), self.data)
+        self.assertEqual(len(ChunkedUpload.objects.all()), 0)
+        self.assertEqual(os.listdir(staging_dir()), [])
+
+    def test_resume(self):
+        url = self._initiate()
+        updated = ChunkedUpload.objects.get().updated
+        self.assertEqual(self._put(url, 0, self.data[:1000]).status_code,
+                         200)
+        self.assertGreater(ChunkedUpload.objects.get().updated, updated)
+
+        # a retried chunk is rejected and the expected offset is returned
+        response = self._put(url, 0, self.data[:1000])
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data["offset"], 1000)
+
+        # a corrupted chunk is discarded
+        self.client.force_authenticate(self.user)
+        response = self.client.put(url + "?offset=1000",
+                                   data=self.data[1000:],
+                                   content_type="application/octet-stream",
+                                   HTTP_X_CHUNK_SHA256="0" * 64)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self._get(url).data["offset"], 1000)
+
+        self.assertEqual(self._put(url, 1000, self.data[1000:],
+                                   checksum=False).status_code, 200)
+        response = self._post(url + "finalize/")
+        self.assertEqual(response.status_code, 201)
+
+    def test_running_digest(self):
+        digest = hashlib.sha256(self.data).hexdigest()
+
+        # without announced size, the digest is taken at finalization
+        url = self._initiate()
+        self._put(url, 0, self.data[:1000])
+        self._put(url, 1000, self.data[1000:])
+        self.assertIsNone(ChunkedUpload.objects.get().digest)
+        with mock.patch("scidatacontainer_db.storage.file_digest") as m:
+            response = self._post(url + "finalize/?async=true")
+        m.assert_not_called()
+        self.assertEqual(IngestJob.objects.get(id=response.data["id"])
+                                  .digest, digest)
+
+        # chunks received by another process
+        url = self._initiate()
+        self._put(url, 0, self.data[:1000])
+        _running_digests.clear()
+        self._put(url, 1000, self.data[1000:])
+        response = self._post(url + "finalize/?async=true")
+        self.assertEqual(IngestJob.objects.get(id=response.data["id"])
+                                  .digest, digest)
+
+    def test_concurrent_chunk(self):
+        url = self._initiate()
+        upload = ChunkedUpload.objects.get()
+
+        def _write_chunk(*args):
+            # another request for the same offset is accepted meanwhile
+            ChunkedUpload.objects.update(offset=1000)
+            return write_chunk(*args)
+
+        with mock.patch("scidatacontainer_db.api_views.write_chunk",
+                        side_effect=_write_chunk):
+            response = self._put(url, 0, self.data[:1000])
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data["offset"], 1000)
+        self.assertEqual(os.path.getsize(upload.staged_path), 0)
+        self.assertEqual(os.listdir(staging_dir()),
+                         [os.path.basename(upload.staged_path)])
+
+    def test_finalize_server_error(self):
+        url = self._initiate()
+        self._put(url, 0, self.data)
+        with mock.patch("scidatacontainer_db.parsers.promote",
+                        side_effect=OSError("disk full")):
+            response = self._post(url + "finalize/")
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual(len(ChunkedUpload.objects.all()), 1)
+
+        response = self._post(url + "finalize/")
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(ChunkedUpload.objects.all()), 0)
+
+    def test_incomplete(self):
+        url = self._initiate(len(self.data))
+        self._put(url, 0, self.data[:1000])
+        response = self._post(url + "finalize/")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(len(DataSet.objects.all()), 0)
+
+        response = self._put(url, 1000, self.data[1000:] + b"0")
+        self.assertEqual(response.status_code, 400)
+
+    def test_content_length(self):
+        url = self._initiate()
+        self.client.force_authenticate(self.user)
+        # chunks sent with Transfer-Encoding: chunked have no length
+        response = self.client.put(url + "?offset=0", data=self.data[:1000],
+                                   content_type="application/octet-stream",
+                                   CONTENT_LENGTH="")
+        self.assertEqual(response.status_code, 411)
+        self.assertEqual(ChunkedUpload.objects.get().offset, 0)
+
+    @override_settings(SCIDATACONTAINER_MAX_CHUNK_SIZE=100)
+    def test_chunk_size(self):
+        url = self._initiate()
+        response = self._put(url, 0, self.data[:101])
+        self.assertEqual(response.status_code, 413)
+
+    def test_async_finalize(self):
+        url = self._initiate()
+        self._put(url, 0, self.data)
+        response = self._post(url + "finalize/?async=true")
+        self.assertEqual(response.status_code, 202)
+        job = IngestJob.objects.get(id=response.data["id"])
+        with open(job.staged_path, "rb") as f:
+            self.assertEqual(f.read(), self.data)
+
+    def test_purge(self):
+        stale = self._initiate()
+        self._put(stale, 0, self.data[:1000])
+        upload = ChunkedUpload.objects.get()
+        part = upload.staged_path + ".0123abcd.part"
+        open(part, "wb").close()
+        ChunkedUpload.objects.filter(pk=upload.pk).update(
+                updated=timezone.now() - datetime.timedelta(days=2))
+        active = self._initiate()
+        self._put(active, 0, self.data[:1000])
+
+        out = io.StringIO()
+        with override_settings(SCIDATACONTAINER_CHUNKED_UPLOAD_MAX_AGE=86400):
+            call_command("purge_chunked_uploads", stdout=out)
+        self.assertIn("Deleted 1 ", out.getvalue())
+        self.assertFalse(ChunkedUpload.objects.filter(pk=upload.pk).exists())
+        self.assertEqual(len(os.listdir(staging_dir())), 1)
+
+        self.assertEqual(purge_stale_uploads(3 * 86400), 0)
+        self.client.force_authenticate(self.user)
+        self.assertEqual(self.client.get(stale).status_code, 404)
+        self.assertEqual(self._put(active, 1000, self.data[1000:2000])
+                         .status_code, 200)
+
+    def test_abort(self):
+        url = self._initiate()
+        self._put(url, 0, self.data[:1000])
+        self.client.force_authenticate(self.user)
+        self.assertEqual(self.client.delete(url).status_code, 204)
+        self.assertEqual(len(ChunkedUpload.objects.all()), 0)
+        self.assertEqual(os.listdir(staging_dir()), [])
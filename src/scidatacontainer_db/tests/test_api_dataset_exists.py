@@ -0,0 +1,82 @@
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from scidatacontainer_db.models import DataSet
+
+import uuid
+
+from . import APITestCase
+
+
+class ApiDataSetExistsTest(APITestCase):
+    view_name = "scidatacontainer_db:api:dataset-exists"
+
+    def test_view_url_exists_at_desired_location(self):
+        response = self._post("/api/datasets/exists/", format="json")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, [])
+
+    def test_probe(self):
+        self._create_test_dataset()
+        obj = DataSet.objects.get(id=self.id)
+        obj.hash = "abc"
+        obj.save()
+        unknown = [str(uuid.uuid4()) for _ in range(1200)]
+
+        with CaptureQueriesContext(connection) as ctx:
+            response = self._post(reverse(self.view_name),
+                                  data={"uuids": unknown + [str(self.id)],
+                                        "hashes": ["abc", "def"]},
+                                  format="json")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data), 1)
+        result = response.data[0]
+        self.assertEqual(result["uuid"], str(self.id))
+        self.assertEqual(result["hash"], "abc")
+        self.assertFalse(result["complete"])
+        self.assertFalse(result["static"])
+        self.assertTrue(result["valid"])
+        self.assertEqual(result["storageTime"], obj.storage_time)
+        self.assertIsNone(result["replacedBy"])
+
+        probes = [q for q in ctx.captured_queries
+                  if "scidatacontainer_db_dataset" in q["sql"]]
+        # three chunks of UUIDs and one of hashes
+        self.assertEqual(len(probes), 4)
+
+    def test_probe_digest(self):
+        self._create_test_dataset()
+        digest = DataSet.objects.get(id=self.id).digest
+        response = self._post(reverse(self.view_name),
+                              data={"digests": [digest.upper()]},
+                              format="json")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data), 1)
+        self.assertEqual(response.data[0]["uuid"], str(self.id))
+        self.assertEqual(response.data[0]["digest"], digest)
+
+    def test_other_users(self):
+        self._create_test_dataset()
+        other = User.objects.create_user("otheruser")
+        self.client.force_authenticate(other)
+        response = self.client.post(reverse(self.view_name),
+                                    data={"uuids": [str(self.id)]},
+                                    format="json")
+        self.assertEqual(response.data, [])
+
+    def test_invalid_input(self):
+        response = self._post(reverse(self.view_name),
+                              data={"uuids": ["no uuid"]}, format="json")
+        self.assertEqual(response.status_code, 400)
+
+        response = self._post(reverse(self.view_name),
+                              data={"uuids": "no list"}, format="json")
+        self.assertEqual(response.status_code, 400)
+
+        with self.settings(SCIDATACONTAINER_PROBE_MAX_ITEMS=2):
+            response = self._post(reverse(self.view_name),
+                                  data={"hashes": ["a", "b", "c"]},
+                                  format="json")
+        self.assertEqual(response.status_code, 400)
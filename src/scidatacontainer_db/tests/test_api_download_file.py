@@ -1,9 +1,12 @@
 from django.contrib.auth.models import User
+from django.core.exceptions import ImproperlyConfigured
 from django.urls import reverse
 
 import hashlib
 import io
+import os
 import uuid
+from unittest import mock
 
 from scidatacontainer_db.models import DataSet
 from . import APITestCase, get_example_replaces_zdc
@@ -135,3 +138,154 @@ class ApiDownloadTest(APITestCase):
         response = self._get(reverse(self.view_name, args=[str(self.id)]))
         self.assertEqual(response.status_code, 204)
         self.assertEqual(response.reason_phrase, "DataSet was deleted!")
+
+    def _download(self, **headers):
+        self.client.force_authenticate(self.user)
+        return self.client.get(reverse(self.view_name, args=[str(self.id)]),
+                               **headers)
+
+    def _content(self):
+        with open(DataSet.objects.get(id=self.id).server_path, "rb") as f:
+            return f.read()
+
+    def test_conditional(self):
+        self._create_test_dataset()
+        response = self._download()
+        self.assertEqual(response["Accept-Ranges"], "bytes")
+        etag = response["ETag"]
+        self.assertNotIn("Last-Modified", response)
+
+        response = self._download(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["ETag"], etag)
+        response = self._download(HTTP_IF_NONE_MATCH="W/" + etag)
+        self.assertEqual(response.status_code, 304)
+        response = self._download(
+                HTTP_IF_MODIFIED_SINCE="Fri, 01 Jan 2100 00:00:00 GMT")
+        self.assertEqual(response.status_code, 200)
+
+        response = self._download(HTTP_IF_NONE_MATCH='"other"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Disposition"],
+                         'inline; filename="' + str(self.id) + '.zdc"')
+
+    def test_weak_etag(self):
+        self._create_test_dataset()
+        DataSet.objects.filter(id=self.id).update(digest=None)
+        response = self._download()
+        etag = response["ETag"]
+        self.assertTrue(etag.startswith('W/"'))
+
+        response = self._download(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        response = self._download(HTTP_IF_NONE_MATCH=etag[2:])
+        self.assertEqual(response.status_code, 304)
+
+        # byte ranges require a strong entity tag
+        response = self._download(HTTP_RANGE="bytes=0-9", HTTP_IF_RANGE=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_range(self):
+        self._create_test_dataset()
+        content = self._content()
+        size = len(content)
+
+        response = self._download(HTTP_RANGE="bytes=10-19")
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response["Content-Range"],
+                         "bytes 10-19/" + str(size))
+        self.assertEqual(b"".join(response.streaming_content),
+                         content[10:20])
+
+        response = self._download(HTTP_RANGE="bytes=-5")
+        self.assertEqual(b"".join(response.streaming_content),
+                         content[-5:])
+        response = self._download(HTTP_RANGE="bytes=" + str(size - 3) + "-")
+        self.assertEqual(b"".join(response.streaming_content),
+                         content[-3:])
+
+        response = self._download(HTTP_RANGE="bytes=" + str(size) + "-")
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response["Content-Range"], "bytes */" + str(size))
+
+        # invalid headers are ignored
+        response = self._download(HTTP_RANGE="bytes=5-2")
+        self.assertEqual(response.status_code, 200)
+
+        # outdated If-Range results in the complete container
+        etag = response["ETag"]
+        response = self._download(HTTP_RANGE="bytes=0-9",
+                                  HTTP_IF_RANGE='"outdated"')
+        self.assertEqual(response.status_code, 200)
+        response = self._download(HTTP_RANGE="bytes=0-9", HTTP_IF_RANGE=etag)
+        self.assertEqual(response.status_code, 206)
+        response = self._download(
+                HTTP_RANGE="bytes=0-9",
+                HTTP_IF_RANGE="Fri, 01 Jan 2100 00:00:00 GMT")
+        self.assertEqual(response.status_code, 200)
+
+    def test_multiple_ranges(self):
+        self._create_test_dataset()
+        content = self._content()
+        response = self._download(HTTP_RANGE="bytes=0-4,20-29")
+        self.assertEqual(response.status_code, 206)
+        content_type, boundary = response["Content-Type"].split("; ")
+        self.assertEqual(content_type, "multipart/byteranges")
+        boundary = boundary[len("boundary="):]
+
+        body = b"".join(response.streaming_content)
+        self.assertEqual(int(response["Content-Length"]), len(body))
+        parts = body.split(b"--" + boundary.encode())
+        self.assertEqual(parts[0], b"")
+        self.assertEqual(parts[-1], b"--\r\n")
+        headers, data = parts[1].split(b"\r\n\r\n")
+        self.assertIn(b"Content-Range: bytes 0-4/" +
+                      str(len(content)).encode(), headers)
+        self.assertEqual(data, content[0:5] + b"\r\n")
+        headers, data = parts[2].split(b"\r\n\r\n")
+        self.assertEqual(data, content[20:30] + b"\r\n")
+
+    def test_head(self):
+        self._create_test_dataset()
+        size = len(self._content())
+        self.client.force_authenticate(self.user)
+        url = reverse(self.view_name, args=[str(self.id)])
+        with mock.patch("builtins.open") as mock_open:
+            response = self.client.head(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response["Content-Length"], str(size))
+            self.assertIn("ETag", response)
+
+            response = self.client.head(url, HTTP_RANGE="bytes=0-9,20-29")
+            self.assertEqual(response.status_code, 206)
+        mock_open.assert_not_called()
+
+    def test_offload(self):
+        self._create_test_dataset()
+        server_path = DataSet.objects.get(id=self.id).server_path
+
+        with self.settings(SCIDATACONTAINER_DOWNLOAD_OFFLOAD="x-sendfile"):
+            response = self._download(HTTP_RANGE="bytes=0-9")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["X-Sendfile"], server_path)
+        self.assertEqual(response.content, b"")
+        self.assertIn("ETag", response)
+
+        with self.settings(SCIDATACONTAINER_DOWNLOAD_OFFLOAD="x-accel-" +
+                           "redirect",
+                           SCIDATACONTAINER_DOWNLOAD_OFFLOAD_PREFIX="/int/"):
+            response = self._download()
+            self.assertEqual(response["X-Accel-Redirect"],
+                             "/int/" + os.path.basename(server_path))
+
+            # permissions are checked before offloading
+            other = User.objects.create_user("otheruser")
+            self.client.force_authenticate(other)
+            response = self.client.get(reverse(self.view_name,
+                                               args=[str(self.id)]))
+        self.assertEqual(response.status_code, 403)
+        self.assertNotIn("X-Accel-Redirect", response)
+
+        with self.settings(SCIDATACONTAINER_DOWNLOAD_OFFLOAD="unknown"):
+            with self.assertRaises(ImproperlyConfigured):
+                self._download()
@@ -1,6 +1,13 @@
+from django.core.management import call_command
+from django.test import override_settings
 from django.urls import reverse
 
-from . import APITestCase
+from scidatacontainer_db.models import File
+
+import io
+import uuid
+
+from . import APITestCase, get_example_zdc
 
 
 class ApiFileListTest(APITestCase):
@@ -34,3 +41,52 @@ class ApiFileListTest(APITestCase):
         response = self._get(reverse(self.view_name))
         self.assertEqual(response.status_code, 200)
         self.assertEqual(len(response.data), 4)
+
+    @override_settings(SCIDATACONTAINER_JSON_CONTENT_MAX_SIZE=10)
+    def test_deferred_content(self):
+        self._create_test_dataset()
+        f = File.objects.get(name="data/parameter.json")
+        self.assertTrue(f.content_pending)
+        self.assertEqual(f.content, None)
+        self.assertTrue(f.digest.startswith("crc32:"))
+
+        response = self._get(reverse("scidatacontainer_db:api:file-detail",
+                                     args=[f.id]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["content"],
+                         self.container["data/parameter.json"])
+        self.assertFalse(response.data["content_pending"])
+
+        f.refresh_from_db()
+        self.assertFalse(f.content_pending)
+        self.assertEqual(f.content, self.container["data/parameter.json"])
+        self.assertEqual(f.digest, File.compute_digest(f.content))
+
+        out = io.StringIO()
+        call_command("extract_file_content", stdout=out)
+        self.assertEqual(len(File.objects.filter(content_pending=True)), 0)
+        self.assertIn("Extracted 2 file(s), 0 failed.", out.getvalue())
+
+    def test_deferred_content_merge(self):
+        self._create_test_dataset()
+        f = File.objects.get(name="data/parameter.json")
+        self.assertFalse(f.content_pending)
+
+        container = get_example_zdc()
+        container["content.json"]["uuid"] = str(uuid.uuid4())
+        container["content.json"]["replaces"] = None
+        with override_settings(SCIDATACONTAINER_JSON_CONTENT_MAX_SIZE=10):
+            response = self._post(reverse("scidatacontainer_db:api:" +
+                                          "dataset-list"),
+                                  data={"uploadfile":
+                                        io.BytesIO(container.encode())})
+        self.assertEqual(response.status_code, 201)
+        pending = File.objects.get(name="data/parameter.json",
+                                   content_pending=True)
+
+        pending.extract_content()
+        files = File.objects.filter(name="data/parameter.json")
+        self.assertEqual(len(files), 1)
+        self.assertEqual(files[0].pk, pending.pk)
+        self.assertEqual(len(files[0].included_in.all()), 2)
+
@@ -1,12 +1,23 @@
+from django.contrib.auth.models import User
+from django.test import override_settings
 from django.urls import reverse
 
-from scidatacontainer_db.models import DataSet
+from scidatacontainer_db.models import DataSet, File
+from scidatacontainer_db.parsers import parse_container_file
+from scidatacontainer_db.storage import staging_dir
+from scidatacontainer_db.uploadhandlers import StagedFile
 
+import hashlib
 import io
+import json
+import os
 import tempfile
 import uuid
+import zipfile
+from unittest import mock
 
 import h5py
+import numpy
 
 from . import APITestCase, testuuid,\
               get_example_zdc,\
@@ -119,6 +130,63 @@ class ApiUploadTest(APITestCase):
                          " already a file with the same hash and UUID=" +
                          testuuid + ".")
 
+    def test_digest(self):
+        self._create_test_dataset()
+        obj = DataSet.objects.get(id=self.id)
+        with open(obj.server_path, "rb") as f:
+            digest = hashlib.sha256(f.read()).hexdigest()
+        self.assertEqual(obj.digest, digest)
+
+        response = self._get(reverse("scidatacontainer_db:api:" +
+                                     "dataset-download", args=[str(self.id)]))
+        self.assertEqual(response["ETag"], '"' + digest + '"')
+
+    def test_unchanged(self):
+        self._create_test_dataset()
+        with open(DataSet.objects.get(id=self.id).server_path, "rb") as f:
+            b = f.read()
+
+        with mock.patch("scidatacontainer_db.parsers.ZipContainerParser." +
+                        "_read_meta_json") as m:
+            response = self._post(reverse(self.view_name),
+                                  data={"uploadfile": io.BytesIO(b)})
+        m.assert_not_called()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.reason_phrase, "Dataset is unchanged.")
+        self.assertEqual(response.data["uuid"], str(self.id))
+        self.assertEqual(len(DataSet.objects.all()), 1)
+
+        other = User.objects.create_user("otheruser")
+        self.client.force_authenticate(other)
+        response = self.client.post(reverse(self.view_name),
+                                    data={"uploadfile": io.BytesIO(b)})
+        self.assertEqual(response.status_code, 403)
+
+        # a different container with the same UUID, storage time, hash and
+        # size is no re-upload
+        DataSet.objects.filter(id=self.id).update(digest="0" * 64)
+        response = self._post(reverse(self.view_name),
+                              data={"uploadfile": io.BytesIO(b)})
+        self.assertEqual(response.status_code, 201)
+
+        # without the digest of the stored container, the upload is parsed
+        DataSet.objects.filter(id=self.id).update(digest=None)
+        response = self._post(reverse(self.view_name),
+                              data={"uploadfile": io.BytesIO(b)})
+        self.assertEqual(response.status_code, 201)
+        self.assertIsNotNone(DataSet.objects.get(id=self.id).digest)
+
+        # uploads with unknown digest are parsed as well
+        path = os.path.join(staging_dir(), "example.zdc")
+        with open(path, "wb") as f:
+            f.write(b)
+        upload = StagedFile(path, "example.zdc")
+        try:
+            obj = parse_container_file(upload, self.user)
+        finally:
+            upload.close()
+        self.assertEqual(str(obj.id), str(self.id))
+
     def test_hdf5_upload(self):
         self.assertEqual(len(DataSet.objects.all()), 0)
         container = get_example_zdc()
@@ -126,17 +194,199 @@ class ApiUploadTest(APITestCase):
         with h5py.File(b, "w") as h5file:
             dset = h5file.create_dataset("content", data=h5py.Empty("f"))
             for key, value in container["content.json"].items():
-                dset.attrs.create(key, str(value))
+                if not isinstance(value, str):
+                    value = json.dumps(value)
+                dset.attrs.create(key, value)
 
             dset = h5file.create_dataset("meta", data=h5py.Empty("f"))
             for key, value in container["meta.json"].items():
                 dset.attrs.create(key, value)
+
+            h5file.create_dataset("meas/image", shape=(1000, 1000),
+                                  dtype="f8")
+            h5file["data/parameter.json"] = json.dumps({"a": 1})
         b.flush()
         b.seek(0)
         response = self._post(reverse(self.view_name),
                               data={"uploadfile": b}
                               )
-        self.assertEqual(response.status_code, 501)
-        self.assertEqual(response.reason_phrase, "The server does not " +
-                                                 "support to parse hdf5 " +
-                                                 "files yet.")
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(DataSet.objects.all()), 1)
+
+        obj = DataSet.objects.get(id=testuuid)
+        self.assertTrue(obj.server_path.endswith(".hdf5"))
+        self.assertFalse(obj.complete)
+        self.assertEqual(obj.container_type.name,
+                         container["content.json"]["containerType"]["name"])
+        self.assertEqual(sorted(kw.name for kw in obj.keywords.all()),
+                         container["meta.json"]["keywords"])
+        self.assertEqual(len(obj.used_software.all()), 2)
+        files = {f.name: f for f in obj.content.all()}
+        self.assertEqual(sorted(files.keys()),
+                         ["content.json", "data/parameter.json",
+                          "meas/image", "meta.json"])
+        self.assertEqual(files["meas/image"].size, 8 * 1000 * 1000)
+        self.assertEqual(files["data/parameter.json"].content, {"a": 1})
+        self.assertEqual(files["meta.json"].content["title"],
+                         container["meta.json"]["title"])
+
+    def test_hdf5_json_datasets(self):
+        container = get_example_zdc()
+        b = io.BytesIO()
+        with h5py.File(b, "w") as h5file:
+            h5file["content.json"] = json.dumps(container["content.json"])
+            h5file["meta.json"] = json.dumps(container["meta.json"])
+        b.seek(0)
+        response = self._post(reverse(self.view_name),
+                              data={"uploadfile": b}
+                              )
+        self.assertEqual(response.status_code, 201)
+        obj = DataSet.objects.get(id=testuuid)
+        self.assertEqual(sorted(f.name for f in obj.content.all()),
+                         ["content.json", "meta.json"])
+
+    def test_hdf5_deferred_json_content(self):
+        container = get_example_zdc()
+        variable = {"values": list(range(100))}
+        fixed = {"values": list(range(50))}
+        b = io.BytesIO()
+        with h5py.File(b, "w") as h5file:
+            h5file["content.json"] = json.dumps(container["content.json"])
+            h5file["meta.json"] = json.dumps(container["meta.json"])
+            h5file["data/variable.json"] = json.dumps(variable)
+            h5file["data/fixed.json"] = numpy.bytes_(json.dumps(fixed))
+            h5file["data/small.json"] = json.dumps({"a": 1})
+        b.seek(0)
+
+        read = []
+        getitem = h5py.Dataset.__getitem__
+
+        def _getitem(dset, *args, **kwargs):
+            read.append(dset.name)
+            return getitem(dset, *args, **kwargs)
+
+        with override_settings(SCIDATACONTAINER_JSON_CONTENT_MAX_SIZE=100), \
+                mock.patch.object(h5py.Dataset, "__getitem__", _getitem):
+            response = self._post(reverse(self.view_name),
+                                  data={"uploadfile": b})
+        self.assertEqual(response.status_code, 201)
+        self.assertIn("/data/small.json", read)
+        self.assertNotIn("/data/variable.json", read)
+        self.assertNotIn("/data/fixed.json", read)
+
+        obj = DataSet.objects.get(id=testuuid)
+        files = {f.name: f for f in obj.content.all()}
+        for name, content in [("data/variable.json", variable),
+                              ("data/fixed.json", fixed)]:
+            f = files[name]
+            self.assertTrue(f.content_pending)
+            self.assertEqual(f.size, len(json.dumps(content)))
+            self.assertEqual(f.digest, "container:" + str(testuuid))
+            self.assertEqual(f.extract_content(), content)
+            self.assertFalse(f.content_pending)
+            self.assertEqual(f.digest, File.compute_digest(content))
+        self.assertEqual(files["data/small.json"].content, {"a": 1})
+
+    def test_hdf5_missing_meta(self):
+        container = get_example_zdc()
+        b = io.BytesIO()
+        with h5py.File(b, "w") as h5file:
+            h5file["content.json"] = json.dumps(container["content.json"])
+        b.seek(0)
+        response = self._post(reverse(self.view_name),
+                              data={"uploadfile": b}
+                              )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.reason_phrase,
+                         "The HDF5 container has neither an object 'meta' " +
+                         "nor a dataset 'meta.json'.")
+        self.assertEqual(len(DataSet.objects.all()), 0)
+
+    def _supplied_metadata_upload(self, **kwargs):
+        container = get_example_zdc()
+        container["data/parameters.json"] = {"a": 1}
+        b = container.encode()
+        with zipfile.ZipFile(io.BytesIO(b)) as zfile:
+            names = zfile.namelist()
+            data = {"content": zfile.read("content.json").decode(),
+                    "meta": zfile.read("meta.json").decode(),
+                    "items": json.dumps(names)}
+        data.update(kwargs)
+        data = {key: value for key, value in data.items() if value is not None}
+        data["uploadfile"] = io.BytesIO(b)
+        return self._post(reverse(self.view_name), data=data)
+
+    def test_supplied_metadata(self):
+        response = self._supplied_metadata_upload()
+        self.assertEqual(response.status_code, 201)
+        obj = DataSet.objects.get(id=testuuid)
+        files = {f.name: f for f in obj.content.all()}
+        self.assertIn("data/parameters.json", files)
+        self.assertEqual(files["content.json"].content["uuid"], testuuid)
+        self.assertEqual(files["data/parameters.json"].content, {"a": 1})
+        self.assertFalse(files["data/parameters.json"].content_pending)
+
+    @override_settings(SCIDATACONTAINER_JSON_CONTENT_MAX_SIZE=4)
+    def test_supplied_metadata_pending(self):
+        response = self._supplied_metadata_upload()
+        self.assertEqual(response.status_code, 201)
+        obj = DataSet.objects.get(id=testuuid)
+        files = {f.name: f for f in obj.content.all()}
+        # supplied files are registered regardless of their size
+        self.assertEqual(files["content.json"].content["uuid"], testuuid)
+        self.assertTrue(files["data/parameters.json"].content_pending)
+        self.assertEqual(files["data/parameters.json"].extract_content(),
+                         {"a": 1})
+
+    def test_supplied_metadata_unusable(self):
+        container = get_example_zdc()
+        response = self._supplied_metadata_upload(meta=None)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.reason_phrase,
+                         "Supplied metadata requires both content and meta.")
+
+        response = self._post(reverse(self.view_name) + "?async=true",
+                              data={"uploadfile":
+                                    io.BytesIO(container.encode()),
+                                    "meta": json.dumps(container["meta.json"])
+                                    })
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.reason_phrase,
+                         "Supplied metadata is not supported for queued " +
+                         "uploads.")
+
+        b = io.BytesIO()
+        with h5py.File(b, "w") as h5file:
+            h5file.create_dataset("content", data=h5py.Empty("f"))
+        b.seek(0)
+        response = self._post(reverse(self.view_name),
+                              data={"uploadfile": b,
+                                    "content": json.dumps(
+                                            container["content.json"]),
+                                    "meta": json.dumps(container["meta.json"])
+                                    })
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.reason_phrase,
+                         "Supplied metadata is only supported for ZIP " +
+                         "containers.")
+        self.assertEqual(len(DataSet.objects.all()), 0)
+
+    def test_supplied_metadata_mismatch(self):
+        container = get_example_zdc()
+        response = self._supplied_metadata_upload(
+                meta=json.dumps(dict(container["meta.json"], title="Other")))
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.reason_phrase,
+                         "The supplied meta.json doesn't match the " +
+                         "container.")
+        self.assertEqual(len(DataSet.objects.all()), 0)
+
+        response = self._supplied_metadata_upload(items='["content.json"]')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.reason_phrase,
+                         "The members of the container don't match the " +
+                         "supplied items.")
+
+        response = self._supplied_metadata_upload(content="{")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(len(DataSet.objects.all()), 0)
@@ -0,0 +1,97 @@
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import CommandError
+
+from scidatacontainer_db.benchmark import _cleanup, _parse, compare,\
+                                          make_container, run_benchmark
+from scidatacontainer_db.models import DataSet, DataSetBase, File, Keyword
+
+import io
+import json
+import os
+import tempfile
+import zipfile
+
+from . import TestCase
+
+
+class BenchmarkTest(TestCase):
+
+    def test_make_container(self):
+        data = make_container(members=4, member_size=100, json_ratio=0.5)
+        with zipfile.ZipFile(io.BytesIO(data)) as zfile:
+            names = zfile.namelist()
+        self.assertEqual(len([n for n in names if n.endswith(".bin")]), 2)
+        self.assertIn("data/member_0.json", names)
+
+        # the UUID is not derived from the seed
+        uuids = set()
+        for _ in range(2):
+            data = make_container(members=0, member_size=1, json_ratio=0.0)
+            with zipfile.ZipFile(io.BytesIO(data)) as zfile:
+                uuids.add(json.loads(zfile.read("content.json"))["uuid"])
+        self.assertEqual(len(uuids), 2)
+
+    def test_run_benchmark(self):
+        for mode in ["parse", "upload"]:
+            metrics = run_benchmark(members=3, member_size=100,
+                                    json_ratio=0.5, count=2, mode=mode)
+            self.assertGreater(metrics["containers_per_s"], 0)
+            self.assertGreater(metrics["queries_per_upload"], 0)
+            if os.path.exists("/proc/self/clear_refs"):
+                self.assertGreater(metrics["peak_rss_mb"], 0)
+        # all created rows are deleted
+        self.assertEqual(len(DataSet.objects.all()), 0)
+        self.assertEqual(len(DataSetBase.objects.all()), 0)
+        self.assertEqual(len(File.objects.all()), 0)
+        self.assertEqual(len(Keyword.objects.all()), 0)
+        self.assertFalse(User.objects.filter(username__startswith="benchmark-")
+                                     .exists())
+
+    def test_isolated_storage(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            roots = [os.path.join(tmpdir, "a"), os.path.join(tmpdir, "b")]
+            with self.settings(SCIDATACONTAINER_STORAGE_ROOTS=roots,
+                               SCIDATACONTAINER_STAGING_DIR=tmpdir):
+                run_benchmark(members=1, member_size=10, json_ratio=0.0,
+                              count=2, mode="upload")
+            self.assertEqual(os.listdir(tmpdir), [])
+
+    def test_cleanup(self):
+        owner = User.objects.create_user("benchmark-cleanup")
+        with tempfile.TemporaryDirectory() as tmpdir:
+            with self.settings(MEDIA_ROOT=tmpdir):
+                _parse(owner, [make_container(members=1, member_size=10,
+                                              json_ratio=0.0)])
+                path = DataSet.objects.get(owner=owner).server_path
+                self.assertTrue(os.path.exists(path))
+                _cleanup(owner)
+            self.assertFalse(os.path.exists(path))
+
+    def test_compare(self):
+        baseline = {"small": {"parse": {"containers_per_s": 100,
+                                        "queries_per_upload": 10}}}
+        results = {"small": {"parse": {"containers_per_s": 90,
+                                       "queries_per_upload": 13}}}
+        regressions = compare(results, baseline, tolerance=0.2)
+        self.assertEqual(len(regressions), 1)
+        self.assertTrue(regressions[0].startswith(
+                "small/parse: queries_per_upload"))
+
+    def test_command(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "baseline.json")
+            args = ["--scenario", "small", "--mode", "parse", "--count", "1",
+                    "--members", "2", "--member-size", "100"]
+            call_command("benchmark_ingest", *args, "--output", path,
+                         stdout=io.StringIO())
+            with open(path) as f:
+                results = json.load(f)
+            self.assertIn("parse", results["small"])
+
+            results["small"]["parse"]["queries_per_upload"] = 1
+            with open(path, "w") as f:
+                json.dump(results, f)
+            with self.assertRaises(CommandError):
+                call_command("benchmark_ingest", *args, "--compare",
+                             path, stdout=io.StringIO())
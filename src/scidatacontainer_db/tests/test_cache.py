@@ -0,0 +1,90 @@
+from django.test import TestCase, override_settings
+
+from scidatacontainer_db import cache
+from scidatacontainer_db.models import ContainerType, Keyword, Software
+
+
+LOCMEM = {"default": {"BACKEND":
+                      "django.core.cache.backends.locmem.LocMemCache"},
+          "lookup": {"BACKEND":
+                     "django.core.cache.backends.locmem.LocMemCache",
+                     "LOCATION": "lookup"},
+          }
+
+
+class LookupCacheTest(TestCase):
+
+    def tearDown(self):
+        cache.clear()
+
+    @override_settings(SCIDATACONTAINER_LOOKUP_CACHE_SIZE=2)
+    def test_lru(self):
+        c = cache.LookupCache("test")
+        with self.captureOnCommitCallbacks(execute=True):
+            c.put_many({("a",): 1, ("b",): 2})
+        self.assertEqual(c.get(("a",)), 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            c.put(("c",), 3)
+        self.assertEqual(c.get_many([("a",), ("b",), ("c",)]),
+                         {("a",): 1, ("c",): 3})
+        self.assertEqual(c.stats(), {"hits": 3, "misses": 1, "size": 2,
+                                     "maxsize": 2})
+
+    def test_populated_on_commit(self):
+        c = cache.LookupCache("test")
+        c.put(("a",), 1)
+        self.assertIsNone(c.get(("a",)))
+
+    def test_container_type(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            ct = ContainerType.to_ContainerType({"name": "a", "id": "b",
+                                                 "version": "1"})
+        with self.assertNumQueries(0):
+            self.assertEqual(ContainerType.to_ContainerType(
+                {"name": "a", "id": "b", "version": "1"}), ct)
+        self.assertEqual(cache.container_types.hits, 1)
+
+        ct.name = "c"
+        ct.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            ct2 = ContainerType.to_ContainerType({"name": "a", "id": "b",
+                                                  "version": "1"})
+        self.assertNotEqual(ct2.pk, ct.pk)
+
+        ct2.delete()
+        self.assertEqual(cache.container_types.stats()["size"], 0)
+
+    def test_bulk_get_or_create(self):
+        names = ["kw" + str(i) for i in range(10)]
+        with self.captureOnCommitCallbacks(execute=True):
+            keywords = Keyword.bulk_get_or_create(names[:5])
+        with self.assertNumQueries(3):
+            keywords += Keyword.bulk_get_or_create(names)[5:]
+        self.assertEqual([kw.name for kw in keywords], names)
+        self.assertEqual(cache.keywords.stats()["hits"], 5)
+
+        pts = [{"name": "sw", "version": "1"}]
+        with self.captureOnCommitCallbacks(execute=True):
+            sw = Software.bulk_get_or_create(pts)
+        with self.assertNumQueries(0):
+            self.assertEqual(Software.bulk_get_or_create(pts), sw)
+
+    @override_settings(SCIDATACONTAINER_LOOKUP_CACHE_SIZE=0)
+    def test_disabled(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Keyword.bulk_get_or_create(["a"])
+        with self.assertNumQueries(1):
+            Keyword.bulk_get_or_create(["a"])
+
+    @override_settings(CACHES=LOCMEM,
+                       SCIDATACONTAINER_LOOKUP_CACHE_BACKEND="lookup")
+    def test_shared_backend(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            kw = Keyword.bulk_get_or_create(["a"])[0]
+        self.assertEqual(cache.keywords.stats()["size"], 0)
+        with self.assertNumQueries(0):
+            self.assertEqual(Keyword.bulk_get_or_create(["a"])[0], kw)
+
+        kw.delete()
+        with self.assertNumQueries(3):
+            Keyword.bulk_get_or_create(["a"])
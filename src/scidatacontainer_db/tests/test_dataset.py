@@ -369,3 +369,20 @@ class DataSetTest(TestCase):
                                       str(today) + "' is not a 'date-time'.\"}"
                                       ):
             obj = parse_container_file(file, dc.owner)
+
+    def test_large_size(self):
+        size = 5 * 2**30
+        file = self._create_temp_from_container(get_example_zdc())
+        file.size = size
+        obj = parse_container_file(file, self.user)
+        f = obj.content.first()
+        f.size = size
+        f.save()
+
+        # sizes above 2**31 - 1 don't fit into an integer column
+        self.assertEqual(DataSet.objects.get(pk=obj.pk).size, size)
+        self.assertEqual(obj.content.get(pk=f.pk).size, size)
+        self.assertEqual(DataSet._meta.get_field("size").get_internal_type(),
+                         "BigIntegerField")
+        self.assertEqual(f._meta.get_field("size").get_internal_type(),
+                         "BigIntegerField")
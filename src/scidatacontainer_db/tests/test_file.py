@@ -51,3 +51,35 @@ class FileTest(TestCase):
         self.assertEqual(f_json.content["address"]["state"], "NY")
         self.assertEqual(f_json.content["phoneNumbers"][0]["type"], "home")
         self.assertEqual(len(f_json.content["phoneNumbers"]), 2)
+
+    def test_bulk_get_or_create(self):
+        records = [{"name": "data.json", "size": 12, "content": {"a": 1}},
+                   {"name": "data.json", "size": 12, "content": {"a": 2}},
+                   {"name": "image.png", "size": 300, "content": None}]
+
+        files = File.bulk_get_or_create(records)
+        self.assertEqual(len(files), 3)
+        self.assertEqual(len(File.objects.all()), 3)
+        self.assertEqual(files[1].content, {"a": 2})
+
+        records.append({"name": "image.png", "size": 300, "content": None})
+        with self.assertNumQueries(1):
+            files2 = File.bulk_get_or_create(records)
+        self.assertEqual([f.pk for f in files2[:3]], [f.pk for f in files])
+        self.assertEqual(files2[3].pk, files[2].pk)
+        self.assertEqual(len(File.objects.all()), 3)
+
+    def test_digest(self):
+        f1 = File(name="a.json", size=10, content={"a": 1, "b": [1, 2]})
+        f1.save()
+        f2 = File(name="b.json", size=10, content={"b": [1, 2], "a": 1})
+        f2.save()
+        f3 = File(name="c.png", size=10)
+        f3.save()
+        self.assertEqual(len(f1.digest), 64)
+        self.assertEqual(f1.digest, f2.digest)
+        self.assertEqual(f3.digest, "")
+
+        files = File.bulk_get_or_create([{"name": "a.json", "size": 10,
+                                          "content": {"b": [1, 2], "a": 1}}])
+        self.assertEqual(files[0].pk, f1.pk)
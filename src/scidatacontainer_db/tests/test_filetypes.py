@@ -0,0 +1,62 @@
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import SimpleTestCase
+
+from scidatacontainer_db.filetypes import detect_file_type, HDF5, ZIP
+
+import io
+import sys
+import zipfile
+from unittest import mock
+
+import h5py
+
+from . import get_example_zdc
+
+
+def _upload(data):
+    return SimpleUploadedFile("upload", data)
+
+
+def _hdf5(**kwargs):
+    b = io.BytesIO()
+    with h5py.File(b, "w", **kwargs) as h5file:
+        h5file["content.json"] = "{}"
+    return b.getvalue()
+
+
+class DetectFileTypeTest(SimpleTestCase):
+
+    def test_zip(self):
+        data = get_example_zdc().encode()
+        self.assertEqual(detect_file_type(_upload(data)), ZIP)
+
+        # empty archive and archive with a prefix
+        b = io.BytesIO()
+        zipfile.ZipFile(b, "w").close()
+        self.assertEqual(detect_file_type(_upload(b.getvalue())), ZIP)
+        self.assertEqual(detect_file_type(_upload(b"#!/bin/sh\n" + data)),
+                         ZIP)
+
+    def test_hdf5(self):
+        magic = mock.Mock()
+        with mock.patch.dict(sys.modules, {"magic": magic}):
+            self.assertEqual(detect_file_type(_upload(_hdf5())), HDF5)
+            self.assertEqual(
+                    detect_file_type(_upload(_hdf5(userblock_size=1024))),
+                    HDF5)
+        # python-magic is only used for files without a known signature
+        magic.from_buffer.assert_not_called()
+
+    def test_unknown(self):
+        upload = _upload(b"no container" + b"PK\x05\x06" + 18 * b"\x00" +
+                         b"trailing data")
+        with mock.patch.dict(sys.modules, {"magic": None}):
+            self.assertIsNone(detect_file_type(upload))
+        self.assertEqual(upload.tell(), 0)
+
+    def test_magic_fallback(self):
+        magic = mock.Mock()
+        magic.from_buffer.return_value = "application/x-hdf5"
+        with mock.patch.dict(sys.modules, {"magic": magic}):
+            self.assertEqual(detect_file_type(_upload(b"unknown")), HDF5)
+        magic.from_buffer.assert_called_once_with(b"unknown", mime=True)
@@ -0,0 +1,104 @@
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from scidatacontainer_db.ingest import claim_job, requeue_stale_jobs
+from scidatacontainer_db.models import DataSet, IngestJob
+from scidatacontainer_db.storage import staging_dir
+
+import datetime
+import hashlib
+import io
+import os
+from unittest import mock
+
+from . import APITestCase, TempMediaRootMixin, get_example_zdc,\
+              get_example_faulty_zdc
+
+
+class IngestTest(TempMediaRootMixin, APITestCase):
+    view_name = "scidatacontainer_db:api:dataset-list"
+
+    def _upload(self, container, **kwargs):
+        return self._post(reverse(self.view_name) + "?async=true",
+                          data={"uploadfile": io.BytesIO(container.encode())},
+                          **kwargs)
+
+    def test_async_upload(self):
+        container = get_example_zdc()
+        response = self._upload(container)
+        self.assertEqual(response.status_code, 202)
+        job = IngestJob.objects.get(id=response.data["id"])
+        self.assertEqual(response["Location"], response.data["url"])
+        self.assertEqual(job.state, IngestJob.QUEUED)
+        self.assertTrue(os.path.exists(job.staged_path))
+        self.assertEqual(job.digest,
+                         hashlib.sha256(container.encode()).hexdigest())
+        self.assertEqual(len(DataSet.objects.all()), 0)
+
+        response = self._get(response.data["url"])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["state"], "queued")
+
+        # the staged container is not read again to get its digest
+        with mock.patch("scidatacontainer_db.storage.file_digest") as m:
+            call_command("ingest_worker", "--once")
+        m.assert_not_called()
+
+        job.refresh_from_db()
+        self.assertEqual(job.state, IngestJob.DONE)
+        self.assertEqual(job.dataset.digest, job.digest)
+        self.assertEqual(job.status_code, 201)
+        self.assertIsNotNone(job.started)
+        self.assertIsNotNone(job.finished)
+        self.assertEqual(str(job.dataset.id),
+                         container["content.json"]["uuid"])
+        self.assertTrue(os.path.exists(job.dataset.server_path))
+        self.assertEqual(os.listdir(staging_dir()), [])
+
+    def test_failed_job(self):
+        response = self._upload(get_example_faulty_zdc())
+        self.assertEqual(response.status_code, 202)
+        call_command("ingest_worker", "--once")
+
+        response = self._get(response.data["url"])
+        self.assertEqual(response.data["state"], "failed")
+        self.assertEqual(response.data["status_code"], 400)
+        self.assertEqual(response.data["error"]["error_code"], 400)
+        self.assertIsNone(response.data["dataset"])
+        self.assertEqual(len(DataSet.objects.all()), 0)
+        self.assertEqual(os.listdir(staging_dir()), [])
+
+    @override_settings(SCIDATACONTAINER_ASYNC_INGEST=True)
+    def test_async_setting(self):
+        b = get_example_zdc().encode()
+        response = self._post(reverse(self.view_name),
+                              data={"uploadfile": io.BytesIO(b)})
+        self.assertEqual(response.status_code, 202)
+
+        response = self._post(reverse(self.view_name) + "?async=false",
+                              data={"uploadfile": io.BytesIO(b)})
+        self.assertEqual(response.status_code, 201)
+
+    def test_claim_and_requeue(self):
+        response = self._upload(get_example_zdc())
+        job = claim_job("worker1")
+        self.assertEqual(str(job.id), response.data["id"])
+        self.assertEqual(job.state, IngestJob.RUNNING)
+        self.assertEqual(job.worker, "worker1")
+        self.assertIsNone(claim_job("worker2"))
+
+        self.assertEqual(requeue_stale_jobs(60), 0)
+        IngestJob.objects.filter(id=job.id).update(
+                started=timezone.now() - datetime.timedelta(seconds=120))
+        self.assertEqual(requeue_stale_jobs(60), 1)
+        self.assertEqual(claim_job("worker2").id, job.id)
+
+    def test_jobs_of_other_users(self):
+        response = self._upload(get_example_zdc())
+        other = User.objects.create_user("otheruser")
+        self.client.force_authenticate(other)
+        response = self.client.get(response.data["url"])
+        self.assertEqual(response.status_code, 404)
@@ -18,3 +18,19 @@ class KeywordTest(TestCase):
         self.assertTrue(isinstance(kw2, Keyword))
         self.assertEqual(str(kw2), "Testname")
         self.assertNotEqual(kw2.id, kw.id)
+
+    def test_bulk_get_or_create(self):
+        Keyword(name="existing").save()
+        names = ["kw" + str(i) for i in range(200)] + ["existing", "kw0"]
+
+        # lookup, insert and fetch of the new keywords
+        with self.assertNumQueries(3):
+            keywords = Keyword.bulk_get_or_create(names)
+        self.assertEqual([kw.name for kw in keywords], names)
+        self.assertEqual(len(Keyword.objects.all()), 201)
+        self.assertEqual(keywords[0].pk, keywords[-1].pk)
+
+        with self.assertNumQueries(1):
+            keywords2 = Keyword.bulk_get_or_create(names)
+        self.assertEqual([kw.pk for kw in keywords2],
+                         [kw.pk for kw in keywords])
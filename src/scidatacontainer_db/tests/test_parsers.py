@@ -1,13 +1,31 @@
 from unittest import TestCase
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import override_settings, TransactionTestCase
+
+import os
+import threading
+import uuid
+import zipfile
 
 from scidatacontainer_db.parsers import parsers_from_jsonschema,\
+                                        field_plan,\
+                                        get_model_version_schemas,\
+                                        parse_container_files,\
+                                        ZipContainerParser,\
                                         _containerType_parser,\
                                         _datetime_parser,\
                                         _keyword_parser,\
                                         _replaces_parser,\
-                                        _used_software_parser
+                                        _used_software_parser,\
+                                        _SCHEMA_CACHE
 
 from scidatacontainer_db.utils import MetaDBError
+from scidatacontainer_db.models import DataSet, File, Keyword
+from . import TempMediaRootMixin, TestCase as DBTestCase, get_example_zdc,\
+              get_example_faulty_zdc, testuuid
 
 
 class TestJsonSchemaParserExtraction(TestCase):
@@ -129,3 +147,139 @@ class TestJsonSchemaParserExtraction(TestCase):
         self.assertEqual(cm.exception.args[0],
                          {"error_code": 500, "msg": "The model version has a" +
                           " property 'test' that is not supported."})
+
+    def test_field_plan(self):
+        plan = field_plan({"usedSoftware": _used_software_parser,
+                           "storageTime": _datetime_parser,
+                           "title": str})
+        self.assertEqual(plan, [("usedSoftware", "used_software",
+                                 _used_software_parser),
+                                ("storageTime", "storage_time",
+                                 _datetime_parser),
+                                ("title", "title", str)])
+
+
+class ZipContainerParserTest(DBTestCase):
+
+    def test_single_open(self):
+        container = get_example_zdc()
+        file = self._create_temp_from_container(container)
+
+        with mock.patch("scidatacontainer_db.parsers.zipfile.ZipFile",
+                        wraps=zipfile.ZipFile) as zip_mock:
+            obj = ZipContainerParser().parse(file, self.user)
+
+        self.assertEqual(zip_mock.call_count, 1)
+        self.assertEqual(str(obj.id), container["content.json"]["uuid"])
+        self.assertEqual(sorted([f.name for f in obj.content.all()]),
+                         sorted(container.items()))
+
+    def test_schema_cache(self):
+        schemas = get_model_version_schemas("1.0.0")
+        self.assertIs(get_model_version_schemas("1.0.0"), schemas)
+        self.assertEqual(set(schemas.keys()),
+                         {"schema", "validators", "parsers", "plan"})
+
+        container = get_example_zdc()
+        file = self._create_temp_from_container(container)
+        with mock.patch("scidatacontainer_db.parsers.validator_for") as m,\
+             mock.patch("scidatacontainer_db.parsers." +
+                        "parsers_from_jsonschema") as p,\
+             mock.patch("scidatacontainer_db.parsers.field_plan") as f:
+            ZipContainerParser().parse(file, self.user)
+        m.assert_not_called()
+        p.assert_not_called()
+        f.assert_not_called()
+        self.assertIs(_SCHEMA_CACHE["1.0.0"], schemas)
+
+    def test_validate_before_write(self):
+        container = get_example_faulty_zdc()
+        file = self._create_temp_from_container(container)
+        with mock.patch("scidatacontainer_db.parsers.ZipContainerParser." +
+                        "_read_filelist") as m:
+            with self.assertRaises(MetaDBError) as cm:
+                ZipContainerParser().parse(file, self.user)
+        self.assertEqual(cm.exception.args[0]["error_code"], 400)
+        m.assert_not_called()
+
+        container = get_example_zdc()
+        ZipContainerParser().parse(
+                self._create_temp_from_container(container), self.user)
+        n_files = len(File.objects.all())
+        n_keywords = len(Keyword.objects.all())
+
+        container["content.json"]["storageTime"] = "2000-01-01T00:00:00Z"
+        container["meta.json"]["keywords"] = ["new keyword"]
+        container["content.json"]["uuid"] = testuuid
+        other = User.objects.create_user("otheruser")
+        for user, code in [(other, 403), (self.user, 400)]:
+            file = self._create_temp_from_container(container)
+            with mock.patch("scidatacontainer_db.parsers." +
+                            "ZipContainerParser._read_filelist") as m:
+                with self.assertRaises(MetaDBError) as cm:
+                    ZipContainerParser().parse(file, user)
+            self.assertEqual(cm.exception.args[0]["error_code"], code)
+            m.assert_not_called()
+        self.assertEqual(len(File.objects.all()), n_files)
+        self.assertEqual(len(Keyword.objects.all()), n_keywords)
+
+
+class ParseContainerFilesTest(TestCase):
+
+    @override_settings(SCIDATACONTAINER_BATCH_WORKERS=3)
+    def test_bounded_parallelism(self):
+        threads = set()
+        lock = threading.Lock()
+
+        def parse(filename, owner):
+            with lock:
+                threads.add(threading.get_ident())
+            if filename % 2:
+                raise MetaDBError({"error_code": 400, "msg": str(filename)})
+            return filename
+
+        for vendor in ["postgresql", "sqlite"]:
+            threads.clear()
+            with mock.patch("scidatacontainer_db.parsers.parse_container_" +
+                            "file", side_effect=parse), \
+                    mock.patch("scidatacontainer_db.parsers.connection",
+                               vendor=vendor):
+                results = parse_container_files(list(range(20)), None)
+
+            if vendor == "sqlite":
+                # sequential fallback
+                self.assertEqual(threads, {threading.get_ident()})
+            else:
+                self.assertLessEqual(len(threads), 3)
+                self.assertNotIn(threading.get_ident(), threads)
+            self.assertEqual(results[::2], list(range(0, 20, 2)))
+            self.assertEqual([e.args[0]["msg"] for e in results[1::2]],
+                             [str(i) for i in range(1, 20, 2)])
+
+
+@override_settings(SCIDATACONTAINER_BATCH_WORKERS=4)
+class ParseContainerFilesDBTest(TempMediaRootMixin, TransactionTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user("testuser")
+
+    def test_parse_container_files(self):
+        files = []
+        for i in range(8):
+            container = get_example_zdc()
+            container["content.json"]["uuid"] = str(uuid.uuid4())
+            container["content.json"]["replaces"] = None
+            if i == 3:
+                del container["meta.json"]["author"]
+            b = container.encode()
+            files.append(SimpleUploadedFile(str(i) + ".zdc", b))
+
+        results = parse_container_files(files, self.user)
+
+        self.assertEqual(results[3].args[0]["error_code"], 400)
+        datasets = [r for i, r in enumerate(results) if i != 3]
+        for obj in datasets:
+            self.assertIsInstance(obj, DataSet)
+            self.assertTrue(os.path.exists(obj.server_path))
+        self.assertEqual(len(DataSet.objects.all()), 7)
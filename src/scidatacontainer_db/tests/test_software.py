@@ -58,3 +58,23 @@ class SoftwareTest(TestCase):
                                       "version": "1.0",
                                       "id": "numpy",
                                      })
+
+    def test_bulk_get_or_create(self):
+        s = Software.to_Software({"name": "numpy", "version": "1.0"})
+        entries = [{"name": "numpy", "version": "1.0"},
+                   {"name": "numpy", "version": "1.0", "id": "numpy",
+                    "idType": "github"},
+                   {"name": "scipy", "version": "1.0"}]
+        softwares = Software.bulk_get_or_create(entries)
+        self.assertEqual(softwares[0].pk, s.pk)
+        self.assertEqual(softwares[1].id_type, "github")
+        self.assertEqual(len(Software.objects.all()), 3)
+
+        with self.assertNumQueries(1):
+            softwares2 = Software.bulk_get_or_create(entries)
+        self.assertEqual([x.pk for x in softwares2],
+                         [x.pk for x in softwares])
+
+        with self.assertRaisesMessage(AssertionError, "usedSoftware requires" +
+                                                      " version attribute."):
+            Software.bulk_get_or_create([{"name": "numpy"}])
@@ -0,0 +1,378 @@
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.db import connection
+from django.test import RequestFactory, override_settings
+from django.urls import reverse
+
+from scidatacontainer_db.models import DataSet
+from scidatacontainer_db.parsers import parse_container_file
+from scidatacontainer_db.storage import _signature, pinned_root,\
+                                        placement_policy, promote,\
+                                        relocate, root_of, server_path_for,\
+                                        staging_dir, staging_root
+from scidatacontainer_db.uploadhandlers import StagedFile,\
+                                               StagingUploadHandler
+from scidatacontainer_db.utils import MetaDBError
+
+import hashlib
+import io
+import os
+import uuid
+from unittest import mock
+
+from . import APITestCase, TempMediaRootMixin, TestCase, get_example_zdc,\
+              get_example_update_zdc, testuuid
+
+
+class StorageTest(TempMediaRootMixin, TestCase):
+
+    def test_staging_upload_handler(self):
+        b = get_example_zdc().encode()
+        request = RequestFactory().post("/upload/",
+                                        data={"uploadfile": io.BytesIO(b)})
+        request.upload_handlers = [StagingUploadHandler(request)]
+        upload = request.FILES["uploadfile"]
+
+        self.assertEqual(upload.size, len(b))
+        self.assertEqual(upload.sha256, hashlib.sha256(b).hexdigest())
+        self.assertEqual(os.path.dirname(upload.temporary_file_path()),
+                         staging_dir())
+
+        server_path = os.path.join(self.tmpdir.name, "test.zdc")
+        staged_path = upload.temporary_file_path()
+        digest = promote(upload, server_path)
+        upload.close()
+        self.assertEqual(digest, hashlib.sha256(b).hexdigest())
+        self.assertFalse(os.path.exists(staged_path))
+        with open(server_path, "rb") as f:
+            self.assertEqual(f.read(), b)
+
+    def test_promote_in_memory(self):
+        container = get_example_zdc()
+        upload = self._create_temp_from_container(container)
+        server_path = os.path.join(self.tmpdir.name, "sub", "test.zdc")
+
+        for policy in ["none", "file", "full"]:
+            with override_settings(SCIDATACONTAINER_FSYNC=policy):
+                digest = promote(upload, server_path)
+            with open(server_path, "rb") as f:
+                b = f.read()
+            self.assertEqual(b, container.encode())
+            self.assertEqual(digest, hashlib.sha256(b).hexdigest())
+        self.assertEqual(os.listdir(os.path.dirname(server_path)),
+                         ["test.zdc"])
+
+        with override_settings(SCIDATACONTAINER_FSYNC="always"):
+            with self.assertRaises(ImproperlyConfigured):
+                promote(upload, server_path)
+
+    def test_promote_staged_file(self):
+        b = get_example_zdc().encode()
+        staged_path = os.path.join(staging_dir(), "test.job")
+        with open(staged_path, "wb") as f:
+            f.write(b)
+        upload = StagedFile(staged_path, "test.zdc")
+        server_path = os.path.join(self.tmpdir.name, "test.zdc")
+        self.assertEqual(promote(upload, server_path),
+                         hashlib.sha256(b).hexdigest())
+        upload.close()
+
+    def test_promote_outside_transaction(self):
+        depth = len(connection.savepoint_ids)
+        depths = []
+
+        def _promote(upload, server_path):
+            depths.append(len(connection.savepoint_ids))
+            promote(upload, server_path)
+
+        container = get_example_zdc()
+        upload = self._create_temp_from_container(container)
+        with mock.patch("scidatacontainer_db.parsers.promote", _promote):
+            obj = parse_container_file(upload, self.user)
+        self.assertEqual(depths, [depth])
+        self.assertTrue(os.path.exists(obj.server_path))
+
+    def test_failed_promote(self):
+        container = get_example_zdc()
+        upload = self._create_temp_from_container(container)
+        with mock.patch("scidatacontainer_db.parsers.promote",
+                        side_effect=OSError("disk full")):
+            with self.assertRaises(MetaDBError) as cm:
+                parse_container_file(upload, self.user)
+        self.assertEqual(cm.exception.args[0]["error_code"], 500)
+        self.assertEqual(len(DataSet.objects.all()), 0)
+
+    def test_failed_promote_update(self):
+        container = get_example_zdc()
+        obj = parse_container_file(
+                self._create_temp_from_container(container), self.user)
+        files = set(obj.content.values_list("pk", flat=True))
+
+        container = get_example_update_zdc()
+        container["meta.json"]["title"] = "Updated title"
+        container["meta.json"]["keywords"] = ["updated"]
+        upload = self._create_temp_from_container(container)
+        with mock.patch("scidatacontainer_db.parsers.promote",
+                        side_effect=OSError("disk full")):
+            with self.assertRaises(MetaDBError) as cm:
+                parse_container_file(upload, self.user)
+        self.assertEqual(cm.exception.args[0]["error_code"], 500)
+
+        restored = DataSet.objects.get(pk=obj.pk)
+        for field in ["title", "storage_time", "container_type_id", "size",
+                      "hash", "digest", "server_path"]:
+            self.assertEqual(getattr(restored, field), getattr(obj, field))
+        self.assertEqual(list(restored.keywords.all()),
+                         list(obj.keywords.all()))
+        self.assertEqual(set(restored.content.values_list("pk", flat=True)),
+                         files)
+        self.assertTrue(os.path.exists(restored.server_path))
+
+    def test_digest_cleared_before_promote(self):
+        container = get_example_zdc()
+        obj = parse_container_file(
+                self._create_temp_from_container(container), self.user)
+        self.assertIsNotNone(obj.digest)
+
+        container = get_example_update_zdc()
+        upload = self._create_temp_from_container(container)
+        digests = []
+
+        def recording_promote(upload, server_path):
+            digests.append(DataSet.objects.get(pk=obj.pk).digest)
+            return promote(upload, server_path)
+
+        with mock.patch("scidatacontainer_db.parsers.promote",
+                        recording_promote):
+            updated = parse_container_file(upload, self.user)
+        self.assertEqual(digests, [None])
+        self.assertEqual(DataSet.objects.get(pk=obj.pk).digest,
+                         updated.digest)
+        self.assertNotEqual(updated.digest, obj.digest)
+
+
+class ApiStagingTest(TempMediaRootMixin, APITestCase):
+
+    def test_upload_is_renamed(self):
+        with override_settings(SCIDATACONTAINER_FSYNC="full"):
+            self._create_test_dataset()
+        obj = DataSet.objects.get(id=self.id)
+        self.assertEqual(obj.server_path,
+                         os.path.join(self.tmpdir.name, str(self.id) + ".zdc"))
+        with open(obj.server_path, "rb") as f:
+            self.assertEqual(hashlib.sha256(f.read()).hexdigest(), self.hash)
+        self.assertEqual(os.listdir(staging_dir()), [])
+
+    def test_upload_form(self):
+        self.client.force_login(self.user)
+        b = get_example_zdc().encode()
+        response = self.client.post(
+                reverse("scidatacontainer_db:ui-fileupload"),
+                data={"uploadfile": io.BytesIO(b)})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(os.listdir(staging_dir()), [])
+
+
+class StorageLayoutTest(TempMediaRootMixin, APITestCase):
+
+    def _sharded_path(self, extension=".zdc"):
+        digits = str(self.id).replace("-", "")
+        return os.path.join(self.tmpdir.name, digits[:2], digits[2:4],
+                            str(self.id) + extension)
+
+    def test_server_path_for(self):
+        self.id = testuuid
+        self.assertEqual(server_path_for(testuuid, ".zdc"),
+                         os.path.join(self.tmpdir.name, testuuid + ".zdc"))
+        with override_settings(SCIDATACONTAINER_STORAGE_SHARD_DEPTH=2):
+            self.assertEqual(server_path_for(testuuid, ".zdc"),
+                             self._sharded_path())
+        with override_settings(SCIDATACONTAINER_STORAGE_SHARD_DEPTH=-1):
+            with self.assertRaises(ImproperlyConfigured):
+                server_path_for(testuuid, ".zdc")
+
+    def test_sharded_upload(self):
+        with override_settings(SCIDATACONTAINER_STORAGE_SHARD_DEPTH=2):
+            self._create_test_dataset()
+        obj = DataSet.objects.get(id=self.id)
+        self.assertEqual(obj.server_path, self._sharded_path())
+        self.assertTrue(os.path.exists(obj.server_path))
+
+        # updates are stored in the current layout
+        b = get_example_update_zdc().encode()
+        response = self._post(reverse("scidatacontainer_db:api:dataset-list"),
+                              data={"uploadfile": io.BytesIO(b)})
+        self.assertEqual(response.status_code, 201)
+        obj.refresh_from_db()
+        self.assertEqual(obj.server_path,
+                         os.path.join(self.tmpdir.name, str(self.id) + ".zdc"))
+        with open(obj.server_path, "rb") as f:
+            self.assertEqual(f.read(), b)
+        self.assertFalse(os.path.exists(self._sharded_path()))
+
+    def test_migrate_storage_layout(self):
+        self._create_test_dataset()
+        flat_path = DataSet.objects.get(id=self.id).server_path
+
+        with override_settings(SCIDATACONTAINER_STORAGE_SHARD_DEPTH=2):
+            out = io.StringIO()
+            call_command("migrate_storage_layout", "--dry-run", stdout=out)
+            self.assertEqual(out.getvalue().strip(),
+                             "1 container(s) to move.")
+            self.assertTrue(os.path.exists(flat_path))
+
+            out = io.StringIO()
+            call_command("migrate_storage_layout", "--batch-size", "1",
+                         stdout=out)
+            self.assertEqual(out.getvalue().strip(),
+                             "Moved 1 container(s), 0 failed.")
+
+            out = io.StringIO()
+            call_command("migrate_storage_layout", stdout=out)
+            self.assertEqual(out.getvalue().strip(),
+                             "Moved 0 container(s), 0 failed.")
+
+        obj = DataSet.objects.get(id=self.id)
+        self.assertEqual(obj.server_path, self._sharded_path())
+        self.assertFalse(os.path.exists(flat_path))
+        response = self._get(reverse("scidatacontainer_db:api:" +
+                                     "dataset-download", args=[str(self.id)]))
+        self.assertEqual(hashlib.sha256(b"".join(
+            response.streaming_content)).hexdigest(), self.hash)
+
+    def test_relocate_concurrent_update(self):
+        self._create_test_dataset()
+        obj = DataSet.objects.get(id=self.id)
+        current = obj.server_path
+        target = self._sharded_path()
+
+        # the dataset is stored somewhere else before the move is committed
+        other = os.path.join(self.tmpdir.name, "other.zdc")
+
+        def _update(*args, **kwargs):
+            DataSet.objects.filter(pk=obj.pk).update(server_path=other)
+            return _signature(*args, **kwargs)
+
+        with mock.patch("scidatacontainer_db.storage._signature", _update):
+            moved, failed = relocate([(obj.pk, current, target)])
+        self.assertEqual((moved, failed), (0, []))
+        self.assertTrue(os.path.exists(current))
+        self.assertFalse(os.path.exists(target))
+
+
+class StorageRootsTest(TempMediaRootMixin, APITestCase):
+
+    def media_settings(self):
+        self.roots = [os.path.join(self.tmpdir.name, "a"),
+                      os.path.join(self.tmpdir.name, "b")]
+        return {"MEDIA_ROOT": self.roots[0],
+                "SCIDATACONTAINER_STORAGE_ROOTS": self.roots}
+
+    def _upload(self):
+        container = get_example_zdc()
+        container["content.json"]["uuid"] = str(uuid.uuid4())
+        container["content.json"]["replaces"] = None
+        response = self._post(reverse("scidatacontainer_db:api:dataset-list"),
+                              data={"uploadfile":
+                                    io.BytesIO(container.encode())})
+        self.assertEqual(response.status_code, 201)
+        return DataSet.objects.get(id=container["content.json"]["uuid"])
+
+    def test_root_of(self):
+        self.assertEqual(root_of(os.path.join(self.roots[1], "x.zdc")),
+                         self.roots[1])
+        self.assertIsNone(root_of(self.roots[1] + "x/x.zdc"))
+        self.assertIsNone(root_of(None))
+
+    def test_round_robin(self):
+        roots = {root_of(self._upload().server_path) for _ in range(2)}
+        self.assertEqual(roots, set(self.roots))
+
+    def test_staging_per_root(self):
+        # uploads are renamed within the root they were staged in
+        moves = []
+
+        def recording_promote(upload, server_path):
+            moves.append((root_of(upload.temporary_file_path()),
+                          root_of(server_path)))
+            return promote(upload, server_path)
+
+        with mock.patch("scidatacontainer_db.parsers.promote",
+                        recording_promote):
+            for _ in range(2):
+                self._upload()
+        self.assertEqual({staged for staged, _ in moves}, set(self.roots))
+        for staged, stored in moves:
+            self.assertEqual(staged, stored)
+        for root in self.roots:
+            self.assertEqual(staging_dir(root), os.path.join(root, ".staging"))
+            self.assertEqual(os.listdir(staging_dir(root)), [])
+
+        staging = os.path.join(self.tmpdir.name, "staging")
+        with override_settings(SCIDATACONTAINER_STAGING_DIR=staging):
+            self.assertEqual(staging_dir(self.roots[1]), staging)
+            self.assertIsNone(staging_root())
+            self.assertEqual(len({root_of(self._upload().server_path)
+                                  for _ in range(2)}), 2)
+
+    def test_capacity(self):
+        def _disk_usage(root):
+            free = 10 if root == self.roots[1] else 1
+            return mock.Mock(total=20, used=20 - free, free=free)
+
+        with override_settings(SCIDATACONTAINER_STORAGE_PLACEMENT="capacity"):
+            with mock.patch("scidatacontainer_db.storage.disk_usage",
+                            _disk_usage):
+                for _ in range(2):
+                    self.assertEqual(root_of(self._upload().server_path),
+                                     self.roots[1])
+
+        with override_settings(SCIDATACONTAINER_STORAGE_PLACEMENT="full"):
+            with self.assertRaises(ImproperlyConfigured):
+                placement_policy()
+
+    def test_pinning_and_rebalance(self):
+        obj = self._upload()
+        name = obj.container_type.name
+        current = root_of(obj.server_path)
+        other = [root for root in self.roots if root != current][0]
+
+        with override_settings(SCIDATACONTAINER_STORAGE_PINNING={name:
+                                                                 other}):
+            self.assertEqual(root_of(self._upload().server_path), other)
+
+            out = io.StringIO()
+            call_command("rebalance_storage", "--dry-run", stdout=out)
+            self.assertEqual(out.getvalue().strip(),
+                             "1 container(s) to move.")
+            call_command("rebalance_storage", stdout=io.StringIO())
+
+        old_path = obj.server_path
+        obj.refresh_from_db()
+        self.assertEqual(root_of(obj.server_path), other)
+        self.assertTrue(os.path.exists(obj.server_path))
+        self.assertFalse(os.path.exists(old_path))
+
+        # containers outside the storage roots are placed again
+        with override_settings(SCIDATACONTAINER_STORAGE_ROOTS=[current]):
+            out = io.StringIO()
+            call_command("rebalance_storage", stdout=out)
+            self.assertEqual(out.getvalue().strip(),
+                             "Moved 2 container(s), 0 failed.")
+
+        with override_settings(SCIDATACONTAINER_STORAGE_PINNING={name: "/x"}):
+            with self.assertRaises(ImproperlyConfigured):
+                pinned_root(name)
+
+    def test_offload_prefixes(self):
+        obj = self._upload()
+        prefixes = {self.roots[0]: "/a/", self.roots[1]: "/b/"}
+        with override_settings(
+                SCIDATACONTAINER_DOWNLOAD_OFFLOAD="x-accel-redirect",
+                SCIDATACONTAINER_DOWNLOAD_OFFLOAD_PREFIX=prefixes):
+            response = self._get(reverse("scidatacontainer_db:api:" +
+                                         "dataset-download",
+                                         args=[str(obj.id)]))
+        self.assertEqual(response["X-Accel-Redirect"],
+                         prefixes[root_of(obj.server_path)] + str(obj.id) +
+                         ".zdc")
@@ -3,6 +3,8 @@ from django.urls import reverse
 import hashlib
 import uuid
 
+from scidatacontainer_db.models import DataSet
+
 from . import TestCase
 
 
@@ -45,3 +47,12 @@ class DownloadTest(TestCase):
         self.assertContains(response,
                             "Not Found",
                             status_code=404)
+
+    def test_offload(self):
+        self._create_test_dataset()
+        with self.settings(SCIDATACONTAINER_DOWNLOAD_OFFLOAD="x-sendfile"):
+            response = self._get(reverse("scidatacontainer_db:ui-filedownload",
+                                         args=[str(self.id)]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["X-Sendfile"],
+                         DataSet.objects.get(id=self.id).server_path)
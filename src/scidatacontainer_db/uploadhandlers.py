@@ -0,0 +1,112 @@
+from django.core.files.uploadedfile import TemporaryUploadedFile, UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler,\
+                                           StopFutureHandlers
+
+import hashlib
+import os
+import tarfile
+import tempfile
+
+from .storage import staging_dir, staging_root
+
+
+class StagedUploadedFile(TemporaryUploadedFile):
+    """
+    Uploaded file that is written to the staging directory instead of
+    FILE_UPLOAD_TEMP_DIR. The attribute sha256 holds the hex digest of the
+    file computed while it was uploaded.
+    """
+    def __init__(self, name, content_type, size, charset,
+                 content_type_extra=None):
+        file = tempfile.NamedTemporaryFile(suffix=".upload",
+                                           dir=staging_dir(staging_root()))
+        UploadedFile.__init__(self, file, name, content_type, size, charset,
+                              content_type_extra)
+        self.sha256 = None
+
+
+class StagedFile(UploadedFile):
+    """
+    Upload that was kept in the staging directory beyond its request, e.g.
+    for :class:`scidatacontainer_db.models.IngestJob`. It can be passed to
+    :func:`scidatacontainer_db.parsers.parse_container_file` like a freshly
+    uploaded file.
+
+    :param path: Path of the staged file.
+    :param name: Name of the uploaded file.
+    :param sha256: SHA-256 hex digest of the file if it is already known.
+    """
+    def __init__(self, path: str, name: str, sha256: str = None):
+        super().__init__(open(path, "rb"), name, "application/octet-stream",
+                         os.path.getsize(path))
+        self.path = path
+        self.sha256 = sha256
+
+    def temporary_file_path(self) -> str:
+        return self.path
+
+
+class StagingUploadHandler(FileUploadHandler):
+    """
+    Upload handler that streams uploaded files straight into the staging
+    directory. The SHA-256 digest and the size are computed while streaming,
+    so that the file never has to be read again before it is renamed to its
+    final location.
+
+    The handler has to be inserted before the request body is parsed, i.e.
+    before request.POST or request.FILES is accessed.
+    """
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.file = StagedUploadedFile(self.file_name, self.content_type, 0,
+                                       self.charset, self.content_type_extra)
+        self.hasher = hashlib.sha256()
+        raise StopFutureHandlers()
+
+    def receive_data_chunk(self, raw_data, start):
+        self.file.write(raw_data)
+        self.hasher.update(raw_data)
+
+    def file_complete(self, file_size):
+        self.file.flush()
+        self.file.seek(0)
+        self.file.size = file_size
+        self.file.sha256 = self.hasher.hexdigest()
+        return self.file
+
+    def upload_interrupted(self):
+        if hasattr(self, "file"):
+            self.file.close()
+
+
+def staged_tar_members(upload) -> list:
+    """
+    Unpack the regular files of an uploaded tar archive into the staging
+    directory. The archive is read as a stream, so only one member is
+    processed at a time.
+
+    :param upload: Uploaded tar archive, optionally compressed.
+
+    :raises tarfile.TarError: If the upload is not a valid tar archive.
+
+    :return: List of :class:`StagedUploadedFile` instances.
+    """
+    members = []
+    upload.seek(0)
+    with tarfile.open(fileobj=upload, mode="r|*") as tar:
+        for member in tar:
+            if not member.isfile():
+                continue
+            staged = StagedUploadedFile(member.name,
+                                        "application/octet-stream",
+                                        member.size, None)
+            hasher = hashlib.sha256()
+            source = tar.extractfile(member)
+            for chunk in iter(lambda: source.read(64 * 1024), b""):
+                staged.write(chunk)
+                hasher.update(chunk)
+            staged.flush()
+            staged.seek(0)
+            staged.sha256 = hasher.hexdigest()
+            members.append(staged)
+    return members
@@ -12,6 +12,9 @@ router.register(r"container-types", api_views.ContainerTypeViewSet,
 router.register(r"files", api_views.FileViewSet, basename="file")
 router.register(r"keywords", api_views.KeywordViewSet, basename="keyword")
 router.register(r"softwares", api_views.SoftwareViewSet, basename="software")
+router.register(r"jobs", api_views.IngestJobViewSet, basename="ingestjob")
+router.register(r"uploads", api_views.ChunkedUploadViewSet,
+                basename="chunkedupload")
 
 app_name = "scidatacontainer_db"
 urlpatterns = [
@@ -4,18 +4,22 @@ from django.contrib.auth.mixins import LoginRequiredMixin
 import django.contrib.auth.views as authviews
 from django.contrib.auth.models import User, Group
 from django.db.models import Q
-from django.http import HttpResponse, HttpResponseRedirect, FileResponse,\
+from django.http import HttpResponse, HttpResponseRedirect,\
                         HttpResponseNotAllowed
 from django.shortcuts import get_object_or_404
 from django.urls import reverse
+from django.utils.decorators import method_decorator
 from django.utils.html import format_html
 from django.views import generic
+from django.views.decorators.csrf import csrf_exempt, csrf_protect
 
 from knox.models import AuthToken
 from guardian.shortcuts import get_objects_for_user, remove_perm, assign_perm
 
+from .downloads import container_response
 from .models import DataSet
 from .parsers import parse_container_file
+from .uploadhandlers import StagingUploadHandler
 from .utils import ensure_read_permission, ensure_owner, MetaDBError
 
 
@@ -26,10 +30,22 @@ def _http_response(msg, status_code):
     return r
 
 
+@method_decorator(csrf_exempt, name="dispatch")
 class UploadFileView(LoginRequiredMixin, generic.View):
     """
     Upload a file and parse its content.
+
+    The file is streamed into the staging directory by
+    :class:`scidatacontainer_db.uploadhandlers.StagingUploadHandler`.
     """
+    def dispatch(self, request, *args, **kwargs):
+        """
+        Install the staging upload handler before the CSRF check parses the
+        request body.
+        """
+        request.upload_handlers.insert(0, StagingUploadHandler(request))
+        return csrf_protect(super().dispatch)(request, *args, **kwargs)
+
     def post(self, request):
         if len(request.FILES) > 0:
             try:
@@ -43,7 +59,7 @@ class UploadFileView(LoginRequiredMixin, generic.View):
 
 class DownloadFileView(LoginRequiredMixin, generic.DetailView):
     """
-    Provide a ::model::`scidatacontainer_db.DataSet` as a FileResponse.
+    Provide the container of a ::model::`scidatacontainer_db.DataSet`.
     """
     model = DataSet
 
@@ -51,7 +67,7 @@ class DownloadFileView(LoginRequiredMixin, generic.DetailView):
         dataset = get_object_or_404(DataSet, id=pk)
         ensure_read_permission(request.user, dataset)
 
-        return FileResponse(open(dataset.server_path, 'rb'))
+        return container_response(request, dataset)
 
 
 class IndexView(LoginRequiredMixin, generic.ListView):